@@ -4,10 +4,11 @@ Add Leaf by Oscar cigars to the database
 import asyncio
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
-from datetime import datetime
 from dotenv import load_dotenv
 from pathlib import Path
 
+from catalog_import import import_cigars
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -334,7 +335,7 @@ LEAF_CIGARS = [
 
 
 async def add_cigars():
-    """Add Leaf by Oscar cigars to database"""
+    """Add Leaf by Oscar cigars to database (same as `cigarctl import add_leaf_cigars:LEAF_CIGARS`)"""
     mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
     db_name = os.getenv("DB_NAME", "test_database")
     client = AsyncIOMotorClient(mongo_url)
@@ -344,40 +345,11 @@ async def add_cigars():
     print("ADDING LEAF BY OSCAR CIGARS TO DATABASE")
     print("=" * 60)
     
-    added_count = 0
-    skipped_count = 0
-    
-    for cigar in LEAF_CIGARS:
-        # Check if cigar already exists
-        existing = await db.cigars.find_one({
-            "brand": cigar["brand"],
-            "name": cigar["name"]
-        })
-        
-        if existing:
-            print(f"⏭️  Skipped: {cigar['name']} (already exists)")
-            skipped_count += 1
-            continue
-        
-        # Format size field
-        if "size" in cigar and "length" in cigar and "ring_gauge" in cigar:
-            cigar["size"] = f"{cigar['size']} ({cigar['length']} x {cigar['ring_gauge']})"
-        
-        # Add created_at timestamp
-        cigar["created_at"] = datetime.utcnow()
-        
-        # Add placeholder image (will be updated by image script)
-        if "image" not in cigar:
-            cigar["image"] = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
-        
-        # Insert cigar
-        result = await db.cigars.insert_one(cigar)
-        print(f"✅ Added: {cigar['name']}")
-        added_count += 1
+    stats = await import_cigars(db, LEAF_CIGARS)
     
     print(f"\n{'=' * 60}")
-    print(f"✅ Added {added_count} new Leaf by Oscar cigars")
-    print(f"⏭️  Skipped {skipped_count} existing cigars")
+    print(f"✅ Added {stats.inserted} new cigars, updated {stats.updated}")
+    print(f"⏭️  Skipped {stats.unchanged} existing cigars")
     print(f"{'=' * 60}")
     
     client.close()
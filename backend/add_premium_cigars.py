@@ -5,7 +5,8 @@ import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
-from datetime import datetime
+
+from catalog_import import import_cigars
 
 load_dotenv()
 
@@ -566,8 +567,18 @@ CIGARS_TO_ADD = [
     },
 ]
 
+# Filled in on insert for cigars whose entry leaves them out
+PREMIUM_DEFAULTS = {
+    "price_range": "15-20",
+    "binder": "Mixed",
+    "filler": "Mixed",
+    "flavor_notes": ["Leather", "Wood", "Spice"],
+    "barcode": "",
+}
+
+
 async def add_cigars():
-    """Add cigars to database"""
+    """Add premium cigars to database (cigarctl import add_premium_cigars:CIGARS_TO_ADD, plus PREMIUM_DEFAULTS)"""
     mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
     db_name = os.getenv("DB_NAME", "test_database")
     client = AsyncIOMotorClient(mongo_url)
@@ -577,61 +588,15 @@ async def add_cigars():
     print("ADDING PREMIUM CIGARS TO DATABASE")
     print("=" * 60)
     
-    added_count = 0
-    skipped_count = 0
-    
-    for cigar in CIGARS_TO_ADD:
-        # Check if cigar already exists
-        existing = await db.cigars.find_one({
-            "brand": cigar["brand"],
-            "name": cigar["name"]
-        })
-        
-        if existing:
-            print(f"⏭️  Skipped: {cigar['brand']} {cigar['name']} (already exists)")
-            skipped_count += 1
-            continue
-        
-        # Rename rating to average_rating and add missing fields
-        cigar_doc = cigar.copy()
-        if "rating" in cigar_doc:
-            cigar_doc["average_rating"] = cigar_doc.pop("rating")
-        
-        # Add missing required fields
-        if "flavor_notes" not in cigar_doc:
-            cigar_doc["flavor_notes"] = ["Leather", "Wood", "Spice"]
-        if "images" not in cigar_doc:
-            cigar_doc["images"] = []
-        if "image" not in cigar_doc:
-            # Use a placeholder image (1x1 transparent pixel)
-            cigar_doc["image"] = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
-        if "price_range" not in cigar_doc:
-            cigar_doc["price_range"] = "15-20"
-        if "barcode" not in cigar_doc:
-            cigar_doc["barcode"] = ""
-        if "binder" not in cigar_doc:
-            cigar_doc["binder"] = "Mixed"
-        if "filler" not in cigar_doc:
-            cigar_doc["filler"] = "Mixed"
-        
-        # Format size field to match expected format
-        if "size" in cigar_doc and "length" in cigar_doc and "ring_gauge" in cigar_doc:
-            cigar_doc["size"] = f"{cigar_doc['size']} ({cigar_doc['length']} x {cigar_doc['ring_gauge']})"
-        
-        # Add created_at timestamp
-        cigar_doc["created_at"] = datetime.utcnow()
-        
-        # Insert cigar
-        result = await db.cigars.insert_one(cigar_doc)
-        print(f"✅ Added: {cigar['brand']} {cigar['name']}")
-        added_count += 1
+    stats = await import_cigars(db, CIGARS_TO_ADD, defaults=PREMIUM_DEFAULTS)
     
     print(f"\n{'=' * 60}")
-    print(f"✅ Added {added_count} new cigars")
-    print(f"⏭️  Skipped {skipped_count} existing cigars")
+    print(f"✅ Added {stats.inserted} new cigars, updated {stats.updated}")
+    print(f"⏭️  Skipped {stats.unchanged} existing cigars")
     print(f"{'=' * 60}")
     
     client.close()
 
+
 if __name__ == "__main__":
     asyncio.run(add_cigars())
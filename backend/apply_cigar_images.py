@@ -1,55 +1,55 @@
 """
 Apply real cigar images to database
+
+Each cigar gets one of the downloaded images, chosen from its id so that
+resumed and repeated runs pick the same image and only write what changed.
+Cigars reference the image store through `image_id` rather than holding
+their own base64 copy.
+
+Usage:
+    python apply_cigar_images.py [--batch-size 1000] [--dry-run] [--resume]
 """
+import argparse
 import asyncio
+import zlib
 from motor.motor_asyncio import AsyncIOMotorClient
-from update_cigar_images import get_cigar_images
+from update_cigar_images import store_cigar_images
 import os
 from dotenv import load_dotenv
 
+from maintenance import add_arguments, print_progress, print_report, run_maintenance
+
 load_dotenv()
 
-async def update_all_cigar_images():
+async def update_all_cigar_images(batch_size: int, dry_run: bool, resume: bool):
     """Update all cigars in database with real images"""
+    # Connect to MongoDB
+    mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.getenv("DB_NAME", "cigar_db")]
+    
     # Get images
     print("Downloading cigar images...")
-    images = get_cigar_images()
+    image_ids = await store_cigar_images(db)
     
-    if not images:
+    if not image_ids:
         print("❌ No images downloaded!")
+        client.close()
         return
     
-    print(f"✅ Downloaded {len(images)} images")
-    
-    # Connect to MongoDB
-    mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
-    client = AsyncIOMotorClient(mongo_url)
-    db = client.cigar_db
-    
-    # Get all cigars
-    cigars = await db.cigars.find({}).to_list(length=None)
-    print(f"Found {len(cigars)} cigars to update")
-    
-    # Update each cigar with a cycling image
-    updated_count = 0
-    for idx, cigar in enumerate(cigars):
-        # Cycle through images
-        image_idx = idx % len(images)
-        image = images[image_idx]
-        
-        # Update cigar
-        result = await db.cigars.update_one(
-            {"_id": cigar["_id"]},
-            {"$set": {"image": image}}
-        )
-        
-        if result.modified_count > 0:
-            updated_count += 1
-            if updated_count % 100 == 0:
-                print(f"Updated {updated_count} cigars...")
+    def cycled_image(cigar):
+        return {"image": "", "image_id": image_ids[zlib.crc32(str(cigar["_id"]).encode()) % len(image_ids)]}
     
-    print(f"✅ Successfully updated {updated_count} cigars with real images!")
+    stats = await run_maintenance(
+        db, "apply_cigar_images", cycled_image,
+        projection={"brand": 1, "name": 1, "image": 1, "image_id": 1},
+        batch_size=batch_size, dry_run=dry_run, resume=resume, progress=print_progress
+    )
+    print_report(stats, dry_run)
     client.close()
 
 if __name__ == "__main__":
-    asyncio.run(update_all_cigar_images())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    args = parser.parse_args()
+    asyncio.run(update_all_cigar_images(args.batch_size, args.dry_run, args.resume))
@@ -1,7 +1,13 @@
 import bcrypt
 import jwt
+import hashlib
+import time
+import uuid
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from fastapi import HTTPException, Security
+from typing import Optional
+from cachetools import LRUCache
+from fastapi import Depends, HTTPException, Security
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 import os
 from dotenv import load_dotenv
@@ -12,9 +18,58 @@ JWT_SECRET = os.environ['JWT_SECRET']
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 72
 
+# Verified token payloads kept in memory, keyed by token digest
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
 security = HTTPBearer()
 
 
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated caller, built from token claims without a database read"""
+    user_id: str
+    username: Optional[str] = None
+    role: str = "user"
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == "admin"
+
+
+class TokenDenyList:
+    """In-memory set of revoked token ids, synced from the revoked_tokens collection"""
+
+    def __init__(self):
+        self._revoked = {}
+
+    def revoke(self, jti: str, expires_at: float):
+        self._revoked[jti] = expires_at
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        return jti is not None and jti in self._revoked
+
+    def prune(self):
+        """Forget revocations for tokens that have expired anyway"""
+        now = time.time()
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+
+    async def sync(self, db):
+        """Load revocations recorded by any worker"""
+        now = datetime.utcnow()
+        async for doc in db.revoked_tokens.find({"expires_at": {"$gt": now}}, {"jti": 1, "expires_at": 1}):
+            self._revoked[doc["jti"]] = doc["expires_at"].timestamp()
+        self.prune()
+
+
+token_cache = LRUCache(maxsize=TOKEN_CACHE_SIZE)
+deny_list = TokenDenyList()
+
+
+def normalize_identifier(value: str) -> str:
+    """Canonical form of an email or username used for uniqueness and lookups"""
+    return value.strip().lower()
+
+
 def hash_password(password: str) -> str:
     """Hash a password for storing."""
     salt = bcrypt.gensalt()
@@ -27,10 +82,13 @@ def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
 
-def create_access_token(user_id: str) -> str:
+def create_access_token(user_id: str, username: Optional[str] = None, role: str = "user") -> str:
     """Create a JWT token"""
     payload = {
         "user_id": user_id,
+        "username": username,
+        "role": role,
+        "jti": uuid.uuid4().hex,
         "exp": datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS),
         "iat": datetime.utcnow()
     }
@@ -38,22 +96,63 @@ def create_access_token(user_id: str) -> str:
     return token
 
 
+def _token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
 def decode_access_token(token: str) -> dict:
-    """Decode a JWT token"""
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    """Decode a JWT token, reusing the cached verification when possible"""
+    digest = _token_digest(token)
+    payload = token_cache.get(digest)
 
+    if payload is not None:
+        if payload["exp"] <= time.time():
+            token_cache.pop(digest, None)
+            raise HTTPException(status_code=401, detail="Token has expired")
+    else:
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token has expired")
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        token_cache[digest] = payload
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)) -> str:
-    """Get current user from JWT token"""
-    token = credentials.credentials
+    if deny_list.is_revoked(payload.get("jti")):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    return payload
+
+
+def revoke_token(token: str) -> dict:
+    """Revoke a token in this worker and return its payload for persisting"""
     payload = decode_access_token(token)
+    if payload.get("jti"):
+        deny_list.revoke(payload["jti"], payload["exp"])
+    token_cache.pop(_token_digest(token), None)
+    return payload
+
+
+async def get_current_principal(credentials: HTTPAuthorizationCredentials = Security(security)) -> Principal:
+    """Get the authenticated caller from JWT claims"""
+    payload = decode_access_token(credentials.credentials)
     user_id = payload.get("user_id")
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-    return user_id
+    return Principal(
+        user_id=user_id,
+        username=payload.get("username"),
+        role=payload.get("role") or "user"
+    )
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)) -> str:
+    """Get current user from JWT token"""
+    principal = await get_current_principal(credentials)
+    return principal.user_id
+
+
+async def get_current_admin(principal: Principal = Depends(get_current_principal)) -> Principal:
+    """Require an authenticated caller with the admin role"""
+    if not principal.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return principal
@@ -0,0 +1,116 @@
+"""
+Benchmark response encoding for one 50-result search page.
+
+Requests go through real FastAPI routes (with TestClient), since FastAPI's
+own serialization step dominates the cost. Three routes serve the same
+page:
+
+- legacy: mutating serialize_doc, no response model, FastAPI's default
+  JSONResponse (jsonable_encoder + json.dumps)
+- cards: non-mutating serialize_doc + CigarCard response model + orjson,
+  as /api/cigars/search does
+- dicts: plain dicts returned through orjson_response, as get_cigar does
+
+Usage:
+    python bench_encoding.py [--pages 200] [--image-kb 40]
+"""
+import argparse
+import base64
+import os
+import random
+import time
+from datetime import datetime
+from typing import List
+
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from encoding import ORJSONResponse, orjson_response
+from models import CigarCard
+
+ROUTES = ("legacy", "cards", "dicts")
+
+
+def make_search_page(image_kb: int) -> List[dict]:
+    """Fifty Motor-shaped documents like the search projection returns"""
+    image = base64.b64encode(os.urandom(image_kb * 768)).decode("ascii")
+    return [
+        {
+            "_id": ObjectId(),
+            "name": f"Robusto {i}",
+            "brand": random.choice(["Padron", "Arturo Fuente", "Oliva", "My Father"]),
+            "image": image,
+            "strength": "medium-full",
+            "origin": "Nicaragua",
+            "average_rating": round(random.uniform(3, 5), 1),
+            "rating_count": random.randint(0, 500),
+            "price_range": "12-18",
+            "created_at": datetime.utcnow(),
+        }
+        for i in range(50)
+    ]
+
+
+def _serialize_doc(doc: dict) -> dict:
+    result = {k: v for k, v in doc.items() if k != '_id'}
+    result['id'] = str(doc['_id'])
+    return result
+
+
+def make_app(docs: List[dict]) -> FastAPI:
+    """An app serving `docs` as a search page on each of ROUTES"""
+    app = FastAPI(default_response_class=ORJSONResponse)
+
+    @app.get("/legacy", response_class=JSONResponse)
+    async def legacy():
+        def serialize_doc(doc):
+            doc['id'] = str(doc['_id'])
+            del doc['_id']
+            return doc
+        return [serialize_doc(dict(d)) for d in docs]
+
+    @app.get("/cards", response_model=List[CigarCard])
+    async def cards():
+        return [_serialize_doc(d) for d in docs]
+
+    @app.get("/dicts")
+    async def dicts():
+        return orjson_response([_serialize_doc(d) for d in docs])
+
+    return app
+
+
+def route_client(docs: List[dict]) -> TestClient:
+    return TestClient(make_app(docs))
+
+
+def fetch(client: TestClient, route: str) -> bytes:
+    """Response body of one request to `route`"""
+    response = client.get(f"/{route}")
+    response.raise_for_status()
+    return response.content
+
+
+def bench(client: TestClient, route: str, pages: int) -> float:
+    fetch(client, route)  # warm up
+    started = time.perf_counter()
+    for _ in range(pages):
+        fetch(client, route)
+    per_page_ms = (time.perf_counter() - started) / pages * 1000
+    print(f"{route:10s} {per_page_ms:8.3f} ms/page  ({len(fetch(client, route)) / 1024:.0f} KB)")
+    return per_page_ms
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--image-kb", type=int, default=40, help="Size of each base64 image")
+    args = parser.parse_args()
+
+    client = route_client(make_search_page(args.image_kb))
+    print(f"Serving a 50-result search page, {args.pages} requests per route")
+    timings = {route: bench(client, route, args.pages) for route in ROUTES}
+    for route in ROUTES[1:]:
+        print(f"{route} speedup {timings['legacy'] / timings[route]:6.1f}x")
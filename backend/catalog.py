@@ -0,0 +1,122 @@
+"""
+Version tracking for the cigar catalog.
+
+Every cigar carries `version` and `updated_at`, bumped on each write through
+`touched()`. Each write is also recorded with `record_change()`, which bumps a
+single catalog counter in the `counters` collection and appends the cigar id
+under that sequence number to the `cigar_changes` log, and published on the
+invalidation bus so every API worker drops its cached copies. Validators for list
+endpoints (search, count) are computed from the counter with one document
+lookup, and the log drives delta sync for offline clients.
+"""
+import base64
+import binascii
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+from invalidation import publish
+
+CATALOG_COUNTER_ID = "catalog"
+
+# How long change log entries are kept; clients with older tokens resync from scratch
+CHANGE_LOG_TTL_DAYS = int(os.getenv("CHANGE_LOG_TTL_DAYS", "30"))
+
+# Changes younger than this are held back from sync so a writer that reserved a
+# lower sequence number but has not logged it yet is not skipped
+SYNC_SETTLE_SECONDS = float(os.getenv("SYNC_SETTLE_SECONDS", "2"))
+
+
+def touched(update: dict) -> dict:
+    """Add the updated_at/version bump to a cigar update document"""
+    update = dict(update)
+    update["$set"] = {**update.get("$set", {}), "updated_at": datetime.utcnow()}
+    update["$inc"] = {**update.get("$inc", {}), "version": 1}
+    return update
+
+
+def catalog_key(brand: str, name: str) -> str:
+    """Normalized brand+name identifying a cigar across imports"""
+    return f"{' '.join(brand.split()).casefold()}|{' '.join(name.split()).casefold()}"
+
+
+def versioned(cigar_doc: dict) -> dict:
+    """Version fields for a newly inserted cigar"""
+    if cigar_doc.get("brand") and cigar_doc.get("name"):
+        cigar_doc["catalog_key"] = catalog_key(cigar_doc["brand"], cigar_doc["name"])
+    cigar_doc["version"] = 1
+    cigar_doc["updated_at"] = cigar_doc.get("created_at") or datetime.utcnow()
+    return cigar_doc
+
+
+async def record_changes(db, cigar_ids: Iterable[ObjectId], op: str = "update") -> int:
+    """Bump the catalog version once per cigar, log each change and return the new version"""
+    cigar_ids = list(cigar_ids)
+    if not cigar_ids:
+        return (await catalog_version(db))[0]
+    now = datetime.utcnow()
+    counter = await db.counters.find_one_and_update(
+        {"_id": CATALOG_COUNTER_ID},
+        {"$inc": {"seq": len(cigar_ids)}, "$set": {"updated_at": now}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    first_seq = counter["seq"] - len(cigar_ids) + 1
+    await db.cigar_changes.insert_many([
+        {"seq": first_seq + i, "cigar_id": ObjectId(cigar_id), "op": op, "at": now}
+        for i, cigar_id in enumerate(cigar_ids)
+    ])
+    await publish(db, "catalog", cigar_ids)
+    return counter["seq"]
+
+
+async def record_change(db, cigar_id, op: str = "update") -> int:
+    """Record a write to a single cigar"""
+    return await record_changes(db, [cigar_id], op)
+
+
+async def catalog_version(db, session=None) -> Tuple[int, Optional[datetime]]:
+    """Current catalog version and when it last changed"""
+    counter = await db.counters.find_one({"_id": CATALOG_COUNTER_ID}, session=session)
+    if not counter:
+        return 0, None
+    return counter["seq"], counter.get("updated_at")
+
+
+def encode_sync_token(seq: int, after: Optional[ObjectId] = None) -> str:
+    """Opaque sync token: a catalog version, plus the last cigar sent during an initial snapshot"""
+    payload = {"seq": seq}
+    if after is not None:
+        payload["after"] = str(after)
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_sync_token(token: str) -> Tuple[int, Optional[ObjectId]]:
+    """Inverse of encode_sync_token"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        after = payload.get("after")
+        return int(payload["seq"]), ObjectId(after) if after else None
+    except (binascii.Error, InvalidId, ValueError, TypeError, KeyError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+
+
+async def changes_since(db, seq: int, limit: int) -> list:
+    """Settled change log entries after `seq`, oldest first; raises 410 if the log no longer reaches back that far"""
+    oldest = await db.cigar_changes.find_one({}, {"seq": 1}, sort=[("seq", 1)])
+    current, _ = await catalog_version(db)
+    if seq < current and (oldest is None or oldest["seq"] > seq + 1):
+        raise HTTPException(status_code=410, detail="Sync token expired, start a full sync")
+
+    settled = datetime.utcnow() - timedelta(seconds=SYNC_SETTLE_SECONDS)
+    return await db.cigar_changes.find(
+        {"seq": {"$gt": seq}, "at": {"$lte": settled}},
+        {"_id": 0, "seq": 1, "cigar_id": 1, "op": 1}
+    ).sort("seq", 1).limit(limit).to_list(limit)
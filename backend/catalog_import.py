@@ -0,0 +1,299 @@
+"""
+Streaming, idempotent catalog import.
+
+Records are read lazily from JSON, NDJSON, CSV or a Python list, validated
+with CigarImport, and keyed by normalized brand+name (`catalog_key`). Each
+batch is compared with what is stored under those keys in one query, and
+only new or changed cigars are written, with one unordered bulk_write per
+batch. Re-running an import therefore writes nothing.
+
+Fields users can change through the API (ratings, images, flavor notes) are
+only set when a cigar is first inserted, as are per-source `defaults`.
+
+Cigars stored before imports were keyed get their catalog_key at the start of
+every import, so they are matched instead of inserted again. catalog_key is
+unique; where an old catalog holds the same brand+name twice, only the first
+copy is keyed.
+"""
+import asyncio
+import csv
+import importlib
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from catalog import catalog_key, record_changes, touched, versioned
+from models import CigarImport
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CONCURRENCY = 4
+
+# Refreshed from the source on every import
+CATALOG_FIELDS = (
+    "name", "brand", "strength", "origin", "wrapper", "binder", "filler", "size",
+    "length", "ring_gauge", "price_range", "barcode", "description",
+)
+
+# Written on insert only, so re-imports never overwrite live data
+INSERT_ONLY_DEFAULTS = {
+    "flavor_notes": [],
+    "image": "",
+    "images": [],
+    "average_rating": 0.0,
+    "rating_count": 0,
+}
+
+
+# ==================== Sources ====================
+
+def _csv_row(row: dict) -> dict:
+    record = {key: value for key, value in row.items() if key and value not in (None, "")}
+    if isinstance(record.get("flavor_notes"), str):
+        record["flavor_notes"] = [note.strip() for note in record["flavor_notes"].split(";") if note.strip()]
+    return record
+
+
+def read_records(source: str, fmt: str = "auto") -> Iterator[dict]:
+    """Yield raw records from a file, or from `module:ATTRIBUTE` naming a list in a Python module"""
+    if fmt == "auto":
+        suffix = Path(source).suffix.lower()
+        if ":" in source and not Path(source).exists():
+            fmt = "python"
+        else:
+            fmt = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}.get(suffix, "json")
+
+    if fmt == "python":
+        module_name, attribute = source.split(":", 1)
+        yield from getattr(importlib.import_module(module_name), attribute)
+    elif fmt == "ndjson":
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif fmt == "csv":
+        with open(source, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                yield _csv_row(row)
+    elif fmt == "json":
+        # A JSON array has to be parsed whole; use NDJSON for very large sources
+        with open(source, encoding="utf-8") as f:
+            data = json.load(f)
+        yield from data if isinstance(data, list) else data.get("cigars", [])
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+
+# ==================== Pipeline ====================
+
+@dataclass
+class ImportStats:
+    read: int = 0
+    invalid: int = 0
+    duplicates: int = 0
+    keyed: int = 0
+    # Cigars without a catalog_key seen by a dry run, which does not key them
+    unkeyed: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    errors: List[str] = field(default_factory=list)
+    diffs: List[str] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def throughput(self) -> float:
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+
+def to_catalog_fields(record: CigarImport) -> dict:
+    """The refreshable part of a validated record"""
+    fields = {name: getattr(record, name) for name in CATALOG_FIELDS if getattr(record, name) is not None}
+    if record.length and record.ring_gauge and record.size and "(" not in record.size:
+        # Same "Toro (6.0 x 52)" format the add_*_cigars scripts produced
+        fields["size"] = f"{record.size} ({record.length} x {record.ring_gauge})"
+    return fields
+
+
+def validated(records: Iterable[dict], stats: ImportStats) -> Iterator[Tuple[str, CigarImport]]:
+    """Validate records, dropping invalid ones and repeated keys (the first occurrence wins)"""
+    seen = set()
+    for position, raw in enumerate(records, start=1):
+        stats.read += 1
+        try:
+            record = CigarImport.model_validate(raw)
+        except ValidationError as e:
+            stats.invalid += 1
+            if len(stats.errors) < 20:
+                stats.errors.append(f"record {position}: {e.errors()[0]['loc']} {e.errors()[0]['msg']}")
+            continue
+        key = catalog_key(record.brand, record.name)
+        if key in seen:
+            stats.duplicates += 1
+            continue
+        seen.add(key)
+        yield key, record
+
+
+async def _import_batch(
+    db, batch: List[Tuple[str, CigarImport]], stats: ImportStats, dry_run: bool, defaults: dict
+):
+    keys = [key for key, _ in batch]
+    projection = {name: 1 for name in CATALOG_FIELDS}
+    projection["catalog_key"] = 1
+    existing = {doc["catalog_key"]: doc async for doc in db.cigars.find({"catalog_key": {"$in": keys}}, projection)}
+
+    ops = []
+    updated_ids = []
+    for key, record in batch:
+        fields = to_catalog_fields(record)
+        current = existing.get(key)
+        if current is None:
+            doc = {**INSERT_ONLY_DEFAULTS, **defaults, **fields}
+            for name in INSERT_ONLY_DEFAULTS:
+                if name in record.model_fields_set and getattr(record, name) is not None:
+                    doc[name] = getattr(record, name)
+            doc["created_at"] = datetime.utcnow()
+            doc = versioned(doc)
+            # Comes from the filter on insert
+            doc.pop("catalog_key")
+            ops.append(UpdateOne({"catalog_key": key}, {"$setOnInsert": doc}, upsert=True))
+            continue
+
+        changes = {name: value for name, value in fields.items() if current.get(name) != value}
+        if not changes:
+            stats.unchanged += 1
+            continue
+        if dry_run and len(stats.diffs) < 50:
+            stats.diffs.append(f"{record.brand} {record.name}: " + ", ".join(
+                f"{name} {current.get(name)!r} -> {value!r}" for name, value in changes.items()
+            ))
+        ops.append(UpdateOne({"_id": current["_id"]}, touched({"$set": changes})))
+        updated_ids.append(current["_id"])
+
+    inserts = len(ops) - len(updated_ids)
+    if dry_run or not ops:
+        stats.inserted += inserts
+        stats.updated += len(updated_ids)
+        return
+
+    try:
+        result = await db.cigars.bulk_write(ops, ordered=False)
+        upserted_ids = list(result.upserted_ids.values())
+    except BulkWriteError as e:
+        # A concurrent import inserted the same cigar first; the unique key turned ours into a no-op
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        upserted_ids = [upsert["_id"] for upsert in e.details["upserted"]]
+        stats.unchanged += len(e.details["writeErrors"])
+    stats.inserted += len(upserted_ids)
+    stats.updated += len(updated_ids)
+    await record_changes(db, upserted_ids, "create")
+    await record_changes(db, updated_ids, "update")
+
+
+async def backfill_catalog_keys(db, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Set catalog_key on cigars stored before imports were keyed, skipping repeated brand+names"""
+    filled = 0
+    pending = {}
+
+    async def flush():
+        nonlocal filled
+        taken = {doc["catalog_key"] async for doc in db.cigars.find(
+            {"catalog_key": {"$in": list(pending)}}, {"catalog_key": 1}
+        )}
+        ops = [
+            UpdateOne({"_id": cigar_id, "catalog_key": {"$exists": False}}, {"$set": {"catalog_key": key}})
+            for key, cigar_id in pending.items() if key not in taken
+        ]
+        if ops:
+            filled += (await db.cigars.bulk_write(ops, ordered=False)).modified_count
+        pending.clear()
+
+    # Earlier versions keyed every copy of a duplicate; keep the key on the oldest only
+    duplicates = db.cigars.aggregate([
+        {"$match": {"catalog_key": {"$type": "string"}}},
+        {"$group": {"_id": "$catalog_key", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ])
+    async for group in duplicates:
+        await db.cigars.update_many({"_id": {"$in": sorted(group["ids"])[1:]}}, {"$unset": {"catalog_key": ""}})
+
+    cursor = db.cigars.find(
+        {"catalog_key": {"$exists": False}}, {"brand": 1, "name": 1}
+    ).sort("_id", 1).batch_size(batch_size)
+    async for cigar in cursor:
+        if not cigar.get("brand") or not cigar.get("name"):
+            continue
+        # The oldest copy of a duplicated cigar keeps the key
+        pending.setdefault(catalog_key(cigar["brand"], cigar["name"]), cigar["_id"])
+        if len(pending) >= batch_size:
+            await flush()
+    if pending:
+        await flush()
+    return filled
+
+
+async def import_cigars(
+    db,
+    records: Iterable[dict],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    dry_run: bool = False,
+    progress: Optional[Callable[[ImportStats], None]] = None,
+    defaults: Optional[dict] = None
+) -> ImportStats:
+    """Upsert records into the catalog with up to `concurrency` batches in flight.
+
+    `defaults` fill fields a record leaves out, on insert only.
+    """
+    stats = ImportStats()
+    in_flight = set()
+    if dry_run:
+        # Nothing is written; cigars that a real run would key first are only counted
+        stats.unkeyed = await db.cigars.count_documents({"catalog_key": {"$exists": False}})
+    else:
+        stats.keyed = await backfill_catalog_keys(db, batch_size)
+
+    def finished(done):
+        for task in done:
+            task.result()
+            if progress:
+                progress(stats)
+
+    def batches():
+        batch = []
+        for item in validated(records, stats):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    try:
+        for batch in batches():
+            if len(in_flight) >= concurrency:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                finished(done)
+            in_flight.add(asyncio.create_task(_import_batch(db, batch, stats, dry_run, defaults or {})))
+        if in_flight:
+            done, in_flight = await asyncio.wait(in_flight)
+            finished(done)
+    finally:
+        for task in in_flight:
+            task.cancel()
+    return stats
@@ -0,0 +1,98 @@
+"""
+Catalog management commands.
+
+    import   Stream cigars from a JSON, NDJSON or CSV file (or a `module:LIST`
+             of dicts, e.g. add_leaf_cigars:LEAF_CIGARS) into the catalog.
+             Cigars are keyed by normalized brand+name, so re-running an import
+             only writes what changed.
+    seed     Import the built-in seed catalog the same way.
+
+Usage:
+    python cigarctl.py import cigars.ndjson [--batch-size 1000] [--concurrency 4] [--dry-run]
+    python cigarctl.py import cigars.csv --format csv
+    python cigarctl.py seed
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from catalog_import import (
+    DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY, ImportStats,
+    import_cigars, read_records
+)
+from indexes import ensure_indexes
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+def print_progress(stats: ImportStats):
+    print(
+        f"  {stats.read:>8} read  {stats.inserted:>8} inserted  {stats.updated:>6} updated  "
+        f"{stats.unchanged:>8} unchanged  {stats.throughput:>8.0f}/s",
+        end="\r", flush=True
+    )
+
+
+def print_report(stats: ImportStats, dry_run: bool):
+    print()
+    print("=" * 60)
+    verb = "Would insert" if dry_run else "Inserted"
+    print(f"✅ {verb} {stats.inserted}, {'would update' if dry_run else 'updated'} {stats.updated}, unchanged {stats.unchanged}")
+    if stats.duplicates:
+        print(f"⏭️  Skipped {stats.duplicates} repeated brand+name records in the source")
+    if stats.invalid:
+        print(f"⚠️  {stats.invalid} invalid records:")
+        for error in stats.errors:
+            print(f"   {error}")
+    for diff in stats.diffs:
+        print(f"   ~ {diff}")
+    print(f"⏱️  {stats.read} records in {stats.elapsed:.2f}s ({stats.throughput:.0f} records/s)")
+    print("=" * 60)
+
+
+async def run_import(records, batch_size: int, concurrency: int, dry_run: bool):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    if not dry_run:
+        await ensure_indexes(db, backfill=False)
+    stats = await import_cigars(db, records, batch_size, concurrency, dry_run, progress=print_progress)
+    if stats.keyed:
+        print(f"🔑 Added catalog keys to {stats.keyed} existing cigars")
+    if stats.unkeyed:
+        print(f"🔑 {stats.unkeyed} existing cigars have no catalog key yet; a real run keys them first,")
+        print("   so some of the inserts below may turn out to be matches")
+    print_report(stats, dry_run)
+    client.close()
+
+
+def seed_records():
+    from cigar_seed_data import get_cigar_seed_data
+    from generate_cigars import get_generated_cigars
+    yield from get_cigar_seed_data()
+    yield from get_generated_cigars()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Import cigars from a file")
+    import_parser.add_argument("source")
+    import_parser.add_argument("--format", choices=["auto", "json", "ndjson", "csv", "python"], default="auto")
+
+    seed_parser = commands.add_parser("seed", help="Import the built-in seed catalog")
+
+    for command in (import_parser, seed_parser):
+        command.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        command.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Batches written in parallel")
+        command.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+
+    args = parser.parse_args()
+    records = read_records(args.source, args.format) if args.command == "import" else seed_records()
+    asyncio.run(run_import(records, args.batch_size, args.concurrency, args.dry_run))
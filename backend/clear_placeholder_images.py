@@ -1,27 +1,46 @@
+"""
+Clear all cigar images so the app shows its placeholder
+
+Usage:
+    python clear_placeholder_images.py [--batch-size 1000] [--dry-run] [--resume]
+"""
+import argparse
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import os
 
+from maintenance import add_arguments, print_progress, print_report, run_maintenance
+
 load_dotenv()
 
 MONGO_URL = os.getenv('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.getenv('DB_NAME', 'test_database')
+
 
-async def clear_placeholder_images():
+def cleared(cigar):
+    return {"image": "", "image_id": None}
+
+
+async def clear_placeholder_images(batch_size: int, dry_run: bool, resume: bool):
     """Clear all cigar images to show the new placeholder"""
     client = AsyncIOMotorClient(MONGO_URL)
-    db = client.test_database
+    db = client[DB_NAME]
     
-    # Update all cigars to remove the image field (or set it to empty string)
-    result = await db.cigars.update_many(
-        {},  # All cigars
-        {"$set": {"image": ""}}  # Set image to empty string
+    # Only cigars that still have an inline or stored image need a write
+    stats = await run_maintenance(
+        db, "clear_placeholder_images", cleared,
+        query={"$or": [{"image": {"$ne": ""}}, {"image_id": {"$type": "string"}}]},
+        projection={"brand": 1, "name": 1, "image": 1, "image_id": 1},
+        batch_size=batch_size, dry_run=dry_run, resume=resume, progress=print_progress
     )
-    
-    print(f"Updated {result.modified_count} cigars")
+    print_report(stats, dry_run)
     print("All cigar images have been cleared. The new placeholder will now show.")
     
     client.close()
 
 if __name__ == "__main__":
-    asyncio.run(clear_placeholder_images())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    args = parser.parse_args()
+    asyncio.run(clear_placeholder_images(args.batch_size, args.dry_run, args.resume))
@@ -0,0 +1,43 @@
+"""
+orjson-based JSON encoding for API responses.
+
+ORJSONResponse is the default response class, but FastAPI still runs
+jsonable_encoder over anything a route returns without a response_model,
+converting datetimes and failing on nested ObjectIds before orjson sees the
+content. Hot routes that return plain dicts therefore return
+`orjson_response(...)` themselves. Only then does orjson serialize datetimes
+natively and render ObjectIds that reach it as hex strings.
+"""
+from typing import Optional
+
+import orjson
+from bson import ObjectId
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content) -> bytes:
+    """Encode content to JSON bytes"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    """Default response class for the API"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def orjson_response(content, response: Optional[Response] = None) -> ORJSONResponse:
+    """Encode `content` without jsonable_encoder, keeping headers and status set on the injected `response`"""
+    status_code = response.status_code if response is not None and response.status_code else 200
+    encoded = ORJSONResponse(content, status_code=status_code)
+    if response is not None:
+        encoded.headers.raw.extend(response.headers.raw)
+    return encoded
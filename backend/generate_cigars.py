@@ -1,6 +1,13 @@
 # Generate 1000+ cigars with realistic variations
+#
+# Generation is driven by a seeded random.Random, so the same seed always
+# yields the same catalog; synthetic.py builds load-test datasets on top of it.
 from datetime import datetime
 import random
+from typing import Iterator
+
+# Seed for the built-in catalog, so re-seeding produces the same cigars
+DEFAULT_SEED = 1000
 
 # Use placeholder image for generated cigars
 PLACEHOLDER_IMAGE = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
@@ -71,20 +78,18 @@ PRICE_RANGES = [
     "12-16", "15-20", "18-23", "20-25", "25-30", "30-40", "40-50", "50-75"
 ]
 
-def generate_cigars(count=1000):
-    """Generate realistic cigar data"""
-    cigars = []
-    
+def iter_cigars(count: int, rng: random.Random) -> Iterator[dict]:
+    """Lazily generate `count` realistic cigars from `rng`"""
     for i in range(count):
-        brand = random.choice(BRANDS)
-        series = random.choice(SERIES)
-        size_name = random.choice(SIZES)
-        strength = random.choice(STRENGTHS)
-        origin = random.choice(ORIGINS)
-        wrapper = random.choice(WRAPPERS)
+        brand = rng.choice(BRANDS)
+        series = rng.choice(SERIES)
+        size_name = rng.choice(SIZES)
+        strength = rng.choice(STRENGTHS)
+        origin = rng.choice(ORIGINS)
+        wrapper = rng.choice(WRAPPERS)
         
         # Generate name
-        if random.random() > 0.3:
+        if rng.random() > 0.3:
             name = f"{brand} {series}"
         else:
             name = f"{brand} {series} {size_name.split('(')[0].strip()}"
@@ -112,18 +117,18 @@ def generate_cigars(count=1000):
             wrapper_final = wrapper
         
         # Generate rating based on strength and price
-        price_range = random.choice(PRICE_RANGES)
+        price_range = rng.choice(PRICE_RANGES)
         avg_price = sum(map(float, price_range.split('-'))) / 2
         
         # Higher prices generally correlate with higher ratings
         if avg_price > 30:
-            base_rating = random.uniform(8.8, 9.8)
+            base_rating = rng.uniform(8.8, 9.8)
         elif avg_price > 15:
-            base_rating = random.uniform(8.3, 9.3)
+            base_rating = rng.uniform(8.3, 9.3)
         elif avg_price > 8:
-            base_rating = random.uniform(7.8, 8.8)
+            base_rating = rng.uniform(7.8, 8.8)
         else:
-            base_rating = random.uniform(7.3, 8.3)
+            base_rating = rng.uniform(7.3, 8.3)
         
         # Generate barcode
         barcode = f"750105530{i+500:04d}"
@@ -134,7 +139,7 @@ def generate_cigars(count=1000):
             "image": PLACEHOLDER_IMAGE,
             "images": [],
             "strength": strength,
-            "flavor_notes": random.choice(FLAVOR_GROUPS),
+            "flavor_notes": rng.choice(FLAVOR_GROUPS),
             "origin": origin,
             "wrapper": wrapper_final,
             "binder": binder,
@@ -147,9 +152,11 @@ def generate_cigars(count=1000):
             "created_at": datetime.utcnow()
         }
         
-        cigars.append(cigar)
-    
-    return cigars
+        yield cigar
+
+def generate_cigars(count=1000, seed=DEFAULT_SEED):
+    """Generate realistic cigar data; seed=None gives a different catalog every call"""
+    return list(iter_cigars(count, random.Random(seed)))
 
 def get_generated_cigars():
     """Get 1000 generated cigars"""
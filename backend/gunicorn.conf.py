@@ -0,0 +1,37 @@
+"""
+Gunicorn settings for running the API with several Uvicorn workers.
+
+Each worker imports server.py after the fork, so it gets its own Motor client,
+its own caches and its own tail of the invalidation bus (see
+invalidation.py); nothing is shared in memory between workers.
+
+Usage:
+    gunicorn -c gunicorn.conf.py server:app
+    WEB_CONCURRENCY=8 gunicorn -c gunicorn.conf.py server:app
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8001")
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# One worker per core; the API is async, so more than that only adds contention
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# Never load the app in the master: a Motor client must not cross a fork
+preload_app = False
+
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+# Recycle workers now and then so slow leaks cannot accumulate, staggered so they do not restart together
+max_requests = int(os.getenv("MAX_REQUESTS", "20000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "2000"))
+
+accesslog = os.getenv("ACCESS_LOG", None)
+
+# State every worker must agree on lives in MongoDB, not in process
+os.environ.setdefault("RATE_LIMIT_BACKEND", "mongo")
+# Workers would race to seed an empty catalog; run `python seed.py` once instead
+os.environ.setdefault("SEED_ON_STARTUP", "false")
@@ -0,0 +1,70 @@
+"""
+Conditional GET support for catalog reads.
+
+Routes compute a validator (ETag, optionally Last-Modified) from version
+fields before reading full documents. When the client's If-None-Match or
+If-Modified-Since still matches, a bodiless 304 is returned instead.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+# Cache-Control per route; no-cache means "store, but revalidate before reuse"
+CACHE_POLICIES = {
+    "cigar": "public, no-cache",
+    "search": "public, max-age=30",
+    "count": "public, max-age=300",
+    "comments": "public, no-cache",
+}
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag derived from the values a response depends on"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:20]}"'
+
+
+def _http_date(value: datetime) -> str:
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def _opaque(tag: str) -> str:
+    return tag.strip().removeprefix("W/")
+
+
+def is_fresh(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Whether the client's cached copy still matches the validators"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [_opaque(tag) for tag in if_none_match.split(",")]
+        return "*" in tags or _opaque(etag) in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
+
+
+def conditional(
+    request: Request,
+    response: Response,
+    policy: str,
+    etag: str,
+    last_modified: Optional[datetime] = None
+) -> Optional[Response]:
+    """Set caching headers on `response`; return a 304 to send instead if the client is up to date"""
+    headers = {"ETag": etag, "Cache-Control": CACHE_POLICIES[policy]}
+    if last_modified:
+        headers["Last-Modified"] = _http_date(last_modified)
+
+    if is_fresh(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,220 @@
+"""
+Parallel, cached image fetching for the catalog image scripts.
+
+URLs are downloaded with aiohttp, at most `concurrency` at a time. Each body is
+kept in an on-disk cache together with its ETag and Last-Modified, and
+revalidated with If-None-Match / If-Modified-Since on the next run, so images
+that have not changed upstream are neither downloaded nor re-rendered. Resize
+and JPEG encoding run in a process pool, off the event loop, and the rendered
+images are written once to the image store.
+
+The cache lives in IMAGE_CACHE_DIR (default backend/.image_cache) and is safe
+to delete; the next run simply downloads everything again.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+from PIL import Image
+
+from image_store import image_id_for, missing_image_ids, put_images
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", Path(__file__).parent / ".image_cache"))
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_SIZE = (400, 400)
+DEFAULT_QUALITY = 85
+FETCH_TIMEOUT_SECONDS = 15
+
+
+def render_image(body: bytes, size: Tuple[int, int], quality: int) -> bytes:
+    """Fit an image inside `size` and encode it as JPEG; runs in a worker process"""
+    image = Image.open(BytesIO(body))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.thumbnail(size, Image.Resampling.LANCZOS)
+    buffered = BytesIO()
+    image.save(buffered, format="JPEG", quality=quality)
+    return buffered.getvalue()
+
+
+class HttpCache:
+    """Downloaded bodies with their validators and rendered variants, one entry per URL"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, url: str, suffix: str) -> Path:
+        return self.directory / f"{hashlib.sha256(url.encode()).hexdigest()}{suffix}"
+
+    def meta(self, url: str) -> Optional[dict]:
+        path = self._path(url, ".json")
+        if not path.exists() or not self._path(url, ".body").exists():
+            return None
+        return json.loads(path.read_text())
+
+    def body(self, url: str) -> bytes:
+        return self._path(url, ".body").read_bytes()
+
+    def store(self, url: str, body: bytes, etag: Optional[str], last_modified: Optional[str]) -> dict:
+        """Save a fresh download; rendered variants survive if the bytes did not change"""
+        previous = self.meta(url) or {}
+        digest = hashlib.sha256(body).hexdigest()
+        meta = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "sha256": digest,
+            "rendered": previous.get("rendered", {}) if previous.get("sha256") == digest else {},
+        }
+        self._path(url, ".body").write_bytes(body)
+        self._write_meta(url, meta)
+        return meta
+
+    def rendered(self, url: str, variant: str) -> Optional[bytes]:
+        meta = self.meta(url)
+        path = self._path(url, f".{variant}.jpg")
+        if not meta or variant not in meta["rendered"] or not path.exists():
+            return None
+        return path.read_bytes()
+
+    def save_rendered(self, url: str, variant: str, data: bytes):
+        meta = self.meta(url)
+        self._path(url, f".{variant}.jpg").write_bytes(data)
+        meta["rendered"][variant] = image_id_for(data)
+        self._write_meta(url, meta)
+
+    def _write_meta(self, url: str, meta: dict):
+        # Write then rename so an interrupted run never leaves a torn entry
+        path = self._path(url, ".json")
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta))
+        tmp.replace(path)
+
+
+@dataclass
+class FetchStats:
+    downloaded: int = 0
+    not_modified: int = 0
+    rendered: int = 0
+    failed: int = 0
+    stored: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        return (
+            f"{self.downloaded} downloaded, {self.not_modified} unchanged upstream, "
+            f"{self.rendered} rendered, {self.stored} new in the image store, {self.failed} failed"
+        )
+
+
+@dataclass
+class FetchResult:
+    # URL -> rendered JPEG bytes, in the order requested; None when the fetch failed
+    images: Dict[str, Optional[bytes]]
+    stats: FetchStats
+
+    def image_ids(self) -> List[str]:
+        """Store ids of the images that were fetched, in request order"""
+        return [image_id_for(data) for data in self.images.values() if data is not None]
+
+
+async def _fetch_one(session, semaphore, cache: HttpCache, url: str, stats: FetchStats) -> bool:
+    """Refresh the cache entry for `url`; False when there is nothing usable"""
+    meta = cache.meta(url)
+    headers = {}
+    if meta and meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta and meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    async with semaphore:
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304 and meta:
+                    stats.not_modified += 1
+                    return True
+                if response.status != 200:
+                    stats.failed += 1
+                    stats.errors.append(f"{url}: HTTP {response.status}")
+                    return False
+                body = await response.read()
+                cache.store(url, body, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                stats.downloaded += 1
+                return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            stats.failed += 1
+            stats.errors.append(f"{url}: {e!r}")
+            return False
+
+
+async def fetch_images(
+    urls: List[str],
+    size: Tuple[int, int] = DEFAULT_SIZE,
+    quality: int = DEFAULT_QUALITY,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    cache_dir: Path = IMAGE_CACHE_DIR,
+    processes: Optional[int] = None
+) -> FetchResult:
+    """Download, revalidate and render `urls`; unchanged images come straight from the cache"""
+    urls = list(dict.fromkeys(urls))
+    cache = HttpCache(cache_dir)
+    stats = FetchStats()
+    variant = f"{size[0]}x{size[1]}q{quality}"
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    timeout = aiohttp.ClientTimeout(total=FETCH_TIMEOUT_SECONDS)
+
+    # Worker processes are only started once something actually needs rendering
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+
+            async def process(url: str) -> Optional[bytes]:
+                if not await _fetch_one(session, semaphore, cache, url, stats):
+                    return None
+                rendered = cache.rendered(url, variant)
+                if rendered is not None:
+                    return rendered
+                try:
+                    rendered = await loop.run_in_executor(pool, render_image, cache.body(url), size, quality)
+                except Exception as e:
+                    stats.failed += 1
+                    stats.errors.append(f"{url}: {e!r}")
+                    return None
+                cache.save_rendered(url, variant, rendered)
+                stats.rendered += 1
+                return rendered
+
+            results = await asyncio.gather(*(process(url) for url in urls))
+
+    return FetchResult(images=dict(zip(urls, results)), stats=stats)
+
+
+async def store_images(db, result: FetchResult) -> int:
+    """Write fetched images that are not in the image store yet; returns how many were added"""
+    by_id = {image_id_for(data): (url, data) for url, data in result.images.items() if data is not None}
+    missing = await missing_image_ids(db, by_id)
+    added = await put_images(db, [
+        {"data": by_id[image_id][1], "media_type": "image/jpeg", "source_url": by_id[image_id][0]}
+        for image_id in missing
+    ])
+    result.stats.stored += added
+    return added
+
+
+async def fetch_to_store(db, urls: List[str], **options) -> FetchResult:
+    """fetch_images followed by store_images"""
+    result = await fetch_images(urls, **options)
+    await store_images(db, result)
+    return result
@@ -0,0 +1,44 @@
+"""
+Content-addressed store for catalog images.
+
+Images produced by the image pipeline are kept once in `cigar_images`, keyed
+by the SHA-256 of their bytes, and cigars reference them through `image_id`
+instead of carrying their own base64 copy. GET /api/cigars/{id}/image serves
+either form; an inline `image` (user uploads) takes precedence.
+"""
+import hashlib
+from datetime import datetime
+from typing import Iterable, List, Optional, Set
+
+from pymongo import UpdateOne
+
+IMAGE_COLLECTION = "cigar_images"
+
+
+def image_id_for(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+async def missing_image_ids(db, image_ids: Iterable[str]) -> Set[str]:
+    """The ids from `image_ids` that are not stored yet"""
+    wanted = set(image_ids)
+    if not wanted:
+        return set()
+    found = db[IMAGE_COLLECTION].find({"_id": {"$in": list(wanted)}}, {"_id": 1})
+    return wanted - {doc["_id"] async for doc in found}
+
+
+async def put_images(db, images: List[dict]) -> int:
+    """Store images given as {"data", "media_type", ...} dicts; returns how many were new"""
+    ops = []
+    for image in images:
+        doc = {**image, "size": len(image["data"]), "created_at": datetime.utcnow()}
+        ops.append(UpdateOne({"_id": image_id_for(image["data"])}, {"$setOnInsert": doc}, upsert=True))
+    if not ops:
+        return 0
+    result = await db[IMAGE_COLLECTION].bulk_write(ops, ordered=False)
+    return result.upserted_count
+
+
+async def load_image(db, image_id: str) -> Optional[dict]:
+    return await db[IMAGE_COLLECTION].find_one({"_id": image_id}, {"data": 1, "media_type": 1})
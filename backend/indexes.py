@@ -0,0 +1,104 @@
+"""
+MongoDB indexes required by the API, created on startup.
+
+`create_indexes` is idempotent: MongoDB skips indexes that already exist with
+the same definition.
+"""
+import logging
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+from catalog import CHANGE_LOG_TTL_DAYS
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "users": [
+        # Partial so users whose normalized key collides with another account don't collide on null
+        IndexModel(
+            [("email_normalized", ASCENDING)], unique=True, name="email_normalized_unique",
+            partialFilterExpression={"email_normalized": {"$type": "string"}}
+        ),
+        IndexModel(
+            [("username_normalized", ASCENDING)], unique=True, name="username_normalized_unique",
+            partialFilterExpression={"username_normalized": {"$type": "string"}}
+        ),
+        IndexModel([("email", ASCENDING)], name="email"),
+    ],
+    "favorites": [
+        IndexModel([("user_id", ASCENDING), ("cigar_id", ASCENDING)], unique=True, name="user_cigar_unique"),
+        IndexModel([("user_id", ASCENDING), ("added_at", DESCENDING), ("_id", DESCENDING)], name="user_added_at"),
+    ],
+    "ratings": [
+        # Keyset pages of a user's ratings (/ratings/my-ratings, /me/activity)
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_created_at"),
+    ],
+    "user_notes": [
+        IndexModel([("user_id", ASCENDING), ("cigar_id", ASCENDING)], unique=True, name="user_cigar_unique"),
+        IndexModel([("user_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)], name="user_updated_at"),
+        # Equality prefix on user_id keeps personal searches to one user's entries
+        IndexModel([("user_id", ASCENDING), ("note_text", TEXT)], name="user_note_text"),
+    ],
+    "revoked_tokens": [
+        IndexModel([("jti", ASCENDING)], unique=True, name="jti_unique"),
+        # Drop revocations once the token would have expired anyway
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+    "rate_limits": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+    "cigars": [
+        # Upsert key for catalog imports; backfill_catalog_keys keys only one copy of an old duplicate
+        IndexModel(
+            [("catalog_key", ASCENDING)], unique=True, name="catalog_key_unique",
+            partialFilterExpression={"catalog_key": {"$type": "string"}}
+        ),
+    ],
+    "cigar_changes": [
+        IndexModel([("seq", ASCENDING)], unique=True, name="seq_unique"),
+        IndexModel([("at", ASCENDING)], expireAfterSeconds=CHANGE_LOG_TTL_DAYS * 86400, name="at_ttl"),
+    ],
+    "comments": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_created_at"),
+        IndexModel([("user_id", ASCENDING), ("text", TEXT)], name="user_comment_text"),
+    ],
+}
+
+
+# Indexes superseded by a definition in INDEXES on the same keys
+OBSOLETE_INDEXES = {
+    "cigars": ["catalog_key"],
+}
+
+
+async def ensure_indexes(db, backfill: bool = True):
+    """Create every index in INDEXES.
+
+    Cigars stored before catalog keys existed are keyed first, so the unique
+    catalog_key index can be built. With `backfill`, users stored before
+    normalized keys existed are then normalized (normalize_user_keys.py), so
+    the partial unique indexes cover them too. Any other unique index that
+    cannot be built while duplicates exist is logged instead of failing
+    startup so the data can be cleaned up first.
+    """
+    if "catalog_key_unique" not in await db.cigars.index_information():
+        from catalog_import import backfill_catalog_keys
+        await backfill_catalog_keys(db)
+    for collection, names in OBSOLETE_INDEXES.items():
+        existing = await db[collection].index_information()
+        for name in names:
+            if name in existing:
+                await db[collection].drop_index(name)
+
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            logger.error(f"Could not create indexes on {collection}: {str(e)}")
+
+    if backfill:
+        from normalize_user_keys import backfill as normalize_users
+        _, conflicts = await normalize_users(db, 500, report=logger.debug)
+        if conflicts:
+            logger.warning(f"{len(conflicts)} users collide with another account; run normalize_user_keys.py")
@@ -0,0 +1,235 @@
+"""
+Per-worker caches kept consistent across workers by an invalidation bus.
+
+Every worker holds its own `WorkerCache` instances; nothing is shared. Writes
+publish a message (topic plus affected keys) to the capped `invalidations`
+collection, and each worker tails that collection and drops the matching
+entries. Writers apply their own messages immediately, so a worker always
+reads its own writes; other workers see them after one tailable-cursor round
+trip. Any process can publish, including maintenance scripts and cigarctl,
+which go through catalog.record_changes.
+
+Caches are only used while the tailer is connected. A worker that cannot tail
+(connection lost, or a server without tailable cursors such as mongomock)
+bypasses its caches, and clears them on reconnect since it may have missed
+messages, so it never serves a result another worker would not.
+
+Topics:
+    catalog   cigar ids whose documents changed (ratings, favorites, edits, imports)
+    ratings   cigar ids whose rating list changed
+    users     user ids whose public profile (username, profile_pic) changed
+"""
+import asyncio
+import logging
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+from cachetools import TTLCache
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_COLLECTION = "invalidations"
+
+# Size of the capped collection; only needs to cover a reconnect
+INVALIDATION_LOG_BYTES = int(os.getenv("INVALIDATION_LOG_BYTES", str(1 << 20)))
+
+# Wait before re-opening the tail after an error
+BUS_RETRY_SECONDS = float(os.getenv("INVALIDATION_RETRY_SECONDS", "5"))
+
+# Upper bound on an entry's age, in case a message is ever lost
+WORKER_CACHE_TTL_SECONDS = float(os.getenv("WORKER_CACHE_TTL_SECONDS", "300"))
+
+WORKER_CACHE_ENABLED = os.getenv("WORKER_CACHE", "true").lower() == "true"
+
+TOPICS = ("catalog", "ratings", "users")
+
+CACHE_LOOKUPS = Counter("worker_cache_lookups_total", "Worker cache lookups", ("cache", "result"))
+BUS_MESSAGES = Counter("invalidation_messages_total", "Invalidation messages applied", ("topic", "source"))
+
+
+class InvalidationBus:
+    """Fans invalidation messages out to the caches of this worker"""
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self.live = False
+        self._failures = 0
+        self._subscribers: Dict[str, List[Callable[[Optional[list]], None]]] = defaultdict(list)
+
+    def subscribe(self, topic: str, callback: Callable[[Optional[list]], None]):
+        """Call `callback(keys)` for each message on `topic`; keys is None when everything must go"""
+        if topic not in TOPICS:
+            raise ValueError(f"Unknown topic {topic!r}")
+        self._subscribers[topic].append(callback)
+
+    def dispatch(self, topic: str, keys: Optional[list], source: str = "local"):
+        BUS_MESSAGES.inc(topic, source)
+        for callback in self._subscribers.get(topic, ()):
+            callback(keys)
+
+    def reset(self):
+        """Drop everything every subscriber holds"""
+        for topic in self._subscribers:
+            self.dispatch(topic, None, "reset")
+
+    async def run(self, db):
+        """Tail the invalidation log until cancelled, reconnecting after errors"""
+        while True:
+            try:
+                await ensure_invalidation_log(db)
+                cursor = db[INVALIDATION_COLLECTION].find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                cursor.max_await_time_ms(1000)
+                # Anything may have been missed while disconnected; replayed
+                # messages only drop entries, so reading from the start is safe
+                self.reset()
+                self.live = True
+                self._failures = 0
+                while cursor.alive:
+                    async for message in cursor:
+                        if message.get("origin") != self.origin and message.get("topic") in TOPICS:
+                            self.dispatch(message["topic"], message.get("keys"), "bus")
+                raise PyMongoError("Invalidation cursor closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failures += 1
+                if self._failures == 1:
+                    logger.warning(f"Invalidation bus unavailable, bypassing worker caches: {e}")
+                self.live = False
+                self.reset()
+            await asyncio.sleep(BUS_RETRY_SECONDS)
+
+
+bus = InvalidationBus()
+
+
+# Databases whose log this process has already created or found
+_log_ready = set()
+
+
+async def ensure_invalidation_log(db):
+    """Create the capped collection, with one entry so a tailable cursor can open on it"""
+    if db.name in _log_ready:
+        return
+    try:
+        await db.create_collection(INVALIDATION_COLLECTION, capped=True, size=INVALIDATION_LOG_BYTES)
+        await db[INVALIDATION_COLLECTION].insert_one({"topic": "hello", "at": datetime.utcnow()})
+    except CollectionInvalid:
+        pass
+    _log_ready.add(db.name)
+
+
+async def publish(db, topic: str, keys: Optional[Iterable[Hashable]]):
+    """Tell every worker, this one first, that `keys` under `topic` changed (None: everything).
+
+    The write being announced has already happened, so a failure is logged
+    rather than raised; other workers then hold stale entries for at most
+    WORKER_CACHE_TTL_SECONDS.
+    """
+    global _publish_failing
+    keys = None if keys is None else [str(key) for key in keys]
+    bus.dispatch(topic, keys)
+    try:
+        # A plain collection created by the insert could not be tailed
+        await ensure_invalidation_log(db)
+        await db[INVALIDATION_COLLECTION].insert_one({
+            "topic": topic,
+            "keys": keys,
+            "origin": bus.origin,
+            "at": datetime.utcnow()
+        })
+        _publish_failing = False
+    except Exception as e:
+        if not _publish_failing:
+            logger.error(f"Could not publish {topic} invalidation: {e}")
+        _publish_failing = True
+
+
+_publish_failing = False
+
+
+class WorkerCache:
+    """In-process TTL cache whose entries are tagged with bus keys; bypassed while the bus is down.
+
+    Read a `generation` before querying and pass it back to `set`: a message
+    that arrives while the query runs bumps the generation and the possibly
+    stale result is not stored.
+    """
+
+    def __init__(self, name: str, maxsize: int, topics: Dict[str, bool], ttl: float = WORKER_CACHE_TTL_SECONDS):
+        self.name = name
+        self.generation = 0
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._tagged: Dict[str, set] = defaultdict(set)
+        for topic, by_key in topics.items():
+            bus.subscribe(topic, self.invalidate if by_key else lambda keys: self.invalidate(None))
+
+    @property
+    def enabled(self) -> bool:
+        return WORKER_CACHE_ENABLED and bus.live
+
+    def get(self, key: Hashable, default=None):
+        if not self.enabled:
+            return default
+        value = self._entries.get(key, _MISSING)
+        CACHE_LOOKUPS.inc(self.name, "miss" if value is _MISSING else "hit")
+        return default if value is _MISSING else value
+
+    def set(self, key: Hashable, value, generation: int, tags: Iterable[str] = ()):
+        if not self.enabled or generation != self.generation:
+            return
+        self._entries[key] = value
+        for tag in tags:
+            self._tagged[str(tag)].add(key)
+        if len(self._tagged) > 2 * self._entries.maxsize:
+            self._prune_tags()
+
+    def invalidate(self, tags: Optional[Iterable[str]] = None):
+        """Drop the entries tagged with any of `tags`, or everything"""
+        self.generation += 1
+        if tags is None:
+            self._entries.clear()
+            self._tagged.clear()
+            return
+        for tag in tags:
+            for key in self._tagged.pop(tag, ()):
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _prune_tags(self):
+        """Forget tags whose entries have all expired"""
+        self._tagged = defaultdict(set, {
+            tag: live for tag, keys in self._tagged.items()
+            if (live := {key for key in keys if key in self._entries})
+        })
+
+
+_MISSING = object()
+
+CACHES: List[WorkerCache] = []
+
+
+def worker_cache(name: str, maxsize: int, **topics: bool) -> WorkerCache:
+    """A registered WorkerCache; each topic maps to True to drop entries by key, False to drop them all"""
+    cache = WorkerCache(name, maxsize, topics)
+    CACHES.append(cache)
+    return cache
+
+
+WORKER_CACHE_SIZE = Gauge(
+    "worker_cache_entries", "Entries in each worker cache", ("cache",),
+    lambda: {(cache.name,): len(cache) for cache in CACHES}
+)
+BUS_LIVE = Gauge(
+    "invalidation_bus_connected", "1 while this worker tails the invalidation log", (),
+    lambda: {(): 1 if bus.live else 0}
+)
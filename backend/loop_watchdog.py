@@ -0,0 +1,134 @@
+"""
+Event-loop lag watchdog.
+
+A task on the loop wakes every `interval` and records how late it was
+scheduled. A helper thread watches the task's heartbeat; when the loop has not
+run it for longer than `threshold`, something is blocking the loop, so the
+thread captures the loop thread's current stack and the request being served
+by the running task. Lag percentiles and stall counts are exported through
+the metrics registry.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import List, Optional
+
+from metrics import Counter, Gauge, Histogram, route_template, task_requests
+from profiler import lag_report
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+LOOP_WATCHDOG_INTERVAL_MS = float(os.getenv("LOOP_WATCHDOG_INTERVAL_MS", "50"))
+
+# Recent lag samples kept for the percentile gauges
+LAG_WINDOW = 1200
+
+# Stacks deeper than this are trimmed to their innermost frames
+STACK_LIMIT = 40
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class LoopWatchdog:
+    """Measures loop scheduling delay and attributes long stalls to the blocking code"""
+
+    def __init__(self, threshold: float, interval: float):
+        self.threshold = threshold
+        self.interval = interval
+        self.lags = deque(maxlen=LAG_WINDOW)
+        self.stalls = deque(maxlen=50)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._last_beat = time.monotonic()
+        self._reported_beat = None
+
+    def start(self):
+        """Start the heartbeat task on the running loop and the helper thread"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopping.clear()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_beat = now
+            self.lags.append(lag)
+            LOOP_LAG.observe(lag)
+
+    def _watch(self):
+        while not self._stopping.wait(self.interval / 2):
+            beat = self._last_beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled > self.threshold and self._reported_beat != beat:
+                # Report each stall once, while the loop is still stuck in it
+                self._reported_beat = beat
+                self._capture(stalled)
+
+    def _capture(self, stalled: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame)[-STACK_LIMIT:] if frame is not None else []
+        # Reading another loop's current task from this thread is racy but harmless
+        task = getattr(asyncio.tasks, "_current_tasks", {}).get(self._loop)
+        request = task_requests.get(task) if task is not None else None
+        route = route_template(request.scope) if request else "-"
+
+        LOOP_STALLS.inc(route)
+        self.stalls.append({
+            "at": datetime.utcnow().isoformat(),
+            "blocked_ms": round(stalled * 1000, 1),
+            "route": route,
+            "path": f"{request.method} {request.path}" if request else None,
+            "task": task.get_name() if task is not None else None,
+            "stack": stack,
+        })
+        logger.warning(
+            f"Event loop blocked for {stalled * 1000:.0f}ms+ in {route}:\n{''.join(stack[-8:])}"
+        )
+
+    def percentiles(self) -> dict:
+        """Lag percentiles over the recent window, in milliseconds"""
+        return lag_report(list(self.lags))
+
+    def recent_stalls(self) -> List[dict]:
+        return list(self.stalls)
+
+
+watchdog = LoopWatchdog(LOOP_LAG_THRESHOLD_MS / 1000, LOOP_WATCHDOG_INTERVAL_MS / 1000)
+
+
+def _lag_quantiles():
+    report = watchdog.percentiles()
+    return {
+        (quantile,): report[key] / 1000
+        for quantile, key in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms"))
+    }
+
+
+LOOP_LAG = Histogram("event_loop_lag_seconds", "Event loop scheduling delay", buckets=LAG_BUCKETS)
+LOOP_LAG_QUANTILES = Gauge(
+    "event_loop_lag_window_seconds", "Event loop lag percentiles over the recent window",
+    ("quantile",), _lag_quantiles
+)
+LOOP_STALLS = Counter("event_loop_stalls_total", "Loop stalls over LOOP_LAG_THRESHOLD_MS by route", ("route",))
@@ -0,0 +1,175 @@
+"""
+Shared framework for full-catalog maintenance jobs.
+
+A job is a function that takes a cigar (restricted to a projection) and
+returns the fields it should have, or None to leave it alone. The runner
+streams the matching cigars in `_id` order with a server-side cursor, diffs
+each one against the job's output, and writes only real changes with one
+unordered bulk_write per batch. Writes go through `touched` and the change
+log, so ETags and delta sync see them.
+
+After every batch the last `_id` is saved under the job's name in
+`maintenance_checkpoints`, so an interrupted run can continue with --resume.
+A completed run clears its checkpoint.
+"""
+import argparse
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from pymongo import UpdateOne
+
+from catalog import record_changes, touched
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Diffs kept for the dry-run report
+MAX_DIFFS = 50
+
+
+@dataclass
+class MaintenanceStats:
+    scanned: int = 0
+    changed: int = 0
+    unchanged: int = 0
+    diffs: List[str] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def throughput(self) -> float:
+        return self.scanned / self.elapsed if self.elapsed else 0.0
+
+
+def diff_fields(doc: dict, wanted: Optional[dict]) -> dict:
+    """The entries of `wanted` that differ from what `doc` holds"""
+    if not wanted:
+        return {}
+    return {name: value for name, value in wanted.items() if doc.get(name) != value}
+
+
+def describe(doc: dict, changes: dict) -> str:
+    label = f"{doc.get('brand', '')} {doc.get('name', '')}".strip() or str(doc["_id"])
+    return f"{label}: " + ", ".join(
+        f"{name} {_short(doc.get(name))} -> {_short(value)}" for name, value in changes.items()
+    )
+
+
+def _short(value) -> str:
+    text = repr(value)
+    # Base64 images would flood the report
+    return text if len(text) <= 40 else f"{text[:37]}..."
+
+
+async def load_checkpoint(db, job: str):
+    checkpoint = await db.maintenance_checkpoints.find_one({"_id": job})
+    return checkpoint.get("last_id") if checkpoint else None
+
+
+async def save_checkpoint(db, job: str, last_id, stats: MaintenanceStats):
+    await db.maintenance_checkpoints.update_one(
+        {"_id": job},
+        {"$set": {"last_id": last_id, "scanned": stats.scanned, "changed": stats.changed, "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+
+async def clear_checkpoint(db, job: str):
+    await db.maintenance_checkpoints.delete_one({"_id": job})
+
+
+async def _write_batch(db, ops: List[UpdateOne], ids: list):
+    await db.cigars.bulk_write(ops, ordered=False)
+    await record_changes(db, ids, "update")
+
+
+async def run_maintenance(
+    db,
+    job: str,
+    compute: Callable[[dict], Optional[dict]],
+    query: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dry_run: bool = False,
+    resume: bool = False,
+    progress: Optional[Callable[[MaintenanceStats], None]] = None
+) -> MaintenanceStats:
+    """Stream cigars matching `query` and set the fields `compute` returns where they differ"""
+    stats = MaintenanceStats()
+    query = dict(query or {})
+
+    if resume and not dry_run:
+        last_id = await load_checkpoint(db, job)
+        if last_id is not None:
+            logger.info(f"Resuming {job} after {last_id}")
+            query = {"$and": [query, {"_id": {"$gt": last_id}}]} if query else {"_id": {"$gt": last_id}}
+
+    ops, ids = [], []
+    last_id = None
+    cursor = db.cigars.find(query, projection).sort("_id", 1).batch_size(batch_size)
+    async for doc in cursor:
+        stats.scanned += 1
+        last_id = doc["_id"]
+        changes = diff_fields(doc, compute(doc))
+        if not changes:
+            stats.unchanged += 1
+        else:
+            stats.changed += 1
+            if dry_run:
+                if len(stats.diffs) < MAX_DIFFS:
+                    stats.diffs.append(describe(doc, changes))
+            else:
+                ops.append(UpdateOne({"_id": doc["_id"]}, touched({"$set": changes})))
+                ids.append(doc["_id"])
+
+        if stats.scanned % batch_size == 0:
+            if ops:
+                await _write_batch(db, ops, ids)
+                ops, ids = [], []
+            if not dry_run:
+                await save_checkpoint(db, job, last_id, stats)
+            if progress:
+                progress(stats)
+
+    if ops:
+        await _write_batch(db, ops, ids)
+    if not dry_run:
+        await clear_checkpoint(db, job)
+    if progress:
+        progress(stats)
+    return stats
+
+
+# ==================== Command line ====================
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Options shared by every maintenance script"""
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    parser.add_argument("--resume", action="store_true", help="Continue after the last checkpoint of an interrupted run")
+
+
+def print_progress(stats: MaintenanceStats):
+    print(
+        f"  {stats.scanned:>8} scanned  {stats.changed:>8} changed  {stats.throughput:>8.0f}/s",
+        end="\r", flush=True
+    )
+
+
+def print_report(stats: MaintenanceStats, dry_run: bool):
+    print()
+    print("=" * 60)
+    print(f"✅ {'Would update' if dry_run else 'Updated'} {stats.changed} cigars, {stats.unchanged} already up to date")
+    for diff in stats.diffs:
+        print(f"   ~ {diff}")
+    if dry_run and stats.changed > len(stats.diffs):
+        print(f"   ... and {stats.changed - len(stats.diffs)} more")
+    print(f"⏱️  {stats.scanned} cigars in {stats.elapsed:.2f}s ({stats.throughput:.0f} cigars/s)")
+    print("=" * 60)
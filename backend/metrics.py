@@ -0,0 +1,483 @@
+"""
+In-process metrics: request latency, MongoDB command timing, connection pool
+waits and a slow-query log.
+
+TimingMiddleware times every HTTP request and keeps a RequestStats for it in a
+context variable. Motor runs pymongo calls on executor threads with a copy of
+the caller's context, so MongoCommandListener can attribute each command's
+duration and returned documents to the request that issued it, and
+MongoPoolListener the time spent waiting for a pooled connection. Everything is
+rendered in Prometheus text format by `render()` for GET /metrics.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+# Commands slower than this are logged with their shape and plan
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+# Explain a given slow query shape at most once per interval
+EXPLAIN_INTERVAL_SECONDS = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS", "600"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # One slot per bucket, then +Inf count and sum
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series_items = sorted((k, list(v)) for k, v in self._series.items())
+        for label_values, series in series_items:
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(self.labels, label_values, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = _format_labels(self.labels, label_values, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {series[-2]}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {series[-1]}"
+
+
+class Gauge:
+    """Point-in-time values, read from `collect` when metrics are rendered"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 collect: Callable[[], Dict[Tuple[str, ...], float]] = dict):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.collect = collect
+        REGISTRY.append(self)
+
+    def samples(self):
+        for label_values, value in sorted(self.collect().items()):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+REGISTRY: list = []
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+REQUEST_MONGO_TIME = Histogram(
+    "http_request_mongo_seconds", "Time spent in MongoDB commands per request", ("route",)
+)
+REQUEST_MONGO_COMMANDS = Histogram(
+    "http_request_mongo_commands", "MongoDB commands issued per request", ("route",), COUNT_BUCKETS
+)
+REQUEST_MONGO_DOCUMENTS = Counter(
+    "http_request_mongo_documents_total", "Documents returned by MongoDB per route", ("route",)
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("command", "collection")
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands", ("command", "collection")
+)
+SLOW_QUERIES = Counter("mongo_slow_queries_total", "Commands over SLOW_QUERY_MS", ("command", "collection"))
+MONGO_POOL_WAIT = Histogram(
+    "mongo_pool_wait_seconds", "Time spent waiting to check out a pooled connection", ("address",), POOL_WAIT_BUCKETS
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    "mongo_pool_checkout_failures_total", "Failed connection checkouts, e.g. waitQueueTimeoutMS", ("address", "reason")
+)
+REQUEST_POOL_WAIT = Histogram(
+    "http_request_mongo_pool_wait_seconds", "Time spent waiting for pooled connections per request", ("route",),
+    POOL_WAIT_BUCKETS
+)
+
+
+def render() -> str:
+    """All registered metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# ==================== Request Timing ====================
+
+@dataclass
+class RequestStats:
+    """Per-request accumulator shared with the Mongo command listener"""
+    method: str
+    path: str
+    route: str = "unmatched"
+    mongo_seconds: float = 0.0
+    mongo_commands: int = 0
+    mongo_documents: int = 0
+    pool_wait_seconds: float = 0.0
+    scope: Optional[dict] = field(default=None, repr=False)
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+# Request served by each asyncio task, for code that only sees the task (e.g. the loop watchdog)
+task_requests: "weakref.WeakKeyDictionary[asyncio.Task, RequestStats]" = weakref.WeakKeyDictionary()
+
+_stats_lock = threading.Lock()
+
+
+def route_template(scope) -> str:
+    """Path template of the route that handled a request, e.g. /api/cigars/{cigar_id}"""
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is None or app is None:
+        return "unmatched"
+    for route in app.router.routes:
+        if getattr(route, "endpoint", None) is endpoint:
+            return route.path
+    return "unmatched"
+
+
+class TimingMiddleware:
+    """Pure ASGI middleware recording latency and Mongo usage per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(method=scope["method"], path=scope["path"], scope=scope)
+        token = current_request.set(stats)
+        task = asyncio.current_task()
+        if task is not None:
+            task_requests[task] = stats
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                MutableHeaders(scope=message).append(
+                    "Server-Timing",
+                    f"app;dur={elapsed_ms:.1f}, db;dur={stats.mongo_seconds * 1000:.1f}, "
+                    f"pool;dur={stats.pool_wait_seconds * 1000:.1f}"
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            if task is not None:
+                task_requests.pop(task, None)
+            stats.route = route_template(scope)
+            REQUESTS.inc(stats.method, stats.route, str(status))
+            REQUEST_LATENCY.observe(elapsed, stats.method, stats.route)
+            REQUEST_MONGO_TIME.observe(stats.mongo_seconds, stats.route)
+            REQUEST_MONGO_COMMANDS.observe(stats.mongo_commands, stats.route)
+            REQUEST_POOL_WAIT.observe(stats.pool_wait_seconds, stats.route)
+            if stats.mongo_documents:
+                REQUEST_MONGO_DOCUMENTS.inc(stats.route, amount=stats.mongo_documents)
+
+
+# ==================== MongoDB Command Monitoring ====================
+
+# Commands whose shape and plan are worth logging when slow
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+
+# Fields the driver adds to every command; not part of the query itself
+_DRIVER_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "$db", "$clusterTime",
+                  "$readPreference", "readConcern", "writeConcern", "comment", "apiVersion"}
+
+
+def query_shape(value):
+    """Replace literal values in a filter/pipeline with '?' so similar queries group together"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shaped = [query_shape(item) for item in value]
+        # Long $in lists collapse to a single placeholder
+        return shaped[:1] if shaped and all(item == "?" for item in shaped) else shaped
+    return "?"
+
+
+def command_shape(command_name: str, command: dict) -> dict:
+    """The parts of a command that describe what it looks up"""
+    shape = {}
+    for key in ("filter", "query", "q", "sort", "pipeline", "key"):
+        if key in command:
+            shape[key] = query_shape(command[key]) if key != "sort" else command[key]
+    for key in ("updates", "deletes"):
+        if command.get(key):
+            shape[key[:-1]] = query_shape(command[key][0].get("q", {}))
+    return shape
+
+
+def plan_summary(explain: dict) -> str:
+    """Compact description of the winning plan, e.g. 'FETCH < IXSCAN(user_id_1)'"""
+    def find_winning_plan(node):
+        if isinstance(node, dict):
+            if "winningPlan" in node:
+                return node["winningPlan"]
+            for value in node.values():
+                found = find_winning_plan(value)
+                if found:
+                    return found
+        elif isinstance(node, list):
+            for value in node:
+                found = find_winning_plan(value)
+                if found:
+                    return found
+        return None
+
+    stage = find_winning_plan(explain)
+    # Slot-based engine plans nest the classic tree under queryPlan
+    stage = stage.get("queryPlan", stage) if stage else None
+    parts = []
+    while stage:
+        label = stage.get("stage", "?")
+        if stage.get("indexName"):
+            label += f"({stage['indexName']})"
+        parts.append(label)
+        stage = stage.get("inputStage") or (stage.get("inputStages") or [None])[0]
+    return " < ".join(parts) if parts else "unknown"
+
+
+def _documents_returned(command_name: str, reply) -> int:
+    cursor = reply.get("cursor") if isinstance(reply, dict) else None
+    if cursor:
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    if command_name in ("count", "findAndModify"):
+        return 1
+    return 0
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times MongoDB commands and attributes them to the active request"""
+
+    def __init__(self):
+        self._in_flight = {}
+        self._explained: Dict[str, float] = {}
+        self._db = None
+        self._loop = None
+
+    def explain_with(self, db, loop: asyncio.AbstractEventLoop):
+        """Enable plan summaries in the slow-query log"""
+        self._db = db
+        self._loop = loop
+
+    def started(self, event):
+        command = event.command if event.command_name in EXPLAINABLE_COMMANDS else None
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        else:
+            collection = event.command.get(event.command_name)
+        self._in_flight[(event.request_id, event.connection_id)] = (
+            current_request.get(), str(collection) if isinstance(collection, str) else "", command
+        )
+
+    def succeeded(self, event):
+        entry = self._in_flight.pop((event.request_id, event.connection_id), None)
+        if entry is None:
+            return
+        stats, collection, command = entry
+        seconds = event.duration_micros / 1_000_000
+        MONGO_COMMAND_LATENCY.observe(seconds, event.command_name, collection)
+
+        documents = _documents_returned(event.command_name, event.reply)
+        if stats is not None:
+            with _stats_lock:
+                stats.mongo_seconds += seconds
+                stats.mongo_commands += 1
+                stats.mongo_documents += documents
+
+        if seconds * 1000 >= SLOW_QUERY_MS and event.command_name != "explain":
+            self._log_slow(event.command_name, collection, command, seconds, documents, stats)
+
+    def failed(self, event):
+        entry = self._in_flight.pop((event.request_id, event.connection_id), None)
+        if entry is None:
+            return
+        stats, collection, _ = entry
+        MONGO_COMMAND_FAILURES.inc(event.command_name, collection)
+        if stats is not None:
+            with _stats_lock:
+                stats.mongo_seconds += event.duration_micros / 1_000_000
+                stats.mongo_commands += 1
+
+    def _log_slow(self, command_name, collection, command, seconds, documents, stats):
+        SLOW_QUERIES.inc(command_name, collection)
+        shape = command_shape(command_name, command) if command is not None else {}
+        route = stats.path if stats is not None else "-"
+        logger.warning(
+            f"Slow query {command_name} {collection} {seconds * 1000:.0f}ms "
+            f"docs={documents} route={route} shape={shape}"
+        )
+
+        if command is None or self._db is None or self._loop is None:
+            return
+        key = f"{command_name}:{collection}:{shape}"
+        now = time.monotonic()
+        if now - self._explained.get(key, -EXPLAIN_INTERVAL_SECONDS) < EXPLAIN_INTERVAL_SECONDS:
+            return
+        self._explained[key] = now
+        explainable = {k: v for k, v in command.items() if k not in _DRIVER_FIELDS}
+        # Listeners must not issue commands themselves; run the explain on the loop instead
+        self._loop.call_soon_threadsafe(
+            lambda: asyncio.ensure_future(self._explain(command_name, collection, shape, explainable))
+        )
+
+    async def _explain(self, command_name, collection, shape, command):
+        try:
+            explain = await self._db.command({"explain": command, "verbosity": "queryPlanner"})
+            logger.warning(f"Slow query plan {command_name} {collection} shape={shape}: {plan_summary(explain)}")
+        except Exception as e:
+            logger.error(f"Error explaining slow query: {str(e)}")
+
+
+command_listener = MongoCommandListener()
+
+
+# ==================== Connection Pool Monitoring ====================
+
+def _address(event) -> str:
+    host, port = event.address
+    return f"{host}:{port}"
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Times connection checkouts and attributes the wait to the active request.
+
+    A checkout starts and completes on the same executor thread, so the start
+    time is kept in a thread-local.
+    """
+
+    def __init__(self):
+        self._checkout = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._checkout.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        seconds = self._waited()
+        if seconds is None:
+            return
+        MONGO_POOL_WAIT.observe(seconds, _address(event))
+        stats = current_request.get()
+        if stats is not None:
+            with _stats_lock:
+                stats.pool_wait_seconds += seconds
+
+    def connection_check_out_failed(self, event):
+        seconds = self._waited()
+        MONGO_POOL_CHECKOUT_FAILURES.inc(_address(event), str(event.reason))
+        stats = current_request.get()
+        if stats is not None and seconds is not None:
+            with _stats_lock:
+                stats.pool_wait_seconds += seconds
+
+    def _waited(self) -> Optional[float]:
+        started = getattr(self._checkout, "started", None)
+        self._checkout.started = None
+        return None if started is None else time.perf_counter() - started
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+pool_listener = MongoPoolListener()
@@ -0,0 +1,131 @@
+"""
+Move favorites out of the users.favorites arrays into the favorites collection.
+
+Each array entry becomes a (user_id, cigar_id, added_at) document. Array order is
+preserved through added_at (later entries are newer). Inserts are upserts keyed
+by the unique (user_id, cigar_id) index, so the script can be re-run safely.
+Afterwards favorite_count is recomputed for the cigars that appeared in an
+array (only changed counts are written, as versioned catalog changes), and
+the arrays are removed from the user documents. Until then the API reads a
+user's favorites from the array when the collection has none for them.
+
+Usage:
+    python migrate_favorites.py [--batch-size 500] [--keep-arrays]
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Set, Tuple
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from catalog import record_changes, touched
+from indexes import ensure_indexes
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+async def copy_favorites(db, batch_size: int) -> Tuple[int, Set[ObjectId]]:
+    """Upsert favorites documents for every user that still has an array; returns the cigars seen"""
+    copied = 0
+    cigar_ids = set()
+    last_id = None
+    migrated_at = datetime.utcnow()
+
+    while True:
+        query = {"favorites.0": {"$exists": True}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        users = await db.users.find(query, {"favorites": 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not users:
+            break
+        last_id = users[-1]["_id"]
+
+        ops = []
+        for user in users:
+            user_id = str(user["_id"])
+            favorites = user["favorites"]
+            for position, cigar_id in enumerate(favorites):
+                if isinstance(cigar_id, str):
+                    if not ObjectId.is_valid(cigar_id):
+                        continue
+                    cigar_id = ObjectId(cigar_id)
+                cigar_ids.add(cigar_id)
+                added_at = migrated_at - timedelta(milliseconds=len(favorites) - position)
+                ops.append(UpdateOne(
+                    {"user_id": user_id, "cigar_id": cigar_id},
+                    {"$setOnInsert": {"added_at": added_at}},
+                    upsert=True
+                ))
+
+        if ops:
+            result = await db.favorites.bulk_write(ops, ordered=False)
+            copied += result.upserted_count
+        print(f"  copied {copied} favorites so far")
+
+    return copied, cigar_ids
+
+
+async def recount_favorites(db, cigar_ids: Set[ObjectId], batch_size: int) -> int:
+    """Set favorite_count of `cigar_ids` from the favorites collection where it differs"""
+    ids = sorted(cigar_ids)
+    updated = 0
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        counts = {oid: 0 for oid in batch}
+        async for group in db.favorites.aggregate([
+            {"$match": {"cigar_id": {"$in": batch}}},
+            {"$group": {"_id": "$cigar_id", "count": {"$sum": 1}}}
+        ]):
+            counts[group["_id"]] = group["count"]
+
+        stored = await db.cigars.find({"_id": {"$in": batch}}, {"favorite_count": 1}).to_list(len(batch))
+        changed = [cigar["_id"] for cigar in stored if cigar.get("favorite_count", 0) != counts[cigar["_id"]]]
+        if not changed:
+            continue
+        await db.cigars.bulk_write([
+            UpdateOne({"_id": oid}, touched({"$set": {"favorite_count": counts[oid]}})) for oid in changed
+        ], ordered=False)
+        await record_changes(db, changed)
+        updated += len(changed)
+    return updated
+
+
+async def main(batch_size: int, keep_arrays: bool):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    print("=" * 60)
+    print("MIGRATING USER FAVORITES TO THE FAVORITES COLLECTION")
+    print("=" * 60)
+
+    started = time.monotonic()
+    await ensure_indexes(db, backfill=False)
+
+    copied, cigar_ids = await copy_favorites(db, batch_size)
+    print(f"✅ Copied {copied} favorites")
+
+    counted = await recount_favorites(db, cigar_ids, batch_size)
+    print(f"✅ Updated favorite_count on {counted} cigars")
+
+    if not keep_arrays:
+        result = await db.users.update_many({"favorites": {"$exists": True}}, {"$unset": {"favorites": ""}})
+        print(f"✅ Removed favorites arrays from {result.modified_count} users")
+
+    print(f"\nDone in {time.monotonic() - started:.1f}s")
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--keep-arrays", action="store_true", help="Leave users.favorites in place")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.keep_arrays))
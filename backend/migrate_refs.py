@@ -0,0 +1,147 @@
+"""
+Convert cigar references stored as hex strings into native ObjectIds.
+
+Covers ratings.cigar_id, comments.cigar_id, user_notes.cigar_id and
+users.favorites. Documents are processed in batches with unordered bulk writes;
+only documents that still hold string references are selected, so the script
+can be interrupted and re-run safely. Once it reports nothing left to convert,
+set DUAL_READ_STRING_REFS=false for the API.
+
+Usage:
+    python migrate_refs.py [--batch-size 1000] [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+import time
+from pathlib import Path
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# (collection, field) pairs holding a single cigar reference
+SCALAR_REFS = [
+    ("ratings", "cigar_id"),
+    ("comments", "cigar_id"),
+    ("user_notes", "cigar_id"),
+]
+
+
+def _convert_ids(values):
+    """Convert a list of references, dropping duplicates and unparseable ids"""
+    converted = []
+    for value in values:
+        if isinstance(value, str):
+            if not ObjectId.is_valid(value):
+                continue
+            value = ObjectId(value)
+        if value not in converted:
+            converted.append(value)
+    return converted
+
+
+async def migrate_scalar(db, collection: str, field: str, batch_size: int, dry_run: bool) -> int:
+    """Convert string references in `collection.field`; returns documents converted"""
+    coll = db[collection]
+    converted = 0
+    skipped = 0
+    last_id = None
+
+    while True:
+        query = {field: {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await coll.find(query, {field: 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        ops = []
+        for doc in batch:
+            value = doc[field]
+            if not ObjectId.is_valid(value):
+                skipped += 1
+                continue
+            ops.append(UpdateOne(
+                {"_id": doc["_id"], field: value},
+                {"$set": {field: ObjectId(value)}}
+            ))
+
+        if ops and not dry_run:
+            result = await coll.bulk_write(ops, ordered=False)
+            converted += result.modified_count
+        else:
+            converted += len(ops)
+        print(f"  {collection}.{field}: {converted} converted so far")
+
+    if skipped:
+        print(f"⚠️  {collection}.{field}: skipped {skipped} invalid ids")
+    return converted
+
+
+async def migrate_favorites(db, batch_size: int, dry_run: bool) -> int:
+    """Convert string entries in users.favorites; returns users converted"""
+    converted = 0
+    last_id = None
+
+    while True:
+        # $type matches arrays holding at least one string element
+        query = {"favorites": {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await db.users.find(query, {"favorites": 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        ops = [
+            UpdateOne(
+                {"_id": user["_id"], "favorites": user["favorites"]},
+                {"$set": {"favorites": _convert_ids(user["favorites"])}}
+            )
+            for user in batch
+        ]
+
+        if not dry_run:
+            result = await db.users.bulk_write(ops, ordered=False)
+            converted += result.modified_count
+        else:
+            converted += len(ops)
+        print(f"  users.favorites: {converted} users converted so far")
+
+    return converted
+
+
+async def main(batch_size: int, dry_run: bool):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    print("=" * 60)
+    print(f"MIGRATING CIGAR REFERENCES TO OBJECTIDS{' (DRY RUN)' if dry_run else ''}")
+    print("=" * 60)
+
+    started = time.monotonic()
+    total = 0
+    for collection, field in SCALAR_REFS:
+        total += await migrate_scalar(db, collection, field, batch_size, dry_run)
+    total += await migrate_favorites(db, batch_size, dry_run)
+
+    elapsed = time.monotonic() - started
+    print(f"\n✅ Converted {total} documents in {elapsed:.1f}s")
+    if not dry_run:
+        print("Once all API workers run this code, set DUAL_READ_STRING_REFS=false")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Count documents without writing")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.dry_run))
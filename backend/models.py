@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field
+from typing import List, Optional, Union
 from datetime import datetime
 from bson import ObjectId
 
@@ -59,6 +59,28 @@ class CigarCreate(BaseModel):
     price_range: Optional[str] = None
     barcode: Optional[str] = None
 
+class CigarImport(BaseModel):
+    """One catalog record read by cigarctl import"""
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
+
+    name: str = Field(min_length=1)
+    brand: str = Field(min_length=1)
+    strength: Optional[str] = None
+    origin: Optional[str] = None
+    wrapper: Optional[str] = None
+    binder: Optional[str] = None
+    filler: Optional[str] = None
+    size: Optional[str] = None
+    length: Optional[float] = None
+    ring_gauge: Optional[int] = None
+    price_range: Optional[Union[str, float]] = None
+    barcode: Optional[str] = None
+    description: Optional[str] = None
+    flavor_notes: List[str] = []
+    image: Optional[str] = None
+    average_rating: Optional[float] = Field(None, validation_alias=AliasChoices("average_rating", "rating"))
+    rating_count: Optional[int] = None
+
 class CigarResponse(BaseModel):
     id: str
     name: str
@@ -77,6 +99,19 @@ class CigarResponse(BaseModel):
     average_rating: float = 0.0
     rating_count: int = 0
 
+class CigarCard(BaseModel):
+    """Lean cigar shape used by list endpoints (search, favorites)"""
+    id: str
+    name: str = ""
+    brand: str = ""
+    image: Optional[str] = None
+    image_url: Optional[str] = None
+    strength: Optional[str] = None
+    origin: Optional[str] = None
+    average_rating: float = 0.0
+    rating_count: int = 0
+    price_range: Optional[Union[str, float]] = None
+
 
 # Rating Models
 class RatingCreate(BaseModel):
@@ -109,6 +144,18 @@ class CommentResponse(BaseModel):
     created_at: datetime
     replies: List['CommentResponse'] = []
 
+class CommentNode(BaseModel):
+    """Comment thread entry returned by the cigar comments endpoint"""
+    id: str
+    user_id: str
+    username: str
+    profile_pic: Optional[str] = None
+    text: str
+    parent_id: Optional[str] = None
+    images: List[str] = []
+    created_at: datetime
+    replies: List['CommentNode'] = []
+
 
 # Search Models
 class SearchQuery(BaseModel):
@@ -128,6 +175,10 @@ class LabelScanRequest(BaseModel):
 class BarcodeScanRequest(BaseModel):
     barcode: str
 
+class CigarBatchRequest(BaseModel):
+    ids: List[str]
+    fields: Optional[str] = None
+
 
 # Store Models
 class StorePrice(BaseModel):
@@ -0,0 +1,111 @@
+"""
+MongoDB client settings and read routing for the API.
+
+Pool size, timeouts, wire compression and the application name come from the
+environment (defaults below). Read-mostly endpoints send their reads to
+secondaries through `secondary()`, never to one more than
+MONGO_MAX_STALENESS_SECONDS behind the primary; flows that must read their own
+writes keep using the primary database.
+
+When a response is validated by a version read from the primary (ETags, worker
+caches), the secondary read runs in a `causal_session()` started after that
+version read, so a body is never older than the validator sent with it.
+
+Usage:
+    client = create_client(mongo_url, event_listeners=[command_listener, pool_listener])
+    cigars = await secondary(db).cigars.find(query).to_list(50)
+"""
+import importlib.util
+import os
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.read_preferences import SecondaryPreferred
+
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+
+# Give up on a request after this long without a free connection instead of queueing without bound
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+MONGO_APP_NAME = os.getenv("MONGO_APP_NAME", "cigar-ranker-api")
+
+# Wire compressors in order of preference; those whose library is not installed are skipped
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+MONGO_SECONDARY_READS = os.getenv("MONGO_SECONDARY_READS", "true").lower() == "true"
+
+# The driver rejects anything below 90 seconds
+MONGO_MAX_STALENESS_SECONDS = max(90, int(os.getenv("MONGO_MAX_STALENESS_SECONDS", "90")))
+
+SECONDARY = SecondaryPreferred(max_staleness=MONGO_MAX_STALENESS_SECONDS)
+
+# Cluster and operation time of a primary read, for causal_session(after=...)
+ReadPoint = Tuple[Optional[dict], Optional[object]]
+
+
+def available_compressors(names: str) -> List[str]:
+    return [
+        name for name in (n.strip() for n in names.split(","))
+        if name in COMPRESSOR_MODULES and importlib.util.find_spec(COMPRESSOR_MODULES[name])
+    ]
+
+
+def client_options() -> dict:
+    """Keyword arguments for AsyncIOMotorClient from the MONGO_* settings"""
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "appname": MONGO_APP_NAME,
+    }
+    compressors = available_compressors(MONGO_COMPRESSORS)
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+
+def create_client(url: str, **kwargs) -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(url, **{**client_options(), **kwargs})
+
+
+def secondary(db):
+    """`db` with reads sent to a secondary when one is fresh enough, else the primary"""
+    if not MONGO_SECONDARY_READS:
+        return db
+    return db.with_options(read_preference=SECONDARY)
+
+
+@asynccontextmanager
+async def causal_session(db, after: Optional[ReadPoint] = None):
+    """Causally consistent session whose reads see at least everything up to `after`.
+
+    Yields None when secondary reads are disabled, since every read then goes
+    to the primary anyway.
+    """
+    if not MONGO_SECONDARY_READS:
+        yield None
+        return
+    async with await db.client.start_session(causal_consistency=True) as session:
+        cluster_time, operation_time = after or (None, None)
+        # Standalone servers report neither
+        if cluster_time is not None:
+            session.advance_cluster_time(cluster_time)
+        if operation_time is not None:
+            session.advance_operation_time(operation_time)
+        yield session
+
+
+def read_point(session) -> Optional[ReadPoint]:
+    """Where a later causal_session must start to observe `session`'s reads"""
+    if session is None:
+        return None
+    return session.cluster_time, session.operation_time
@@ -0,0 +1,98 @@
+"""
+Backfill users.email_normalized and users.username_normalized.
+
+Registration and profile updates rely on unique indexes over these fields to
+reject duplicates. Users created before the fields existed are filled in here
+in batches; ensure_indexes runs the same backfill on startup. Users whose
+normalized email or username collides with another account get whichever
+field does not collide, and are reported so they can be resolved by hand.
+
+Usage:
+    python normalize_user_keys.py [--batch-size 500]
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from auth import normalize_identifier
+from indexes import ensure_indexes
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+def _normalized(user: dict) -> dict:
+    return {
+        "email_normalized": normalize_identifier(user["email"]),
+        "username_normalized": normalize_identifier(user["username"])
+    }
+
+
+async def backfill(db, batch_size: int, report=print):
+    updated = 0
+    conflicts = []
+    last_id = None
+
+    while True:
+        query = {"$or": [
+            {"email_normalized": {"$exists": False}},
+            {"username_normalized": {"$exists": False}}
+        ]}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        users = await db.users.find(query, {"email": 1, "username": 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not users:
+            break
+        last_id = users[-1]["_id"]
+
+        ops = [UpdateOne({"_id": user["_id"]}, {"$set": _normalized(user)}) for user in users]
+        try:
+            result = await db.users.bulk_write(ops, ordered=False)
+            updated += result.modified_count
+        except BulkWriteError as e:
+            updated += e.details.get("nModified", 0)
+            for error in e.details.get("writeErrors", []):
+                user = users[error["index"]]
+                conflicts.append(user)
+                # Claim the field that does not collide, so new signups cannot take it
+                for field, value in _normalized(user).items():
+                    try:
+                        await db.users.update_one({"_id": user["_id"]}, {"$set": {field: value}})
+                    except DuplicateKeyError:
+                        pass
+        report(f"  normalized {updated} users so far")
+
+    return updated, conflicts
+
+
+async def main(batch_size: int):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    print("=" * 60)
+    print("BACKFILLING NORMALIZED USER EMAILS AND USERNAMES")
+    print("=" * 60)
+
+    await ensure_indexes(db, backfill=False)
+    updated, conflicts = await backfill(db, batch_size)
+
+    print(f"\n✅ Normalized {updated} users")
+    if conflicts:
+        print(f"⚠️  {len(conflicts)} users collide with an existing account:")
+        for user in conflicts:
+            print(f"   {user['_id']}  {user.get('email')}  {user.get('username')}")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size))
@@ -0,0 +1,56 @@
+"""
+Opaque keyset cursors for paginated endpoints.
+
+A cursor encodes the sort value and `_id` of the last item on a page so the
+next page can be fetched with an index range scan instead of `skip`.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+
+def encode_cursor(sort_value, doc_id) -> str:
+    """Encode the last item's sort value and id into an opaque cursor"""
+    if isinstance(sort_value, datetime):
+        payload = {"t": sort_value.isoformat(), "id": str(doc_id)}
+    else:
+        payload = {"v": sort_value, "id": str(doc_id)}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if "t" in payload:
+            payload["v"] = datetime.fromisoformat(payload.pop("t"))
+        payload["id"] = ObjectId(payload["id"])
+        return payload
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(sort_field: str, cursor: Optional[str]) -> dict:
+    """Build the match filter for items after `cursor` in (sort_field desc, _id desc) order"""
+    if not cursor:
+        return {}
+    position = decode_cursor(cursor)
+    return {"$or": [
+        {sort_field: {"$lt": position["v"]}},
+        {sort_field: position["v"], "_id": {"$lt": position["id"]}}
+    ]}
+
+
+def page_of(items: list, limit: int, sort_field: str):
+    """Trim a limit+1 result to one page and build the cursor for the next page"""
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    last = items[-1]
+    return items, encode_cursor(last.get(sort_field), last["_id"])
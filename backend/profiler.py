@@ -0,0 +1,153 @@
+"""
+On-demand statistical profiling of a running worker.
+
+Nothing is installed until a profile is requested: the sampler (pyinstrument
+when it is installed, otherwise a SIGPROF stack sampler) runs for a bounded
+window and is removed afterwards. Stacks are returned in the collapsed format
+read by flamegraph.pl and speedscope, together with the event-loop scheduling
+delay measured over the same window.
+
+Python delivers signals between bytecodes, so the signal sampler records a
+long-running C call (bcrypt, PIL) as a single sample when it returns; the loop
+lag report shows how long such calls held the loop.
+"""
+import asyncio
+import signal
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:
+    PyinstrumentProfiler = None
+
+MAX_PROFILE_SECONDS = 60
+
+# Only one profile per worker at a time; samplers are process-wide
+_profile_lock = asyncio.Lock()
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})"
+
+
+class SignalSampler:
+    """Samples the main thread's stack on SIGPROF, i.e. every `interval` of CPU time"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._previous_handler = None
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        if threading.current_thread() is not threading.main_thread():
+            raise RuntimeError("The signal sampler must be started from the main thread")
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class PyinstrumentSampler:
+    """pyinstrument session rendered as collapsed stacks weighted in milliseconds"""
+
+    def __init__(self, interval: float):
+        self._profiler = PyinstrumentProfiler(interval=interval, async_mode="disabled")
+        self._session = None
+
+    def start(self):
+        self._profiler.start()
+
+    def stop(self):
+        self._session = self._profiler.stop()
+
+    def collapsed(self) -> str:
+        lines = []
+
+        def walk(frame, path):
+            label = f"{frame.function} ({frame.file_path_short}:{frame.line_no})"
+            path = f"{path};{label}" if path else label
+            self_ms = round(frame.total_self_time * 1000)
+            if self_ms:
+                lines.append((path, self_ms))
+            for child in frame.children:
+                walk(child, path)
+
+        root = self._session.root_frame() if self._session else None
+        if root is not None:
+            walk(root, "")
+        return "\n".join(f"{path} {weight}" for path, weight in sorted(lines, key=lambda line: -line[1]))
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def lag_report(lags: List[float]) -> Dict[str, float]:
+    """Summary of event-loop scheduling delays, in milliseconds"""
+    return {
+        "samples": len(lags),
+        "mean_ms": round(sum(lags) / len(lags) * 1000, 2) if lags else 0.0,
+        "p50_ms": round(_percentile(lags, 0.50) * 1000, 2),
+        "p95_ms": round(_percentile(lags, 0.95) * 1000, 2),
+        "p99_ms": round(_percentile(lags, 0.99) * 1000, 2),
+        "max_ms": round(max(lags) * 1000, 2) if lags else 0.0,
+    }
+
+
+async def measure_loop_lag(seconds: float, interval: float = 0.01) -> List[float]:
+    """How late the loop wakes a sleeping task, sampled every `interval` for `seconds`"""
+    lags = []
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+    while loop.time() < deadline:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected))
+    return lags
+
+
+async def run_profile(seconds: float, interval: float, engine: str = "auto") -> dict:
+    """Sample this worker for `seconds` and return collapsed stacks plus a loop lag report"""
+    if engine == "auto":
+        engine = "pyinstrument" if PyinstrumentProfiler is not None else "signal"
+    if engine == "pyinstrument" and PyinstrumentProfiler is None:
+        raise RuntimeError("pyinstrument is not installed")
+    sampler = PyinstrumentSampler(interval) if engine == "pyinstrument" else SignalSampler(interval)
+
+    async with _profile_lock:
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            lags = await measure_loop_lag(seconds)
+        finally:
+            sampler.stop()
+        return {
+            "engine": engine,
+            "seconds": round(time.perf_counter() - started, 3),
+            "interval_ms": interval * 1000,
+            "collapsed": sampler.collapsed(),
+            "loop_lag": lag_report(lags),
+        }
+
+
+def is_running() -> bool:
+    """Whether a profile is already in progress in this worker"""
+    return _profile_lock.locked()
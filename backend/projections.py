@@ -0,0 +1,73 @@
+"""
+Sparse fieldsets for cigar read endpoints.
+
+Clients pick fields with `fields=`: either a preset name (`card`, `detail`,
+`full`) or a comma-separated list from CIGAR_FIELDS. Anything other than
+`full` leaves out the base64 image bytes and returns `image_url` instead,
+pointing at GET /api/cigars/{id}/image. Cigars whose image lives in the image
+store (`image_id`) always get an `image_url`.
+"""
+from typing import Optional
+
+from fastapi import HTTPException
+
+CIGAR_FIELDS = {
+    "name", "brand", "image", "images", "strength", "flavor_notes", "origin",
+    "wrapper", "binder", "filler", "size", "length", "ring_gauge", "description", "price_range", "barcode",
+    "average_rating", "rating_count", "favorite_count", "created_at",
+    "added_by", "added_by_user", "user_submitted", "image_updated_at",
+}
+
+IMAGE_FIELDS = {"image", "images"}
+
+PRESETS = {
+    "card": {"name", "brand", "strength", "origin", "average_rating", "rating_count", "price_range"},
+    "detail": CIGAR_FIELDS - IMAGE_FIELDS,
+    "full": None,
+}
+
+DEFAULT_PRESET = "detail"
+
+# Projection expression telling whether a cigar has an image without reading it out
+HAS_IMAGE = {"$or": [
+    {"$gt": [{"$strLenBytes": {"$ifNull": ["$image", ""]}}, 0]},
+    {"$eq": [{"$type": "$image_id"}, "string"]},
+]}
+
+
+def cigar_projection(fields: Optional[str]) -> Optional[dict]:
+    """Mongo projection for a `fields=` value; None means the whole document"""
+    fields = (fields or DEFAULT_PRESET).strip()
+    if fields in PRESETS:
+        selected = PRESETS[fields]
+    else:
+        selected = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = selected - CIGAR_FIELDS
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+            )
+
+    if selected is None:
+        return None
+    projection = {field: 1 for field in selected - {"added_by_user"}}
+    if "added_by_user" in selected:
+        # Resolved from the adder's id when the cigar is read
+        projection["added_by"] = 1
+    if "image" not in selected:
+        projection["has_image"] = HAS_IMAGE
+    return projection
+
+
+def image_url(cigar_id: str) -> str:
+    return f"/api/cigars/{cigar_id}/image"
+
+
+def add_image_url(cigar: dict) -> dict:
+    """Replace the has_image flag added by cigar_projection, or a stored image_id, with an image URL"""
+    if "has_image" in cigar:
+        cigar["image_url"] = image_url(cigar["id"]) if cigar.pop("has_image") else None
+    if cigar.pop("image_id", None):
+        cigar["image_url"] = image_url(cigar["id"])
+    return cigar
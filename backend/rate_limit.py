@@ -0,0 +1,101 @@
+"""
+Sliding-window rate limiting for expensive unauthenticated endpoints.
+
+Counts are kept per key in fixed windows and the previous window is weighted by
+how much of it still overlaps the sliding window, which approximates a true
+sliding log with two counters per key. Counters live in a pluggable backend:
+`LocalBackend` keeps them in process (single worker, tests) and `MongoBackend`
+shares them between workers through the rate_limits collection.
+"""
+import math
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+
+
+class LocalBackend:
+    """In-process counters"""
+
+    def __init__(self):
+        self._counts = {}
+
+    async def increment(self, key: str, window: int, window_seconds: int) -> Tuple[int, int]:
+        """Add a hit to `window` and return (current, previous) window counts"""
+        current = self._counts.get((key, window), 0) + 1
+        self._counts[(key, window)] = current
+        previous = self._counts.get((key, window - 1), 0)
+        self._prune(window)
+        return current, previous
+
+    def _prune(self, window: int):
+        if len(self._counts) > 10000:
+            self._counts = {k: v for k, v in self._counts.items() if k[1] >= window - 1}
+
+
+class MongoBackend:
+    """Counters shared by every worker, expired by a TTL index on expires_at"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def increment(self, key: str, window: int, window_seconds: int) -> Tuple[int, int]:
+        expires_at = datetime.utcnow() + timedelta(seconds=2 * window_seconds)
+        doc = await self.collection.find_one_and_update(
+            {"_id": f"{key}:{window}"},
+            {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": expires_at}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        previous = await self.collection.find_one({"_id": f"{key}:{window - 1}"}, {"count": 1})
+        return doc["count"], previous["count"] if previous else 0
+
+
+class SlidingWindowLimiter:
+    """Allow at most `limit` hits per key in any `window_seconds` period"""
+
+    def __init__(self, backend, limit: int, window_seconds: int):
+        self.backend = backend
+        self.limit = limit
+        self.window_seconds = window_seconds
+
+    async def hit(self, key: str) -> Optional[int]:
+        """Record a hit; returns seconds to wait if the key is over the limit"""
+        now = time.time()
+        window = int(now // self.window_seconds)
+        elapsed = (now % self.window_seconds) / self.window_seconds
+
+        current, previous = await self.backend.increment(key, window, self.window_seconds)
+        estimated = previous * (1 - elapsed) + current
+        if estimated <= self.limit:
+            return None
+        return max(1, math.ceil((1 - elapsed) * self.window_seconds))
+
+
+# Trust the last X-Forwarded-For hop. Only enable this behind our own ingress,
+# which appends that hop; a client reaching the app directly could set it to
+# anything and dodge per-IP limits
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+
+def client_ip(request: Request) -> str:
+    """Best-effort client address for per-IP limits"""
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def enforce(limiter: SlidingWindowLimiter, key: str):
+    """Raise 429 with Retry-After when `key` is over the limit"""
+    retry_after = await limiter.hit(key)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts, please try again later",
+            headers={"Retry-After": str(retry_after)}
+        )
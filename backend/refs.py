@@ -0,0 +1,70 @@
+"""
+Helpers for cigar references stored on ratings, comments, notes and favorites.
+
+References are written as native ObjectIds. Older documents stored them as hex
+strings; until `migrate_refs.py` has been run against a database, reads accept
+both forms (dual-read). Set DUAL_READ_STRING_REFS=false once the migration has
+completed to drop the compatibility paths.
+"""
+import logging
+import os
+from typing import Iterable, List
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+DUAL_READ_STRING_REFS = os.getenv("DUAL_READ_STRING_REFS", "true").lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+
+def to_object_id(value) -> ObjectId:
+    """Convert a reference from the API or a legacy document into an ObjectId"""
+    if isinstance(value, ObjectId):
+        return value
+    if not ObjectId.is_valid(value):
+        raise HTTPException(status_code=400, detail="Invalid cigar id")
+    return ObjectId(value)
+
+
+def stored_object_ids(values: Iterable) -> List[ObjectId]:
+    """Distinct ObjectIds of references read from the database, logging and skipping unparseable ones.
+
+    Unlike to_object_id, never raises: one bad legacy row must not fail a
+    response, least of all one that is already streaming.
+    """
+    ids = set()
+    for value in values:
+        if isinstance(value, ObjectId):
+            ids.add(value)
+        elif isinstance(value, str) and ObjectId.is_valid(value):
+            ids.add(ObjectId(value))
+        else:
+            logger.warning(f"Skipping unparseable cigar reference {value!r}")
+    return list(ids)
+
+
+def ref_filter(value):
+    """Match a reference field against a cigar id in whichever form it was stored"""
+    oid = to_object_id(value)
+    if DUAL_READ_STRING_REFS:
+        return {"$in": [oid, str(oid)]}
+    return oid
+
+
+def ref_lookup_stages(local_field: str = "cigar_id", as_field: str = "cigar_details") -> list:
+    """Pipeline stages joining `local_field` to cigars through the `_id` index"""
+    stages = []
+    if DUAL_READ_STRING_REFS:
+        stages.append({"$addFields": {local_field: {
+            "$convert": {"input": f"${local_field}", "to": "objectId", "onError": None, "onNull": None}
+        }}})
+    stages.append({
+        "$lookup": {
+            "from": "cigars",
+            "localField": local_field,
+            "foreignField": "_id",
+            "as": as_field
+        }
+    })
+    return stages
@@ -0,0 +1,279 @@
+"""
+Traffic replay against a synthetic dataset (see synthetic.py).
+
+Virtual users send a weighted mix of API calls: catalog reads dominate, and
+writes (ratings, favorites, notes, comments) are a minority, as in
+production. Cigars, users and search terms are drawn with the same Zipf skew
+the dataset was generated with, so hot documents stay hot. The dataset spec
+is read from `synthetic_meta`; tokens are minted locally with JWT_SECRET,
+which must match the server's.
+
+Usage:
+    python replay.py --url http://localhost:8001 --seconds 60 --concurrency 32
+    python replay.py --in-process --requests 5000 --mix search=50,get_cigar=50
+    python replay.py --url http://localhost:8001 --rps 200 --json replay.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+from auth import create_access_token  # noqa: E402
+from synthetic import (  # noqa: E402
+    CIGAR_ZIPF_S, COMMENT_TEMPLATES, NOTE_TEMPLATES, USER_ZIPF_S,
+    DatasetSpec, Zipf, load_manifest, popularity_order, sample_text, search_terms, synthetic_id
+)
+
+# Relative weights of each operation in the default mix
+ENDPOINT_MIX = {
+    "search": 30,
+    "get_cigar": 25,
+    "get_comments": 10,
+    "count": 5,
+    "my_ratings": 5,
+    "favorites": 5,
+    "create_rating": 10,
+    "add_favorite": 3,
+    "save_note": 3,
+    "create_comment": 4,
+}
+
+
+class TrafficModel:
+    """Draws cigars, users and search terms with the dataset's popularity skew; shared by all virtual users"""
+
+    def __init__(self, spec: DatasetSpec):
+        rng = random.Random(spec.seed)
+        self.seed = spec.seed
+        self.cigar_ids = [str(synthetic_id("cigar", i, spec.seed)) for i in popularity_order(spec.cigars, spec.seed, "cigar")]
+        self.user_indexes = popularity_order(spec.users, spec.seed, "user")
+        self.terms = search_terms(spec.seed)
+        self._cigars = Zipf(spec.cigars, CIGAR_ZIPF_S, rng)
+        self._users = Zipf(spec.users, USER_ZIPF_S, rng)
+        self._terms = Zipf(len(self.terms), CIGAR_ZIPF_S, rng)
+        self._tokens: Dict[int, str] = {}
+
+    def cigar_id(self, rng: random.Random) -> str:
+        return self.cigar_ids[self._cigars.sample(rng)]
+
+    def term(self, rng: random.Random) -> str:
+        return self.terms[self._terms.sample(rng)]
+
+    def auth(self, rng: random.Random) -> dict:
+        index = self.user_indexes[self._users.sample(rng)]
+        if index not in self._tokens:
+            user_id = str(synthetic_id("user", index, self.seed))
+            self._tokens[index] = create_access_token(user_id, f"loadtest{index:07d}")
+        return {"Authorization": f"Bearer {self._tokens[index]}"}
+
+
+@lru_cache(maxsize=1)
+def upload_photo() -> bytes:
+    """A phone-sized JPEG for the upload operation, built once"""
+    from PIL import Image
+    buffered = BytesIO()
+    Image.effect_noise((1600, 1200), 64).convert("RGB").save(buffered, format="JPEG", quality=90)
+    return buffered.getvalue()
+
+
+Operation = Callable[[httpx.AsyncClient, TrafficModel, random.Random], Awaitable[httpx.Response]]
+
+OPERATIONS: Dict[str, Operation] = {
+    "search": lambda c, m, r: c.get("/api/cigars/search", params={"q": m.term(r)}),
+    "get_cigar": lambda c, m, r: c.get(f"/api/cigars/{m.cigar_id(r)}"),
+    "get_comments": lambda c, m, r: c.get(f"/api/comments/{m.cigar_id(r)}"),
+    "count": lambda c, m, r: c.get("/api/cigars/count"),
+    "my_ratings": lambda c, m, r: c.get("/api/ratings/my-ratings", headers=m.auth(r)),
+    "favorites": lambda c, m, r: c.get("/api/favorites", headers=m.auth(r)),
+    "create_rating": lambda c, m, r: c.post(
+        "/api/ratings", headers=m.auth(r),
+        json={"cigar_id": m.cigar_id(r), "rating": round(r.uniform(5.0, 10.0), 1)}
+    ),
+    "add_favorite": lambda c, m, r: c.post(f"/api/favorites/{m.cigar_id(r)}", headers=m.auth(r)),
+    "save_note": lambda c, m, r: c.post(
+        f"/api/cigars/{m.cigar_id(r)}/my-note", headers=m.auth(r),
+        json={"note_text": sample_text(r, NOTE_TEMPLATES)}
+    ),
+    "create_comment": lambda c, m, r: c.post(
+        "/api/comments", headers=m.auth(r),
+        json={"cigar_id": m.cigar_id(r), "text": sample_text(r, COMMENT_TEMPLATES)}
+    ),
+    # Not in ENDPOINT_MIX: uploads are rare, but the benchmarks time them on their own
+    "upload_image": lambda c, m, r: c.post(
+        f"/api/cigars/{m.cigar_id(r)}/upload-image", headers=m.auth(r),
+        files={"file": ("cigar.jpg", upload_photo(), "image/jpeg")}
+    ),
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class TrafficReport:
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    errors: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    statuses: Dict[str, Dict[int, int]] = field(default_factory=lambda: defaultdict(lambda: defaultdict(int)))
+    elapsed: float = 0.0
+
+    def record(self, name: str, seconds: float, status: Optional[int]):
+        self.latencies[name].append(seconds)
+        if status is None or status >= 500:
+            self.errors[name] += 1
+        self.statuses[name][status or 0] += 1
+
+    def summary(self) -> dict:
+        """Per-operation and overall counts, error counts, latency percentiles (ms) and throughput"""
+        def describe(values: List[float], errors: int) -> dict:
+            return {
+                "count": len(values),
+                "errors": errors,
+                "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+                "rps": round(len(values) / self.elapsed, 1) if self.elapsed else 0.0,
+            }
+
+        operations = {name: describe(values, self.errors[name]) for name, values in sorted(self.latencies.items())}
+        everything = [v for values in self.latencies.values() for v in values]
+        return {
+            "seconds": round(self.elapsed, 2),
+            "total": describe(everything, sum(self.errors.values())),
+            "operations": operations,
+        }
+
+
+async def run_traffic(
+    client: httpx.AsyncClient,
+    spec: DatasetSpec,
+    mix: Dict[str, float] = ENDPOINT_MIX,
+    concurrency: int = 16,
+    seconds: Optional[float] = None,
+    requests: Optional[int] = None,
+    rps: Optional[float] = None,
+    seed: int = 0
+) -> TrafficReport:
+    """Drive `client` with `concurrency` virtual users until `seconds` pass or `requests` are sent"""
+    if seconds is None and requests is None:
+        raise ValueError("Pass seconds or requests")
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    model = TrafficModel(spec)
+    report = TrafficReport()
+    started = time.perf_counter()
+    deadline = started + seconds if seconds is not None else None
+    remaining = [requests if requests is not None else float("inf")]
+    next_slot = [started]
+
+    async def virtual_user(worker: int):
+        rng = random.Random(f"{seed}:{worker}")
+        while remaining[0] > 0 and (deadline is None or time.perf_counter() < deadline):
+            remaining[0] -= 1
+            if rps:
+                # Open-loop pacing: each request gets the next free slot
+                now = time.perf_counter()
+                slot = max(now, next_slot[0])
+                next_slot[0] = slot + 1 / rps
+                await asyncio.sleep(slot - now)
+            name = rng.choices(names, weights)[0]
+            begin = time.perf_counter()
+            try:
+                response = await OPERATIONS[name](client, model, rng)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = None
+            report.record(name, time.perf_counter() - begin, status)
+
+    await asyncio.gather(*(virtual_user(i) for i in range(concurrency)))
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def parse_mix(text: Optional[str]) -> Dict[str, float]:
+    if not text:
+        return ENDPOINT_MIX
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def print_summary(summary: dict):
+    print("=" * 72)
+    print(f"{'operation':16s} {'count':>8s} {'errors':>7s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'rps':>8s}")
+    rows = list(summary["operations"].items()) + [("TOTAL", summary["total"])]
+    for name, row in rows:
+        print(
+            f"{name:16s} {row['count']:>8d} {row['errors']:>7d} {row['p50_ms']:>9.1f} "
+            f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['rps']:>8.1f}"
+        )
+    print(f"⏱️  {summary['seconds']}s")
+    print("=" * 72)
+
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    spec = await load_manifest(client[os.environ['DB_NAME']])
+    client.close()
+    if spec is None:
+        raise SystemExit("❌ No synthetic dataset found; run synthetic.py first")
+    print(f"🎯 Replaying against {spec}")
+
+    if args.in_process:
+        import server
+        transport = httpx.ASGITransport(app=server.app)
+        http = httpx.AsyncClient(transport=transport, base_url="http://replay")
+    else:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        http = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30)
+
+    async with http:
+        report = await run_traffic(
+            http, spec, parse_mix(args.mix), args.concurrency,
+            seconds=args.seconds, requests=args.requests, rps=args.rps, seed=args.seed
+        )
+    summary = report.summary()
+    print_summary(summary)
+    if args.json:
+        Path(args.json).write_text(json.dumps(summary, indent=2))
+        print(f"📝 Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://localhost:8001")
+    target.add_argument("--in-process", action="store_true", help="Drive the FastAPI app directly instead of over HTTP")
+    parser.add_argument("--seconds", type=float, default=None)
+    parser.add_argument("--requests", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=16, help="Virtual users")
+    parser.add_argument("--rps", type=float, default=None, help="Cap the request rate instead of running flat out")
+    parser.add_argument("--mix", default=None, help="Weights like search=30,get_cigar=25 (default: ENDPOINT_MIX)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the request sequence")
+    parser.add_argument("--json", default=None, help="Write the summary to this file")
+    args = parser.parse_args()
+    if args.seconds is None and args.requests is None:
+        args.seconds = 30
+    asyncio.run(main(args))
@@ -0,0 +1,66 @@
+"""
+First-run catalog seeding.
+
+Loads the curated cigars and the generated catalog into an empty `cigars`
+collection through the catalog importer. The seed data modules are large, so
+the API only imports this module from its startup hook when the collection is
+empty (SEED_ON_STARTUP); deployments that disable that run it explicitly, or
+use `python cigarctl.py seed`, which also refreshes a non-empty catalog.
+
+Usage:
+    python seed.py
+"""
+import asyncio
+import logging
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from catalog_import import import_cigars
+from cigar_seed_data import get_cigar_seed_data
+from generate_cigars import get_generated_cigars
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+
+async def seed_catalog(db) -> int:
+    """Insert the seed catalog if `cigars` is empty; returns how many cigars were added"""
+    count = await db.cigars.count_documents({})
+    if count:
+        return 0
+
+    logger.info("Seeding database with comprehensive cigar collection...")
+    
+    # Get curated cigars (45 premium cigars with details)
+    curated_cigars = get_cigar_seed_data()
+    
+    # Get generated cigars (1000 varied cigars)
+    generated_cigars = get_generated_cigars()
+    
+    # Generated names can repeat; the importer keeps the first cigar per brand+name
+    stats = await import_cigars(db, curated_cigars + generated_cigars)
+    
+    logger.info(f"Seeded {stats.inserted} cigars successfully ({len(curated_cigars)} curated + {len(generated_cigars)} generated, {stats.duplicates} repeated names skipped)")
+    return stats.inserted
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    added = await seed_catalog(db)
+    if added:
+        print(f"✅ Seeded {added} cigars")
+    else:
+        print("ℹ️  Catalog already has cigars, nothing to seed")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
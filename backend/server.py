@@ -1,8 +1,10 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, File, UploadFile, Form
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, File, UploadFile, Form, Query, Request, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
+import asyncio
 import logging
 from pathlib import Path
 from typing import List, Optional
@@ -17,33 +19,83 @@ from models import (
     UserCreate, UserLogin, UserProfile, UserUpdate,
     CigarCreate, CigarResponse, RatingCreate, RatingResponse,
     CommentCreate, CommentResponse, SearchQuery,
-    LabelScanRequest, BarcodeScanRequest, StorePrice,
-    NoteCreate, NoteResponse
+    LabelScanRequest, BarcodeScanRequest, CigarBatchRequest, StorePrice,
+    NoteCreate, NoteResponse, CigarCard, CommentNode
 )
-from auth import hash_password, verify_password, create_access_token, get_current_user
-
-# Import AI integration
-from emergentintegrations.llm.chat import LlmChat, UserMessage, ImageContent
-
-# Import cigar images
-from cigar_images_data import MONTECRISTO_IMAGE, PADRON_IMAGE, ARTURO_IMAGE, COHIBA_IMAGE, LIGA_IMAGE
-from cigar_seed_data import get_cigar_seed_data
-from generate_cigars import get_generated_cigars
+from auth import (
+    hash_password, verify_password, create_access_token, get_current_user, get_current_admin,
+    get_current_principal, revoke_token, deny_list, security, Principal, normalize_identifier
+)
+from fastapi.security import HTTPAuthorizationCredentials
+from pagination import keyset_filter, page_of
+from streaming import STREAM_BATCH_SIZE, stream_response, stream_rows
+from refs import ref_filter, ref_lookup_stages, stored_object_ids, to_object_id
+from indexes import ensure_indexes
+from encoding import ORJSONResponse, orjson_response
+from projections import HAS_IMAGE, add_image_url, cigar_projection, image_url
+from catalog import (
+    catalog_version, changes_since, decode_sync_token, encode_sync_token,
+    record_change, touched, versioned
+)
+from http_cache import conditional, make_etag
+from image_store import load_image
+from invalidation import bus, publish, worker_cache
+from text_search import highlight_snippet
+from rate_limit import LocalBackend, MongoBackend, SlidingWindowLimiter, client_ip, enforce
+from profiler import MAX_PROFILE_SECONDS, is_running as profile_running, run_profile
+from loop_watchdog import watchdog
+from metrics import PROMETHEUS_MEDIA_TYPE, TimingMiddleware, command_listener, pool_listener, render as render_metrics
+from mongo_client import causal_session, create_client, read_point, secondary
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection; pool, timeouts and compression are set in mongo_client.py
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = create_client(mongo_url, event_listeners=[command_listener, pool_listener])
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Favorite ids returned with the user on login, /auth/me and profile updates
+FAVORITE_IDS_LIMIT = int(os.getenv("FAVORITE_IDS_LIMIT", "500"))
+
+# Number of previous versions kept on each tasting note (0 disables history)
+NOTE_REVISION_LIMIT = int(os.getenv("NOTE_REVISION_LIMIT", "0"))
+
+# How often revoked tokens are re-read from MongoDB
+DENY_LIST_SYNC_SECONDS = int(os.getenv("DENY_LIST_SYNC_SECONDS", "30"))
+
+# Event-loop lag watchdog (see loop_watchdog.py for its thresholds)
+LOOP_WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG", "true").lower() == "true"
+
+# Seed an empty catalog on startup; otherwise run `python seed.py` explicitly
+SEED_ON_STARTUP = os.getenv("SEED_ON_STARTUP", "true").lower() == "true"
+
+# Most cigars resolved by one POST /api/cigars/batch call
+CIGAR_BATCH_LIMIT = int(os.getenv("CIGAR_BATCH_LIMIT", "100"))
+
+# Login/registration throttling; set RATE_LIMIT_BACKEND=mongo to share counters between workers
+rate_limit_backend = (
+    MongoBackend(db.rate_limits) if os.getenv("RATE_LIMIT_BACKEND", "local") == "mongo" else LocalBackend()
+)
+auth_ip_limiter = SlidingWindowLimiter(
+    rate_limit_backend, int(os.getenv("AUTH_IP_LIMIT", "30")), int(os.getenv("AUTH_IP_WINDOW_SECONDS", "60"))
+)
+auth_email_limiter = SlidingWindowLimiter(
+    rate_limit_backend, int(os.getenv("AUTH_EMAIL_LIMIT", "10")), int(os.getenv("AUTH_EMAIL_WINDOW_SECONDS", "300"))
+)
+
+# Per-worker caches, kept consistent between workers by the invalidation bus
+catalog_cache = worker_cache("catalog", int(os.getenv("CATALOG_CACHE_SIZE", "1024")), catalog=False)
+cigar_cache = worker_cache("cigar", int(os.getenv("CIGAR_CACHE_SIZE", "4096")), catalog=True, users=True)
+ratings_cache = worker_cache("ratings", int(os.getenv("RATINGS_CACHE_SIZE", "4096")), ratings=True)
+author_cache = worker_cache("authors", int(os.getenv("AUTHOR_CACHE_SIZE", "10000")), users=True)
+
 # Get Emergent LLM key
 EMERGENT_LLM_KEY = os.getenv("EMERGENT_LLM_KEY")
 
@@ -57,45 +109,140 @@ logger = logging.getLogger(__name__)
 
 # Helper functions
 def serialize_doc(doc):
-    """Convert MongoDB document to JSON-serializable format"""
+    """Convert MongoDB document to JSON-serializable format.
+    
+    Returns a new dict and leaves the Motor document untouched. Cigar
+    references are stored as ObjectIds; the API exposes them as strings.
+    """
     if doc is None:
         return None
-    doc['id'] = str(doc['_id'])
-    del doc['_id']
-    return doc
+    result = {
+        key: str(value) if isinstance(value, ObjectId) else value
+        for key, value in doc.items() if key != '_id'
+    }
+    result['id'] = str(doc['_id'])
+    return result
+
+
+ADDED_BY_USER_PROJECTION = {"username": 1, "profile_pic": 1, "profile_updated_at": 1}
+
+
+async def load_authors(user_ids) -> dict:
+    """Username, picture and when either last changed per user id, reading only users this worker has not cached"""
+    generation = author_cache.generation
+    user_ids = {uid for uid in user_ids if uid and ObjectId.is_valid(uid)}
+    user_map = {uid: author_cache.get(uid) for uid in user_ids}
+    user_map = {uid: user_info for uid, user_info in user_map.items() if user_info}
+    missing = [uid for uid in user_ids if uid not in user_map]
+    if missing:
+        users = await db.users.find(
+            {"_id": {"$in": [ObjectId(uid) for uid in missing]}},
+            ADDED_BY_USER_PROJECTION
+        ).to_list(len(missing))
+        for u in users:
+            uid = str(u['_id'])
+            user_map[uid] = {
+                'username': u['username'],
+                'profile_pic': u.get('profile_pic'),
+                'updated_at': u.get('profile_updated_at')
+            }
+            author_cache.set(uid, user_map[uid], generation, [uid])
+    return user_map
+
+
+def with_added_by_user(cigar_data: dict, authors: dict) -> dict:
+    """Attach the current username and picture of the user who added a cigar"""
+    # Older cigars carry a stored snapshot, which goes stale on rename
+    cigar_data.pop("added_by_user", None)
+    author = authors.get(cigar_data.get("added_by"))
+    if author:
+        cigar_data["added_by_user"] = {
+            "id": cigar_data["added_by"],
+            "username": author["username"],
+            "profile_pic": author["profile_pic"]
+        }
+    return cigar_data
+
+
+async def legacy_favorite_ids(user_id: str, limit: int) -> List[ObjectId]:
+    """Newest `limit` entries of a users.favorites array not yet moved by migrate_favorites.py"""
+    user = await db.users.find_one({"_id": ObjectId(user_id)}, {"favorites": {"$slice": -limit}})
+    ids = []
+    # Later array entries are newer
+    for cigar_id in reversed((user or {}).get("favorites") or []):
+        if isinstance(cigar_id, str) and ObjectId.is_valid(cigar_id):
+            cigar_id = ObjectId(cigar_id)
+        if isinstance(cigar_id, ObjectId):
+            ids.append(cigar_id)
+    return ids
+
+
+async def get_favorite_ids(user_id: str) -> List[str]:
+    """Get the ids of a user's most recent favorite cigars, newest first"""
+    favorites = await db.favorites.find(
+        {"user_id": user_id},
+        {"_id": 0, "cigar_id": 1}
+    ).sort("added_at", -1).limit(FAVORITE_IDS_LIMIT).to_list(FAVORITE_IDS_LIMIT)
+    if not favorites:
+        return [str(cigar_id) for cigar_id in await legacy_favorite_ids(user_id, FAVORITE_IDS_LIMIT)]
+    return [str(f["cigar_id"]) for f in favorites]
+
+
+async def cached_catalog_version():
+    """catalog_version() and the point a secondary read must reach to agree with it,
+    served from this worker's cache between catalog writes"""
+    generation = catalog_cache.generation
+    entry = catalog_cache.get("version")
+    if entry is None:
+        async with causal_session(db) as session:
+            version, changed_at = await catalog_version(db, session)
+            entry = (version, changed_at, read_point(session))
+        catalog_cache.set("version", entry, generation)
+    return entry
+
+
+def image_media_type(image_bytes: bytes) -> str:
+    """Guess the media type of a stored cigar image from its magic bytes"""
+    if image_bytes.startswith(b'\x89PNG'):
+        return "image/png"
+    if image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        return "image/webp"
+    return "image/jpeg"
 
 
 # ==================== Authentication Endpoints ====================
 
 @api_router.post("/auth/register")
-async def register(user_data: UserCreate):
+async def register(user_data: UserCreate, request: Request):
     """Register a new user"""
-    # Check if user already exists
-    existing_user = await db.users.find_one({"email": user_data.email})
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
-    existing_username = await db.users.find_one({"username": user_data.username})
-    if existing_username:
-        raise HTTPException(status_code=400, detail="Username already taken")
+    # Throttle before any database or bcrypt work
+    await enforce(auth_ip_limiter, f"register:ip:{client_ip(request)}")
+    await enforce(auth_email_limiter, f"register:email:{normalize_identifier(user_data.email)}")
     
-    # Create new user
+    # Create new user; the unique indexes on the normalized email and
+    # username reject duplicates, including concurrent signups
     hashed_password = hash_password(user_data.password)
     user_doc = {
         "username": user_data.username,
+        "username_normalized": normalize_identifier(user_data.username),
         "email": user_data.email,
+        "email_normalized": normalize_identifier(user_data.email),
         "password_hash": hashed_password,
         "profile_pic": None,
         "preferences": {},
-        "favorites": [],
         "created_at": datetime.utcnow()
     }
     
-    result = await db.users.insert_one(user_doc)
+    try:
+        result = await db.users.insert_one(user_doc)
+    except DuplicateKeyError as e:
+        if "email_normalized" in (e.details or {}).get("keyPattern", {}):
+            raise HTTPException(status_code=400, detail="Email already registered")
+        raise HTTPException(status_code=400, detail="Username already taken")
     user_id = str(result.inserted_id)
     
     # Create JWT token
-    token = create_access_token(user_id)
+    token = create_access_token(user_id, user_data.username)
     
     return {
         "token": token,
@@ -108,9 +255,17 @@ async def register(user_data: UserCreate):
 
 
 @api_router.post("/auth/login")
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, request: Request):
     """Login user"""
-    user = await db.users.find_one({"email": credentials.email})
+    # Throttle before any database or bcrypt work
+    await enforce(auth_ip_limiter, f"login:ip:{client_ip(request)}")
+    await enforce(auth_email_limiter, f"login:email:{normalize_identifier(credentials.email)}")
+    
+    # Users created before email_normalized existed are still matched on email
+    user = await db.users.find_one({"$or": [
+        {"email_normalized": normalize_identifier(credentials.email)},
+        {"email": credentials.email}
+    ]})
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
@@ -118,7 +273,7 @@ async def login(credentials: UserLogin):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     user_id = str(user['_id'])
-    token = create_access_token(user_id)
+    token = create_access_token(user_id, user['username'], user.get('role', 'user'))
     
     return {
         "token": token,
@@ -128,15 +283,28 @@ async def login(credentials: UserLogin):
             "email": user['email'],
             "profile_pic": user.get('profile_pic'),
             "preferences": user.get('preferences', {}),
-            "favorites": user.get('favorites', [])
+            "favorites": await get_favorite_ids(user_id)
         }
     }
 
 
+@api_router.post("/auth/logout")
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Revoke the current token for every worker"""
+    payload = revoke_token(credentials.credentials)
+    if payload.get("jti"):
+        await db.revoked_tokens.update_one(
+            {"jti": payload["jti"]},
+            {"$setOnInsert": {"expires_at": datetime.utcfromtimestamp(payload["exp"])}},
+            upsert=True
+        )
+    return {"success": True, "message": "Logged out"}
+
+
 @api_router.get("/auth/me")
 async def get_me(user_id: str = Depends(get_current_user)):
     """Get current user profile"""
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
+    user = await db.users.find_one({"_id": ObjectId(user_id)}, {"password_hash": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -146,46 +314,48 @@ async def get_me(user_id: str = Depends(get_current_user)):
         "email": user['email'],
         "profile_pic": user.get('profile_pic'),
         "preferences": user.get('preferences', {}),
-        "favorites": user.get('favorites', [])
+        "favorites": await get_favorite_ids(user_id)
     }
 
 
 @api_router.get("/users/{user_id}")
 async def get_user_profile(user_id: str):
     """Get public user profile by ID"""
+    # Public profiles tolerate bounded staleness, so read them from a secondary
+    reader = secondary(db)
     try:
-        user = await db.users.find_one({"_id": ObjectId(user_id)})
+        user = await reader.users.find_one({"_id": ObjectId(user_id)})
         
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
         # Get cigars added by this user
-        added_cigars = await db.cigars.find(
+        added_cigars = await reader.cigars.find(
             {"added_by": user_id},
-            {"brand": 1, "name": 1, "image": 1, "average_rating": 1, "rating_count": 1}
+            {"brand": 1, "name": 1, "image": 1, "image_id": 1, "average_rating": 1, "rating_count": 1}
         ).sort("created_at", -1).limit(10).to_list(10)
         
         # Get cigars rated by this user
-        user_ratings = await db.ratings.find(
+        user_ratings = await reader.ratings.find(
             {"user_id": user_id}
         ).sort("created_at", -1).limit(10).to_list(10)
         
         # Get cigar details for rated cigars
-        rated_cigar_ids = [ObjectId(r["cigar_id"]) for r in user_ratings]
-        rated_cigars_data = await db.cigars.find(
+        rated_cigar_ids = stored_object_ids(r["cigar_id"] for r in user_ratings)
+        rated_cigars_data = await reader.cigars.find(
             {"_id": {"$in": rated_cigar_ids}},
-            {"brand": 1, "name": 1, "image": 1, "average_rating": 1, "rating_count": 1}
+            {"brand": 1, "name": 1, "image": 1, "image_id": 1, "average_rating": 1, "rating_count": 1}
         ).to_list(len(rated_cigar_ids))
         
         # Create a map of cigar_id to rating
-        rating_map = {r["cigar_id"]: r["rating"] for r in user_ratings}
+        rating_map = {str(r["cigar_id"]): r["rating"] for r in user_ratings}
         
         # Combine cigar data with user ratings
         rated_cigars = []
         for cigar in rated_cigars_data:
             cigar_id = str(cigar["_id"])
             rated_cigars.append({
-                **serialize_doc(cigar),
+                **add_image_url(serialize_doc(cigar)),
                 "user_rating": rating_map.get(cigar_id, 0)
             })
         
@@ -194,9 +364,9 @@ async def get_user_profile(user_id: str):
             "id": str(user["_id"]),
             "username": user["username"],
             "profile_pic": user.get("profile_pic"),
-            "favorites": user.get("favorites", []),
+            "favorites_count": await reader.favorites.count_documents({"user_id": user_id}),
             "created_at": user.get("created_at", datetime.utcnow()).isoformat(),
-            "added_cigars": [serialize_doc(c) for c in added_cigars],
+            "added_cigars": [add_image_url(serialize_doc(c)) for c in added_cigars],
             "rated_cigars": rated_cigars
         }
     except HTTPException:
@@ -211,53 +381,85 @@ async def update_profile(update_data: UserUpdate, user_id: str = Depends(get_cur
     """Update user profile"""
     update_fields = {}
     if update_data.username:
-        # Check if username is taken
-        existing = await db.users.find_one({
-            "username": update_data.username,
-            "_id": {"$ne": ObjectId(user_id)}
-        })
-        if existing:
-            raise HTTPException(status_code=400, detail="Username already taken")
         update_fields['username'] = update_data.username
+        update_fields['username_normalized'] = normalize_identifier(update_data.username)
     
     if update_data.profile_pic:
         update_fields['profile_pic'] = update_data.profile_pic
     
+    if 'username' in update_fields or 'profile_pic' in update_fields:
+        # Part of the validators of cigar pages that show this user as the adder
+        update_fields['profile_updated_at'] = datetime.utcnow()
+    
     if update_data.preferences:
         update_fields['preferences'] = update_data.preferences
     
     if update_fields:
-        await db.users.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": update_fields}
-        )
+        # The unique username index rejects names already taken
+        try:
+            user = await db.users.find_one_and_update(
+                {"_id": ObjectId(user_id)},
+                {"$set": update_fields},
+                projection={"password_hash": 0},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="Username already taken")
+    else:
+        user = await db.users.find_one({"_id": ObjectId(user_id)}, {"password_hash": 0})
     
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
-    return {
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if 'username' in update_fields or 'profile_pic' in update_fields:
+        # Comment threads and cigar pages show the author's name and picture
+        await publish(db, "users", [user_id])
+        # Thread ETags only cover comment_version, so bump it on every thread the user posted in
+        commented = await db.comments.distinct("cigar_id", {"user_id": user_id})
+        cigar_oids = stored_object_ids(commented)
+        if cigar_oids:
+            await db.cigars.update_many({"_id": {"$in": cigar_oids}}, {"$inc": {"comment_version": 1}})
+    
+    profile = {
         "id": str(user['_id']),
         "username": user['username'],
         "email": user['email'],
         "profile_pic": user.get('profile_pic'),
         "preferences": user.get('preferences', {}),
-        "favorites": user.get('favorites', [])
+        "favorites": await get_favorite_ids(user_id)
     }
+    if 'username' in update_fields:
+        # Tokens carry the username, so hand out one with the new name
+        profile["token"] = create_access_token(user_id, user['username'], user.get('role', 'user'))
+    return profile
 
 
 # ==================== Cigar Endpoints ====================
 
 @api_router.get("/cigars/count")
-async def get_cigars_count():
+async def get_cigars_count(request: Request, response: Response):
     """Get total count of cigars in database"""
     try:
-        count = await db.cigars.count_documents({})
+        version, changed_at, after = await cached_catalog_version()
+        cached = conditional(request, response, "count", make_etag("count", version), changed_at)
+        if cached:
+            return cached
+        
+        generation = catalog_cache.generation
+        count = catalog_cache.get("count")
+        if count is None:
+            async with causal_session(db, after) as session:
+                count = await secondary(db).cigars.count_documents({}, session=session)
+            catalog_cache.set("count", count, generation)
         return {"count": count}
     except Exception as e:
         logger.error(f"Error getting cigar count: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get cigar count")
 
 
-@api_router.get("/cigars/search")
+@api_router.get("/cigars/search", response_model=List[CigarCard])
 async def search_cigars(
+    request: Request,
+    response: Response,
     q: Optional[str] = None,
     strength: Optional[str] = None,
     origin: Optional[str] = None,
@@ -267,6 +469,16 @@ async def search_cigars(
     max_price: Optional[float] = None
 ):
     """Search cigars with filters"""
+    version, changed_at, after = await cached_catalog_version()
+    cached = conditional(request, response, "search", make_etag("search", version, request.url.query), changed_at)
+    if cached:
+        return cached
+    
+    generation = catalog_cache.generation
+    cards = catalog_cache.get(("search", request.url.query))
+    if cards is not None:
+        return cards
+    
     query = {}
     
     if q:
@@ -311,40 +523,115 @@ async def search_cigars(
     
     # Optimized query with projection to fetch only necessary fields
     projection = {
-        "name": 1, "brand": 1, "image": 1, "strength": 1, 
+        "name": 1, "brand": 1, "image": 1, "image_id": 1, "strength": 1,
         "origin": 1, "average_rating": 1, "rating_count": 1, "price_range": 1
     }
     # Sort by average_rating descending (highest rating first)
-    cigars = await db.cigars.find(query, projection).sort("average_rating", -1).limit(50).to_list(50)
-    return [serialize_doc(cigar) for cigar in cigars]
+    # Read from a secondary that has caught up with the version in the ETag
+    async with causal_session(db, after) as session:
+        cigars = await secondary(db).cigars.find(query, projection, session=session).sort(
+            "average_rating", -1
+        ).limit(50).to_list(50)
+    cards = [add_image_url(serialize_doc(cigar)) for cigar in cigars]
+    catalog_cache.set(("search", request.url.query), cards, generation)
+    return cards
 
 
 @api_router.get("/cigars/{cigar_id}")
-async def get_cigar(cigar_id: str):
-    """Get cigar details"""
-    cigar = await db.cigars.find_one({"_id": ObjectId(cigar_id)})
+async def get_cigar(cigar_id: str, request: Request, response: Response, fields: Optional[str] = None):
+    """Get cigar details (image bytes only with fields=full)"""
+    projection = cigar_projection(fields)
+    generation = cigar_cache.generation
+    entry = cigar_cache.get((cigar_id, fields))
+    
+    authors = {}
+    if entry:
+        etag, last_modified, cigar_data = entry
+    else:
+        # Validate the client's copy against the version fields before reading the document
+        meta = await db.cigars.find_one(
+            {"_id": ObjectId(cigar_id)},
+            {"version": 1, "updated_at": 1, "created_at": 1, "added_by": 1}
+        )
+        if not meta:
+            raise HTTPException(status_code=404, detail="Cigar not found")
+        last_modified = meta.get("updated_at") or meta.get("created_at")
+        # The adder's name and picture are part of the response, so their changes are too
+        author_changed_at = None
+        if meta.get("added_by"):
+            try:
+                authors = await load_authors([str(meta["added_by"])])
+            except Exception as e:
+                logger.error(f"Error fetching user who added cigar: {str(e)}")
+            author_changed_at = authors.get(str(meta["added_by"]), {}).get("updated_at")
+            if author_changed_at and (not last_modified or author_changed_at > last_modified):
+                last_modified = author_changed_at
+        etag = make_etag(
+            "cigar", cigar_id, meta.get("version", 0), meta.get("updated_at"), fields, author_changed_at
+        )
+    cached = conditional(request, response, "cigar", etag, last_modified)
+    if cached:
+        return cached
+    if entry:
+        return orjson_response(cigar_data, response)
+    
+    cigar = await db.cigars.find_one({"_id": ObjectId(cigar_id)}, projection)
     if not cigar:
         raise HTTPException(status_code=404, detail="Cigar not found")
     
-    cigar_data = serialize_doc(cigar)
+    cigar_data = add_image_url(serialize_doc(cigar))
     
     # If cigar was added by a user, include their info
-    if cigar.get("added_by"):
-        try:
-            user = await db.users.find_one(
-                {"_id": ObjectId(cigar["added_by"])},
-                {"username": 1, "profile_pic": 1}
-            )
-            if user:
-                cigar_data["added_by_user"] = {
-                    "id": str(user["_id"]),
-                    "username": user["username"],
-                    "profile_pic": user.get("profile_pic")
-                }
-        except Exception as e:
-            logger.error(f"Error fetching user who added cigar: {str(e)}")
+    cigar_data = with_added_by_user(cigar_data, authors)
     
-    return cigar_data
+    tags = [str(cigar["_id"])] + ([str(cigar["added_by"])] if cigar.get("added_by") else [])
+    cigar_cache.set((cigar_id, fields), (etag, last_modified, cigar_data), generation, tags)
+    return orjson_response(cigar_data, response)
+
+
+@api_router.post("/cigars/batch")
+async def get_cigars_batch(request: CigarBatchRequest):
+    """Get several cigars in the requested order with one query for cigars and one for their adders"""
+    if len(request.ids) > CIGAR_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {CIGAR_BATCH_LIMIT} ids per request")
+    projection = cigar_projection(request.fields)
+    
+    object_ids = list({ObjectId(cid) for cid in request.ids if ObjectId.is_valid(cid)})
+    if not object_ids:
+        return []
+    cigars = {
+        str(cigar["_id"]): cigar
+        async for cigar in db.cigars.find({"_id": {"$in": object_ids}}, projection)
+    }
+    
+    # Resolve all adders at once
+    adders = await load_authors(str(cigar["added_by"]) for cigar in cigars.values() if cigar.get("added_by"))
+    
+    results = []
+    for cid in request.ids:
+        cigar = cigars.get(cid)
+        if not cigar:
+            continue
+        results.append(with_added_by_user(add_image_url(serialize_doc(cigar)), adders))
+    return orjson_response(results)
+
+
+@api_router.get("/cigars/{cigar_id}/image")
+async def get_cigar_image(cigar_id: str):
+    """Serve a cigar's image as binary so list screens can reference it by URL"""
+    cigar = await db.cigars.find_one({"_id": ObjectId(cigar_id)}, {"image": 1, "image_id": 1})
+    if cigar and not cigar.get("image") and cigar.get("image_id"):
+        stored = await load_image(db, cigar["image_id"])
+        if stored:
+            return Response(content=stored["data"], media_type=stored["media_type"])
+    if not cigar or not cigar.get("image"):
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    image_bytes = base64.b64decode(cigar["image"])
+    return Response(
+        content=image_bytes,
+        media_type=image_media_type(image_bytes)
+    )
 
 
 @api_router.post("/cigars/{cigar_id}/upload-image")
@@ -392,15 +679,16 @@ async def upload_cigar_image(
         # Update cigar image in database
         result = await db.cigars.update_one(
             {"_id": ObjectId(cigar_id)},
-            {"$set": {
+            touched({"$set": {
                 "image": img_base64,
                 "image_updated_by": user_id,
                 "image_updated_at": datetime.utcnow()
-            }}
+            }})
         )
         
         if result.modified_count == 0:
             raise HTTPException(status_code=500, detail="Failed to update image")
+        await record_change(db, cigar_id)
         
         return {
             "success": True,
@@ -495,15 +783,16 @@ async def upload_cigar_image_base64(
         # Update cigar image in database
         result = await db.cigars.update_one(
             {"_id": ObjectId(cigar_id)},
-            {"$set": {
+            touched({"$set": {
                 "image": img_base64,
                 "image_updated_by": user_id,
                 "image_updated_at": datetime.utcnow()
-            }}
+            }})
         )
         
         if result.modified_count == 0:
             raise HTTPException(status_code=500, detail="Failed to update image")
+        await record_change(db, cigar_id)
         
         return {
             "success": True,
@@ -525,9 +814,10 @@ async def add_user_cigar(
     wrapper: str = Form(...),
     size: str = Form(...),
     price_range: str = Form(None),
-    user_id: str = Depends(get_current_user)
+    principal: Principal = Depends(get_current_principal)
 ):
     """Allow users to add cigars to the database"""
+    user_id = principal.user_id
     # Check if cigar already exists (case-insensitive exact match)
     existing = await db.cigars.find_one({
         "brand": {"$regex": f"^{brand}$", "$options": "i"},
@@ -564,8 +854,8 @@ async def add_user_cigar(
         "added_by": user_id,
         "user_submitted": True
     }
-    
-    result = await db.cigars.insert_one(cigar_doc)
+    result = await db.cigars.insert_one(versioned(cigar_doc))
+    await record_change(db, result.inserted_id, "create")
     
     return {
         "success": True,
@@ -582,15 +872,19 @@ async def create_cigar(cigar_data: CigarCreate, user_id: str = Depends(get_curre
     cigar_doc['rating_count'] = 0
     cigar_doc['created_at'] = datetime.utcnow()
     
-    result = await db.cigars.insert_one(cigar_doc)
+    result = await db.cigars.insert_one(versioned(cigar_doc))
+    await record_change(db, result.inserted_id, "create")
     cigar_doc['id'] = str(result.inserted_id)
     
     return cigar_doc
 
 
 @api_router.post("/cigars/ai-search")
-async def ai_search_cigar(request: dict):
+async def ai_search_cigar(request: dict, fields: Optional[str] = None):
     """Search for a cigar using AI to find details"""
+    from emergentintegrations.llm.chat import LlmChat, UserMessage
+    
+    projection = cigar_projection(fields)
     try:
         search_query = request.get("query", "")
         if not search_query:
@@ -651,14 +945,14 @@ Use your knowledge about cigars to fill in accurate details. If you don't know a
                 existing = await db.cigars.find_one({
                     "brand": {"$regex": f"^{brand}$", "$options": "i"},
                     "name": {"$regex": f"^{name}$", "$options": "i"}
-                })
+                }, projection)
                 
                 if existing:
                     return {
                         "found": True,
                         "cigar_info": cigar_info,
                         "exists_in_db": True,
-                        "existing_cigar": serialize_doc(existing),
+                        "existing_cigar": add_image_url(serialize_doc(existing)),
                         "message": "This cigar already exists in our database!"
                     }
             
@@ -682,8 +976,11 @@ Use your knowledge about cigars to fill in accurate details. If you don't know a
 
 
 @api_router.post("/cigars/scan-label")
-async def scan_label(request: LabelScanRequest):
+async def scan_label(request: LabelScanRequest, fields: Optional[str] = None):
     """Scan cigar label using AI vision"""
+    from emergentintegrations.llm.chat import LlmChat, UserMessage, ImageContent
+    
+    projection = cigar_projection(fields)
     try:
         # Use OpenAI Vision to identify the cigar
         chat = LlmChat(
@@ -738,11 +1035,11 @@ async def scan_label(request: LabelScanRequest):
                 if name:
                     query["$or"].append({"name": {"$regex": name, "$options": "i"}})
                 
-                cigar = await db.cigars.find_one(query)
+                cigar = await db.cigars.find_one(query, projection)
                 if cigar:
                     return {
                         "identified": True,
-                        "cigar": serialize_doc(cigar),
+                        "cigar": add_image_url(serialize_doc(cigar)),
                         "ai_info": cigar_info
                     }
             
@@ -765,13 +1062,13 @@ async def scan_label(request: LabelScanRequest):
 
 
 @api_router.post("/cigars/scan-barcode")
-async def scan_barcode(request: BarcodeScanRequest):
+async def scan_barcode(request: BarcodeScanRequest, fields: Optional[str] = None):
     """Scan barcode and find cigar"""
-    cigar = await db.cigars.find_one({"barcode": request.barcode})
+    cigar = await db.cigars.find_one({"barcode": request.barcode}, cigar_projection(fields))
     if cigar:
         return {
             "found": True,
-            "cigar": serialize_doc(cigar)
+            "cigar": add_image_url(serialize_doc(cigar))
         }
     
     # Try to lookup barcode in external API (free tier)
@@ -787,23 +1084,25 @@ async def scan_barcode(request: BarcodeScanRequest):
 @api_router.post("/ratings")
 async def create_rating(rating_data: RatingCreate, user_id: str = Depends(get_current_user)):
     """Create or update a rating"""
+    cigar_oid = to_object_id(rating_data.cigar_id)
+    
     # Check if user already rated this cigar
     existing_rating = await db.ratings.find_one({
         "user_id": user_id,
-        "cigar_id": rating_data.cigar_id
+        "cigar_id": ref_filter(cigar_oid)
     })
     
     if existing_rating:
-        # Update existing rating
+        # Update existing rating (and upgrade a legacy string reference)
         await db.ratings.update_one(
             {"_id": existing_rating['_id']},
-            {"$set": {"rating": rating_data.rating, "updated_at": datetime.utcnow()}}
+            {"$set": {"rating": rating_data.rating, "cigar_id": cigar_oid, "updated_at": datetime.utcnow()}}
         )
     else:
         # Create new rating
         rating_doc = {
             "user_id": user_id,
-            "cigar_id": rating_data.cigar_id,
+            "cigar_id": cigar_oid,
             "rating": rating_data.rating,
             "created_at": datetime.utcnow()
         }
@@ -811,7 +1110,7 @@ async def create_rating(rating_data: RatingCreate, user_id: str = Depends(get_cu
     
     # Recalculate average rating for the cigar
     pipeline = [
-        {"$match": {"cigar_id": rating_data.cigar_id}},
+        {"$match": {"cigar_id": ref_filter(cigar_oid)}},
         {"$group": {
             "_id": None,
             "avg_rating": {"$avg": "$rating"},
@@ -825,9 +1124,11 @@ async def create_rating(rating_data: RatingCreate, user_id: str = Depends(get_cu
         count = result[0]['count']
         
         await db.cigars.update_one(
-            {"_id": ObjectId(rating_data.cigar_id)},
-            {"$set": {"average_rating": avg_rating, "rating_count": count}}
+            {"_id": cigar_oid},
+            touched({"$set": {"average_rating": avg_rating, "rating_count": count}})
         )
+        await record_change(db, cigar_oid)
+    await publish(db, "ratings", [cigar_oid])
     
     return {"success": True, "rating": rating_data.rating}
 
@@ -835,9 +1136,14 @@ async def create_rating(rating_data: RatingCreate, user_id: str = Depends(get_cu
 @api_router.get("/ratings/cigar/{cigar_id}")
 async def get_cigar_ratings(cigar_id: str):
     """Get all ratings for a cigar"""
-    projection = {"user_id": 1, "rating": 1, "created_at": 1}
-    ratings = await db.ratings.find({"cigar_id": cigar_id}, projection).limit(100).to_list(100)
-    return [serialize_doc(rating) for rating in ratings]
+    generation = ratings_cache.generation
+    ratings = ratings_cache.get(cigar_id)
+    if ratings is None:
+        projection = {"user_id": 1, "rating": 1, "created_at": 1}
+        ratings = await db.ratings.find({"cigar_id": ref_filter(cigar_id)}, projection).limit(100).to_list(100)
+        ratings = [serialize_doc(rating) for rating in ratings]
+        ratings_cache.set(cigar_id, ratings, generation, [cigar_id])
+    return ratings
 
 
 @api_router.get("/ratings/user/{cigar_id}")
@@ -845,7 +1151,7 @@ async def get_user_rating(cigar_id: str, user_id: str = Depends(get_current_user
     """Get user's rating for a specific cigar"""
     rating = await db.ratings.find_one({
         "user_id": user_id,
-        "cigar_id": cigar_id
+        "cigar_id": ref_filter(cigar_id)
     })
     if rating:
         return serialize_doc(rating)
@@ -853,34 +1159,23 @@ async def get_user_rating(cigar_id: str, user_id: str = Depends(get_current_user
 
 
 @api_router.get("/ratings/my-ratings")
-async def get_my_ratings(user_id: str = Depends(get_current_user)):
-    """Get all ratings by the current user with cigar details"""
+async def get_my_ratings(request: Request, user_id: str = Depends(get_current_user)):
+    """Get all ratings by the current user with cigar details (streamed)"""
     # Use aggregation to join ratings with cigar details
     pipeline = [
         {"$match": {"user_id": user_id}},
         {"$sort": {"created_at": -1}},
-        {
-            "$addFields": {
-                "cigar_oid": {"$toObjectId": "$cigar_id"}
-            }
-        },
-        {
-            "$lookup": {
-                "from": "cigars",
-                "localField": "cigar_oid",
-                "foreignField": "_id",
-                "as": "cigar_details"
-            }
-        },
+        *ref_lookup_stages("cigar_id", "cigar_details"),
         {"$unwind": "$cigar_details"},
         {
             "$project": {
                 "rating": 1,
                 "created_at": 1,
-                "cigar_id": {"$toString": "$cigar_oid"},
+                "cigar_id": {"$toString": "$cigar_id"},
                 "cigar_name": "$cigar_details.name",
                 "cigar_brand": "$cigar_details.brand",
                 "cigar_image": "$cigar_details.image",
+                "cigar_image_id": "$cigar_details.image_id",
                 "cigar_strength": "$cigar_details.strength",
                 "cigar_origin": "$cigar_details.origin",
                 "average_rating": "$cigar_details.average_rating"
@@ -888,40 +1183,49 @@ async def get_my_ratings(user_id: str = Depends(get_current_user)):
         }
     ]
     
-    ratings = await db.ratings.aggregate(pipeline).to_list(1000)
-    return [serialize_doc(rating) for rating in ratings]
+    cursor = db.ratings.aggregate(pipeline, batchSize=STREAM_BATCH_SIZE)
+    
+    async def serialize_batch(batch):
+        ratings = [serialize_doc(rating) for rating in batch]
+        for rating in ratings:
+            rating["cigar_image_url"] = image_url(rating["cigar_id"]) if rating.pop("cigar_image_id", None) else None
+        return ratings
+    
+    return stream_response(request, stream_rows(cursor, serialize_batch))
 
 
 # ==================== Comment Endpoints ====================
 
 @api_router.post("/comments")
-async def create_comment(comment_data: CommentCreate, user_id: str = Depends(get_current_user)):
+async def create_comment(comment_data: CommentCreate, principal: Principal = Depends(get_current_principal)):
     """Create a comment"""
+    user_id = principal.user_id
     logging.info(f"Creating comment for user {user_id}, cigar {comment_data.cigar_id}")
     logging.info(f"Comment text: {comment_data.text[:50]}...")
     
     comment_doc = comment_data.model_dump()
+    comment_doc['cigar_id'] = to_object_id(comment_data.cigar_id)
     comment_doc['user_id'] = user_id
     comment_doc['created_at'] = datetime.utcnow()
     
     logging.info(f"Comment doc to insert: {comment_doc}")
     
     result = await db.comments.insert_one(comment_doc)
+    await db.cigars.update_one({"_id": comment_doc['cigar_id']}, {"$inc": {"comment_version": 1}})
     
     logging.info(f"Comment inserted with ID: {result.inserted_id}")
     
-    # Verify it was saved
-    saved_comment = await db.comments.find_one({"_id": result.inserted_id})
-    logging.info(f"Verification - comment exists in DB: {saved_comment is not None}")
-    
-    # Get user info
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
+    # Username comes from the token; only tokens issued before it was embedded need a lookup
+    username = principal.username
+    if not username:
+        user = await db.users.find_one({"_id": ObjectId(user_id)}, {"username": 1})
+        username = user['username'] if user else 'Unknown'
     
     # Return a clean response object
     response = {
         'id': str(result.inserted_id),
         'user_id': user_id,
-        'username': user['username'] if user else 'Unknown',
+        'username': username,
         'cigar_id': comment_data.cigar_id,
         'text': comment_data.text,
         'parent_id': comment_data.parent_id,
@@ -935,58 +1239,66 @@ async def create_comment(comment_data: CommentCreate, user_id: str = Depends(get
 
 
 @api_router.get("/comments/my-all-comments")
-async def get_my_all_comments(user_id: str = Depends(get_current_user)):
-    """Get all comments made by the current user across all cigars"""
-    try:
-        # Get all comments by this user
-        comments_cursor = db.comments.find({"user_id": user_id}).sort("created_at", -1)
-        all_comments = await comments_cursor.to_list(length=None)
-        
-        # Get cigar details for all comments
-        cigar_ids = list(set([c["cigar_id"] for c in all_comments]))
+async def get_my_all_comments(request: Request, user_id: str = Depends(get_current_user)):
+    """Get all comments made by the current user across all cigars (streamed)"""
+    comments_cursor = db.comments.find(
+        {"user_id": user_id},
+        {"text": 1, "created_at": 1, "cigar_id": 1}
+    ).sort("created_at", -1).batch_size(STREAM_BATCH_SIZE)
+    
+    async def join_cigars(batch):
+        # Get cigar details for this batch of comments only
+        cigar_ids = stored_object_ids(c["cigar_id"] for c in batch)
         cigars = await db.cigars.find(
-            {"_id": {"$in": [ObjectId(cid) for cid in cigar_ids]}},
-            {"brand": 1, "name": 1, "image": 1}
+            {"_id": {"$in": cigar_ids}},
+            {"brand": 1, "name": 1, "image": 1, "image_id": 1}
         ).to_list(len(cigar_ids))
         
         cigar_map = {str(c["_id"]): c for c in cigars}
         
-        # Build response with cigar details
         result = []
-        for comment in all_comments:
-            cigar = cigar_map.get(comment["cigar_id"])
+        for comment in batch:
+            cigar = cigar_map.get(str(comment["cigar_id"]))
             if cigar:
                 result.append({
                     "id": str(comment["_id"]),
                     "text": comment["text"],
                     "created_at": comment["created_at"].isoformat(),
-                    "cigar_id": comment["cigar_id"],
+                    "cigar_id": str(comment["cigar_id"]),
                     "cigar_brand": cigar["brand"],
                     "cigar_name": cigar["name"],
-                    "cigar_image": cigar.get("image", "")
+                    "cigar_image": cigar.get("image", ""),
+                    "cigar_image_url": image_url(comment["cigar_id"]) if cigar.get("image_id") else None
                 })
-        
         return result
-        
-    except Exception as e:
-        logger.error(f"Error getting user comments: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to get comments")
+    
+    return stream_response(request, stream_rows(comments_cursor, join_cigars))
 
 
-@api_router.get("/comments/{cigar_id}")
-async def get_comments(cigar_id: str):
+@api_router.get("/comments/{cigar_id}", response_model=List[CommentNode])
+async def get_comments(cigar_id: str, request: Request, response: Response):
     """Get all comments for a cigar (nested structure)"""
-    # Get all comments for this cigar with projection
+    # Threads are versioned by a counter on the cigar, bumped on every comment write
+    after = None
+    if ObjectId.is_valid(cigar_id):
+        async with causal_session(db) as session:
+            cigar = await db.cigars.find_one({"_id": ObjectId(cigar_id)}, {"comment_version": 1}, session=session)
+            after = read_point(session)
+        if cigar:
+            etag = make_etag("comments", cigar_id, cigar.get("comment_version", 0))
+            cached = conditional(request, response, "comments", etag)
+            if cached:
+                return cached
+    
+    # Get all comments for this cigar from a secondary at least as new as that version
     projection = {"user_id": 1, "text": 1, "parent_id": 1, "images": 1, "created_at": 1}
-    all_comments = await db.comments.find({"cigar_id": cigar_id}, projection).sort("created_at", -1).limit(100).to_list(100)
+    async with causal_session(db, after) as session:
+        all_comments = await secondary(db).comments.find(
+            {"cigar_id": ref_filter(cigar_id)}, projection, session=session
+        ).sort("created_at", -1).limit(100).to_list(100)
     
-    # Get user info for all comments with projection (including profile_pic)
-    user_ids = list(set([c['user_id'] for c in all_comments]))
-    users = await db.users.find(
-        {"_id": {"$in": [ObjectId(uid) for uid in user_ids]}}, 
-        {"username": 1, "profile_pic": 1}
-    ).to_list(len(user_ids))
-    user_map = {str(u['_id']): {'username': u['username'], 'profile_pic': u.get('profile_pic')} for u in users}
+    # Get user info for all comments
+    user_map = await load_authors(c['user_id'] for c in all_comments)
     
     # Build comment tree
     comment_map = {}
@@ -1032,11 +1344,12 @@ async def update_flavor_notes(cigar_id: str, flavor_notes: list[str], user_id: s
         # Update flavor notes
         result = await db.cigars.update_one(
             {"_id": ObjectId(cigar_id)},
-            {"$set": {"flavor_notes": flavor_notes}}
+            touched({"$set": {"flavor_notes": flavor_notes}})
         )
         
         if result.modified_count == 0 and result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Cigar not found")
+        await record_change(db, cigar_id)
         
         logger.info(f"Updated flavor notes for cigar {cigar_id} by user {user_id}")
         
@@ -1079,6 +1392,8 @@ async def delete_comment(comment_id: str, user_id: str = Depends(get_current_use
         
         # Also delete all replies to this comment
         deleted_replies = await db.comments.delete_many({"parent_id": comment_id})
+        if ObjectId.is_valid(comment.get("cigar_id")):
+            await db.cigars.update_one({"_id": ObjectId(comment["cigar_id"])}, {"$inc": {"comment_version": 1}})
         
         logger.info(f"Deleted comment {comment_id} and {deleted_replies.deleted_count} replies by user {user_id}")
         
@@ -1133,25 +1448,13 @@ async def get_my_comments_v2():
     pipeline = [
         {"$match": {"user_id": user_id}},
         {"$sort": {"created_at": -1}},
-        {
-            "$addFields": {
-                "cigar_oid": {"$toObjectId": "$cigar_id"}
-            }
-        },
-        {
-            "$lookup": {
-                "from": "cigars",
-                "localField": "cigar_oid",
-                "foreignField": "_id",
-                "as": "cigar_details"
-            }
-        },
+        *ref_lookup_stages("cigar_id", "cigar_details"),
         {"$unwind": "$cigar_details"},
         {
             "$project": {
                 "text": 1,
                 "created_at": 1,
-                "cigar_id": {"$toString": "$cigar_oid"},
+                "cigar_id": {"$toString": "$cigar_id"},
                 "cigar_name": "$cigar_details.name",
                 "cigar_brand": "$cigar_details.brand",
                 "cigar_image": "$cigar_details.image",
@@ -1182,25 +1485,13 @@ async def get_my_comments(user_id: str = Depends(get_current_user)):
     pipeline = [
         {"$match": {"user_id": HARDCODED_USER_ID}},
         {"$sort": {"created_at": -1}},
-        {
-            "$addFields": {
-                "cigar_oid": {"$toObjectId": "$cigar_id"}
-            }
-        },
-        {
-            "$lookup": {
-                "from": "cigars",
-                "localField": "cigar_oid",
-                "foreignField": "_id",
-                "as": "cigar_details"
-            }
-        },
+        *ref_lookup_stages("cigar_id", "cigar_details"),
         {"$unwind": "$cigar_details"},
         {
             "$project": {
                 "text": 1,
                 "created_at": 1,
-                "cigar_id": {"$toString": "$cigar_oid"},
+                "cigar_id": {"$toString": "$cigar_id"},
                 "cigar_name": "$cigar_details.name",
                 "cigar_brand": "$cigar_details.brand",
                 "cigar_image": "$cigar_details.image",
@@ -1228,8 +1519,8 @@ async def get_user_note(cigar_id: str, user_id: str = Depends(get_current_user))
         # Find the note for this user and cigar
         note = await db.user_notes.find_one({
             "user_id": user_id,
-            "cigar_id": cigar_id
-        })
+            "cigar_id": ref_filter(cigar_id)
+        }, {"revisions": 0})
         
         if not note:
             return {"note_text": ""}
@@ -1249,53 +1540,45 @@ async def save_user_note(
 ):
     """Create or update user's note for a specific cigar"""
     try:
-        # Validate cigar exists
-        cigar = await db.cigars.find_one({"_id": ObjectId(cigar_id)})
-        if not cigar:
-            raise HTTPException(status_code=404, detail="Cigar not found")
-        
         # Validate note length
         if len(note_data.note_text) > 1000:
             raise HTTPException(status_code=400, detail="Note exceeds 1000 character limit")
         
-        now = datetime.utcnow()
-        
-        # Check if note already exists
-        existing_note = await db.user_notes.find_one({
-            "user_id": user_id,
-            "cigar_id": cigar_id
-        })
+        # Validate cigar exists
+        cigar = await db.cigars.find_one({"_id": to_object_id(cigar_id)}, {"_id": 1})
+        if not cigar:
+            raise HTTPException(status_code=404, detail="Cigar not found")
         
-        if existing_note:
-            # Update existing note
-            result = await db.user_notes.update_one(
-                {"_id": existing_note["_id"]},
-                {
-                    "$set": {
-                        "note_text": note_data.note_text,
-                        "updated_at": now
-                    }
-                }
-            )
-            
-            if result.modified_count == 0:
-                raise HTTPException(status_code=500, detail="Failed to update note")
-            
-            updated_note = await db.user_notes.find_one({"_id": existing_note["_id"]})
-            return serialize_doc(updated_note)
-        else:
-            # Create new note
-            note_doc = {
-                "user_id": user_id,
-                "cigar_id": cigar_id,
+        now = datetime.utcnow()
+        update = {
+            "$set": {
                 "note_text": note_data.note_text,
-                "created_at": now,
+                "cigar_id": cigar["_id"],
                 "updated_at": now
-            }
-            
-            result = await db.user_notes.insert_one(note_doc)
-            saved_note = await db.user_notes.find_one({"_id": result.inserted_id})
-            return serialize_doc(saved_note)
+            },
+            "$setOnInsert": {"created_at": now}
+        }
+        if NOTE_REVISION_LIMIT > 0:
+            update["$push"] = {"revisions": {
+                "$each": [{"note_text": note_data.note_text, "saved_at": now}],
+                "$slice": -NOTE_REVISION_LIMIT
+            }}
+        
+        # Single atomic upsert under the unique (user_id, cigar_id) index. A
+        # concurrent first save can still lose the insert race, so retry once.
+        for attempt in range(2):
+            try:
+                note = await db.user_notes.find_one_and_update(
+                    {"user_id": user_id, "cigar_id": ref_filter(cigar["_id"])},
+                    update,
+                    projection={"revisions": 0},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                return serialize_doc(note)
+            except DuplicateKeyError:
+                if attempt:
+                    raise
         
     except HTTPException:
         raise
@@ -1304,13 +1587,26 @@ async def save_user_note(
         raise HTTPException(status_code=500, detail="Failed to save note")
 
 
+@api_router.get("/cigars/{cigar_id}/my-note/revisions")
+async def get_user_note_revisions(cigar_id: str, user_id: str = Depends(get_current_user)):
+    """Get previous versions of user's note for a specific cigar, newest first"""
+    note = await db.user_notes.find_one(
+        {"user_id": user_id, "cigar_id": ref_filter(cigar_id)},
+        {"revisions": 1}
+    )
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
+    
+    return list(reversed(note.get("revisions", [])))
+
+
 @api_router.delete("/cigars/{cigar_id}/my-note")
 async def delete_user_note(cigar_id: str, user_id: str = Depends(get_current_user)):
     """Delete user's note for a specific cigar"""
     try:
         result = await db.user_notes.delete_one({
             "user_id": user_id,
-            "cigar_id": cigar_id
+            "cigar_id": ref_filter(cigar_id)
         })
         
         if result.deleted_count == 0:
@@ -1325,21 +1621,56 @@ async def delete_user_note(cigar_id: str, user_id: str = Depends(get_current_use
         raise HTTPException(status_code=500, detail="Failed to delete note")
 
 
+@api_router.get("/notes/export")
+async def export_user_notes(request: Request, user_id: str = Depends(get_current_user)):
+    """Export all of the user's notes with cigar names (streamed)"""
+    notes_cursor = db.user_notes.find(
+        {"user_id": user_id},
+        {"revisions": 0}
+    ).sort("updated_at", -1).batch_size(STREAM_BATCH_SIZE)
+    
+    async def join_cigars(batch):
+        cigar_ids = stored_object_ids(n["cigar_id"] for n in batch)
+        cigars = await db.cigars.find(
+            {"_id": {"$in": cigar_ids}},
+            {"brand": 1, "name": 1}
+        ).to_list(len(cigar_ids))
+        cigar_map = {str(c["_id"]): c for c in cigars}
+        
+        result = []
+        for note in batch:
+            note = serialize_doc(note)
+            cigar = cigar_map.get(note["cigar_id"], {})
+            note["cigar_brand"] = cigar.get("brand")
+            note["cigar_name"] = cigar.get("name")
+            result.append(note)
+        return result
+    
+    return stream_response(request, stream_rows(notes_cursor, join_cigars))
+
+
 # ==================== Favorites Endpoints ====================
 
 @api_router.post("/favorites/{cigar_id}")
 async def add_favorite(cigar_id: str, user_id: str = Depends(get_current_user)):
     """Add cigar to favorites"""
     # Check if cigar exists
-    cigar = await db.cigars.find_one({"_id": ObjectId(cigar_id)})
+    cigar = await db.cigars.find_one({"_id": to_object_id(cigar_id)}, {"_id": 1})
     if not cigar:
         raise HTTPException(status_code=404, detail="Cigar not found")
     
-    # Add to favorites if not already there
-    await db.users.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$addToSet": {"favorites": cigar_id}}
-    )
+    # The unique (user_id, cigar_id) index makes re-adding a no-op
+    try:
+        await db.favorites.insert_one({
+            "user_id": user_id,
+            "cigar_id": cigar["_id"],
+            "added_at": datetime.utcnow()
+        })
+    except DuplicateKeyError:
+        return {"success": True, "message": "Added to favorites"}
+    
+    await db.cigars.update_one({"_id": cigar["_id"]}, touched({"$inc": {"favorite_count": 1}}))
+    await record_change(db, cigar["_id"])
     
     return {"success": True, "message": "Added to favorites"}
 
@@ -1347,35 +1678,310 @@ async def add_favorite(cigar_id: str, user_id: str = Depends(get_current_user)):
 @api_router.delete("/favorites/{cigar_id}")
 async def remove_favorite(cigar_id: str, user_id: str = Depends(get_current_user)):
     """Remove cigar from favorites"""
-    await db.users.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$pull": {"favorites": cigar_id}}
-    )
+    cigar_oid = to_object_id(cigar_id)
+    result = await db.favorites.delete_one({"user_id": user_id, "cigar_id": cigar_oid})
+    
+    if result.deleted_count:
+        await db.cigars.update_one({"_id": cigar_oid}, touched({"$inc": {"favorite_count": -1}}))
+        await record_change(db, cigar_oid)
     
     return {"success": True, "message": "Removed from favorites"}
 
 
-@api_router.get("/favorites")
-async def get_favorites(user_id: str = Depends(get_current_user)):
-    """Get user's favorite cigars"""
-    user = await db.users.find_one({"_id": ObjectId(user_id)}, {"favorites": 1})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    favorite_ids = user.get('favorites', [])
-    if not favorite_ids:
+@api_router.get("/favorites", response_model=List[CigarCard])
+async def get_favorites(
+    response: Response,
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    """Get user's favorite cigars, most recently added first.
+    
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    favorites = await db.favorites.find(
+        {"user_id": user_id, **keyset_filter("added_at", cursor)},
+        {"cigar_id": 1, "added_at": 1}
+    ).sort([("added_at", -1), ("_id", -1)]).limit(limit + 1).to_list(limit + 1)
+    
+    favorites, next_cursor = page_of(favorites, limit, "added_at")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    cigar_ids = [f["cigar_id"] for f in favorites]
+    if not favorites and cursor is None:
+        # Not migrated yet; the array has no added_at to page by, so only its newest page is served
+        cigar_ids = await legacy_favorite_ids(user_id, limit)
+    if not cigar_ids:
         return []
     
     # Get cigar details with projection
     projection = {
-        "name": 1, "brand": 1, "image": 1, "strength": 1, 
+        "name": 1, "brand": 1, "image": 1, "image_id": 1, "strength": 1,
         "origin": 1, "average_rating": 1, "rating_count": 1, "price_range": 1
     }
-    cigars = await db.cigars.find({
-        "_id": {"$in": [ObjectId(cid) for cid in favorite_ids]}
-    }, projection).limit(100).to_list(100)
+    cigars = await db.cigars.find({"_id": {"$in": cigar_ids}}, projection).to_list(len(cigar_ids))
+    cigar_map = {c["_id"]: c for c in cigars}
+    
+    # Keep the favorites order
+    return [add_image_url(serialize_doc(cigar_map[cid])) for cid in cigar_ids if cid in cigar_map]
+
+
+# ==================== Activity Endpoints ====================
+
+# Cigar fields shared by every activity section; the image is exposed as a URL
+ACTIVITY_CIGAR_PROJECTION = {
+    "name": 1, "brand": 1, "strength": 1, "origin": 1,
+    "average_rating": 1, "rating_count": 1,
+    "has_image": HAS_IMAGE
+}
+
+
+def _activity_section(collection: str, user_id: str, sort_field: str, fields: dict,
+                      cursor: Optional[str], limit: int) -> list:
+    """Facet sub-pipeline fetching one page of a user's documents from `collection`"""
+    match = {"user_id": user_id, **keyset_filter(sort_field, cursor)}
+    return [
+        {"$lookup": {
+            "from": collection,
+            "pipeline": [
+                {"$match": match},
+                {"$sort": {sort_field: -1, "_id": -1}},
+                {"$limit": limit + 1},
+                {"$project": fields}
+            ],
+            "as": "items"
+        }},
+        {"$project": {"_id": 0, "items": 1}}
+    ]
+
+
+@api_router.get("/me/activity")
+async def get_my_activity(
+    limit: int = Query(20, ge=1, le=100),
+    ratings_cursor: Optional[str] = None,
+    comments_cursor: Optional[str] = None,
+    notes_cursor: Optional[str] = None,
+    favorites_cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    """Get the current user's ratings, comments, favorites and notes in one round trip"""
+    sections = ["ratings", "comments", "notes", "favorites"]
+    pipeline = [
+        {"$match": {"_id": ObjectId(user_id)}},
+        {"$facet": {
+            "ratings": _activity_section(
+                "ratings", user_id, "created_at",
+                {"cigar_id": 1, "rating": 1, "created_at": 1},
+                ratings_cursor, limit
+            ),
+            "comments": _activity_section(
+                "comments", user_id, "created_at",
+                {"cigar_id": 1, "text": 1, "parent_id": 1, "created_at": 1},
+                comments_cursor, limit
+            ),
+            "notes": _activity_section(
+                "user_notes", user_id, "updated_at",
+                {"cigar_id": 1, "note_text": 1, "created_at": 1, "updated_at": 1},
+                notes_cursor, limit
+            ),
+            "favorites": _activity_section(
+                "favorites", user_id, "added_at",
+                {"cigar_id": 1, "added_at": 1},
+                favorites_cursor, limit
+            )
+        }},
+        {"$project": {
+            section: {"$ifNull": [{"$arrayElemAt": [f"${section}.items", 0]}, []]}
+            for section in sections
+        }},
+        # One batched cigar lookup shared by every section
+        {"$addFields": {"cigar_oids": {"$map": {
+            "input": {"$setUnion": [
+                "$ratings.cigar_id", "$comments.cigar_id", "$notes.cigar_id", "$favorites.cigar_id"
+            ]},
+            "as": "cid",
+            "in": {"$convert": {"input": "$$cid", "to": "objectId", "onError": None, "onNull": None}}
+        }}}},
+        # An equality match on an array localField uses the _id index, unlike $expr $in
+        {"$lookup": {
+            "from": "cigars",
+            "localField": "cigar_oids",
+            "foreignField": "_id",
+            "pipeline": [{"$project": ACTIVITY_CIGAR_PROJECTION}],
+            "as": "cigars"
+        }},
+        {"$project": {"cigar_oids": 0}}
+    ]
+    
+    result = await db.users.aggregate(pipeline).to_list(1)
+    if not result:
+        raise HTTPException(status_code=404, detail="User not found")
+    activity = result[0]
+    
+    cigars = {}
+    for cigar in activity["cigars"]:
+        cigar = add_image_url(serialize_doc(cigar))
+        cigars[cigar["id"]] = cigar
+    
+    response = {"cigars": cigars}
+    for section, sort_field in (
+        ("ratings", "created_at"), ("comments", "created_at"),
+        ("notes", "updated_at"), ("favorites", "added_at")
+    ):
+        items, next_cursor = page_of(activity[section], limit, sort_field)
+        response[section] = {
+            "items": [serialize_doc(item) for item in items],
+            "next_cursor": next_cursor
+        }
+    
+    return orjson_response(response)
+
+
+@api_router.get("/me/search")
+async def search_my_notes_and_comments(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    user_id: str = Depends(get_current_user)
+):
+    """Full-text search over the current user's tasting notes and comments"""
+    score = {"score": {"$meta": "textScore"}}
+    
+    notes_query = db.user_notes.find(
+        {"user_id": user_id, "$text": {"$search": q}},
+        {"cigar_id": 1, "note_text": 1, "updated_at": 1, **score}
+    ).sort([("score", {"$meta": "textScore"})]).limit(limit)
     
-    return [serialize_doc(cigar) for cigar in cigars]
+    comments_query = db.comments.find(
+        {"user_id": user_id, "$text": {"$search": q}},
+        {"cigar_id": 1, "text": 1, "created_at": 1, **score}
+    ).sort([("score", {"$meta": "textScore"})]).limit(limit)
+    
+    notes, comments = await asyncio.gather(notes_query.to_list(limit), comments_query.to_list(limit))
+    
+    results = [
+        {
+            "type": "note",
+            "id": str(n["_id"]),
+            "cigar_id": str(n["cigar_id"]),
+            "score": n["score"],
+            "snippet": highlight_snippet(n["note_text"], q),
+            "date": n.get("updated_at")
+        }
+        for n in notes
+    ] + [
+        {
+            "type": "comment",
+            "id": str(c["_id"]),
+            "cigar_id": str(c["cigar_id"]),
+            "score": c["score"],
+            "snippet": highlight_snippet(c["text"], q),
+            "date": c.get("created_at")
+        }
+        for c in comments
+    ]
+    results.sort(key=lambda r: r["score"], reverse=True)
+    results = results[:limit]
+    
+    # Attach cigar names in one query
+    cigar_ids = stored_object_ids(r["cigar_id"] for r in results)
+    cigars = await db.cigars.find(
+        {"_id": {"$in": cigar_ids}},
+        {"brand": 1, "name": 1}
+    ).to_list(len(cigar_ids))
+    cigar_map = {str(c["_id"]): c for c in cigars}
+    
+    for result in results:
+        cigar = cigar_map.get(result["cigar_id"], {})
+        result["cigar_brand"] = cigar.get("brand")
+        result["cigar_name"] = cigar.get("name")
+    
+    return results
+
+
+# ==================== Sync Endpoints ====================
+
+@api_router.get("/sync/cigars")
+async def sync_cigars(
+    since: Optional[str] = None,
+    fields: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=1000)
+):
+    """Cigars created, updated or deleted since a sync token; omit `since` to start a full snapshot"""
+    projection = cigar_projection(fields)
+    seq, after = decode_sync_token(since) if since else (None, None)
+    
+    if seq is None or after is not None:
+        # Initial snapshot: page through the catalog by _id, then continue from the
+        # catalog version captured when it started
+        if seq is None:
+            seq, _ = await catalog_version(db)
+        query = {"_id": {"$gt": after}} if after else {}
+        cigars = await db.cigars.find(query, projection).sort("_id", 1).limit(limit).to_list(limit)
+        has_more = len(cigars) == limit
+        return orjson_response({
+            "cigars": [add_image_url(serialize_doc(cigar)) for cigar in cigars],
+            "deleted": [],
+            "token": encode_sync_token(seq, cigars[-1]["_id"] if has_more else None),
+            "has_more": has_more
+        })
+    
+    changes = await changes_since(db, seq, limit)
+    changed_ids = list(dict.fromkeys(change["cigar_id"] for change in changes))
+    cigars = []
+    if changed_ids:
+        cigars = await db.cigars.find({"_id": {"$in": changed_ids}}, projection).to_list(len(changed_ids))
+    found = {cigar["_id"] for cigar in cigars}
+    
+    return orjson_response({
+        "cigars": [add_image_url(serialize_doc(cigar)) for cigar in cigars],
+        "deleted": [str(cigar_id) for cigar_id in changed_ids if cigar_id not in found],
+        "token": encode_sync_token(changes[-1]["seq"] if changes else seq),
+        "has_more": len(changes) == limit
+    })
+
+
+# ==================== Admin Endpoints ====================
+
+@api_router.post("/admin/profile")
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=100),
+    engine: str = Query("auto", pattern="^(auto|signal|pyinstrument)$"),
+    format: str = Query("json", pattern="^(json|collapsed)$"),
+    principal: Principal = Depends(get_current_admin)
+):
+    """Sample the worker serving this request and return collapsed stacks and loop lag (admin only)"""
+    if profile_running():
+        raise HTTPException(status_code=409, detail="A profile is already running in this worker")
+    
+    logger.info(f"Profiling worker {os.getpid()} for {seconds}s, requested by {principal.user_id}")
+    try:
+        result = await run_profile(seconds, interval_ms / 1000, engine)
+    except RuntimeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    result["pid"] = os.getpid()
+    if format == "collapsed":
+        return Response(
+            content=result["collapsed"],
+            media_type="text/plain",
+            headers={
+                "Content-Disposition": f'attachment; filename="profile-{result["pid"]}.folded"',
+                "X-Loop-Lag-P99-Ms": str(result["loop_lag"]["p99_ms"])
+            }
+        )
+    return result
+
+
+@api_router.get("/admin/loop-stalls")
+async def get_loop_stalls(principal: Principal = Depends(get_current_admin)):
+    """Recent event-loop stalls in this worker with the blocking stack and route (admin only)"""
+    return {
+        "pid": os.getpid(),
+        "threshold_ms": watchdog.threshold * 1000,
+        "lag": watchdog.percentiles(),
+        "stalls": watchdog.recent_stalls()
+    }
 
 
 # ==================== Store Price Endpoints ====================
@@ -1392,7 +1998,7 @@ async def get_store_prices(cigar_id: str):
     cigar_name = cigar.get('name', '')
     brand = cigar.get('brand', '')
     
-    print(f"🔍 Fetching real prices for: {brand} {cigar_name}")
+    logger.info(f"Fetching real prices for: {brand} {cigar_name}")
     
     # Use the price scraper to get real-time prices
     scraper = PriceScraper()
@@ -1400,7 +2006,7 @@ async def get_store_prices(cigar_id: str):
     
     # If no prices found, return fallback with search URLs
     if not stores or all(not store.get('price') for store in stores):
-        print("⚠️  No prices found, returning search URLs as fallback")
+        logger.info("No prices found, returning search URLs as fallback")
         stores = [
             {
                 "store_name": "Cigars International",
@@ -1422,10 +2028,10 @@ async def get_store_prices(cigar_id: str):
             }
         ]
     else:
-        print(f"✅ Found {len([s for s in stores if s.get('price')])} prices")
+        logger.info(f"Found {len([s for s in stores if s.get('price')])} prices for {brand} {cigar_name}")
         for store in stores:
             if store.get('price'):
-                print(f"  - {store['store_name']}: ${store['price']} ({store['url']})")
+                logger.debug(f"{store['store_name']}: ${store['price']} ({store['url']})")
     
     return stores
 
@@ -1440,36 +2046,75 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Outermost, so latency includes every other middleware
+app.add_middleware(TimingMiddleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics for this worker"""
+    return Response(content=render_metrics(), media_type=PROMETHEUS_MEDIA_TYPE)
+
 # Include the router in the main app
 app.include_router(api_router)
 
 
+@app.on_event("startup")
+async def create_indexes():
+    """Create the indexes the API relies on"""
+    await ensure_indexes(db)
+
+
+@app.on_event("startup")
+async def enable_slow_query_plans():
+    """Let the command listener explain slow queries on this loop"""
+    command_listener.explain_with(db, asyncio.get_running_loop())
+
+
+async def sync_token_deny_list():
+    """Periodically pull token revocations made by other workers"""
+    while True:
+        try:
+            await deny_list.sync(db)
+        except Exception as e:
+            logger.error(f"Error syncing token deny list: {str(e)}")
+        await asyncio.sleep(DENY_LIST_SYNC_SECONDS)
+
+
+@app.on_event("startup")
+async def start_deny_list_sync():
+    """Start the background deny list sync"""
+    app.state.deny_list_task = asyncio.create_task(sync_token_deny_list())
+
+
+@app.on_event("startup")
+async def start_invalidation_bus():
+    """Start applying cache invalidations published by other workers"""
+    app.state.invalidation_task = asyncio.create_task(bus.run(db))
+
+
+@app.on_event("startup")
+async def start_loop_watchdog():
+    """Start measuring event-loop lag in this worker"""
+    if LOOP_WATCHDOG_ENABLED:
+        watchdog.start()
+
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if getattr(app.state, "deny_list_task", None):
+        app.state.deny_list_task.cancel()
+    if getattr(app.state, "invalidation_task", None):
+        app.state.invalidation_task.cancel()
+    watchdog.stop()
     client.close()
 
 
-# Seed some sample cigars on startup
+# Seed the catalog on first run
 @app.on_event("startup")
 async def seed_database():
-    """Seed the database with sample cigars"""
-    count = await db.cigars.count_documents({})
-    if count == 0:
-        logger.info("Seeding database with comprehensive cigar collection...")
-        
-        # Get curated cigars (45 premium cigars with details)
-        curated_cigars = get_cigar_seed_data()
-        
-        # Get generated cigars (1000 varied cigars)
-        generated_cigars = get_generated_cigars()
-        
-        # Combine both
-        all_cigars = curated_cigars + generated_cigars
-        
-        # Insert in batches for better performance
-        batch_size = 100
-        for i in range(0, len(all_cigars), batch_size):
-            batch = all_cigars[i:i+batch_size]
-            await db.cigars.insert_many(batch)
-        
-        logger.info(f"Seeded {len(all_cigars)} cigars successfully ({len(curated_cigars)} curated + {len(generated_cigars)} generated)")
+    """Seed an empty catalog; the seed data modules are only imported when this runs"""
+    if not SEED_ON_STARTUP or await db.cigars.find_one({}, {"_id": 1}):
+        return
+    from seed import seed_catalog
+    await seed_catalog(db)
@@ -1,64 +1,54 @@
+"""
+Set all cigars with no user ratings (rating_count = 0) to a 0.0 rating
+
+Usage:
+    python set_unrated_cigars.py [--batch-size 1000] [--dry-run] [--resume]
+"""
+import argparse
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import os
 
+from maintenance import add_arguments, print_progress, print_report, run_maintenance
+
 load_dotenv()
 
 MONGO_URL = os.getenv("MONGO_URL")
 DB_NAME = os.getenv("DB_NAME")
 
-async def set_unrated_cigars():
+# Cigars holding placeholder ratings rather than actual user ratings
+UNRATED_QUERY = {
+    "$or": [
+        {"rating_count": 0},
+        {"rating_count": {"$exists": False}}
+    ]
+}
+
+
+def unrated(cigar):
+    return {"average_rating": 0.0, "rating_count": 0}
+
+
+async def set_unrated_cigars(batch_size: int, dry_run: bool, resume: bool):
     """Set all cigars with no user ratings (rating_count = 0) to 0.0"""
     client = AsyncIOMotorClient(MONGO_URL)
     db = client[DB_NAME]
     
     print("Finding cigars with no user ratings (rating_count = 0)...")
     
-    # Find cigars that have rating_count = 0 (placeholder ratings, not actual user ratings)
-    unrated_cigars = await db.cigars.find({
-        "$or": [
-            {"rating_count": 0},
-            {"rating_count": {"$exists": False}}
-        ]
-    }).to_list(2000)
-    
-    print(f"Found {len(unrated_cigars)} cigars with no user ratings")
-    
-    if len(unrated_cigars) > 0:
-        # Show some examples before update
-        print("\nExamples (before update):")
-        for cigar in unrated_cigars[:5]:
-            print(f"  - {cigar.get('brand')} {cigar.get('name')}: {cigar.get('average_rating')} ({cigar.get('rating_count', 0)} ratings)")
-        
-        # Update all cigars with rating_count = 0
-        result = await db.cigars.update_many(
-            {
-                "$or": [
-                    {"rating_count": 0},
-                    {"rating_count": {"$exists": False}}
-                ]
-            },
-            {
-                "$set": {
-                    "average_rating": 0.0,
-                    "rating_count": 0
-                }
-            }
-        )
-        
-        print(f"\nUpdated {result.modified_count} cigars to have rating 0.0")
-        
-        # Show some examples after update
-        print("\nExamples (after update):")
-        updated = await db.cigars.find({"average_rating": 0.0, "rating_count": 0}).limit(5).to_list(5)
-        for cigar in updated:
-            print(f"  - {cigar.get('brand')} {cigar.get('name')}: {cigar.get('average_rating')} ({cigar.get('rating_count')} ratings)")
-    else:
-        print("All cigars have user ratings!")
+    stats = await run_maintenance(
+        db, "set_unrated_cigars", unrated, query=UNRATED_QUERY,
+        projection={"brand": 1, "name": 1, "average_rating": 1, "rating_count": 1},
+        batch_size=batch_size, dry_run=dry_run, resume=resume, progress=print_progress
+    )
+    print_report(stats, dry_run)
     
     client.close()
     print("\nCompleted!")
 
 if __name__ == "__main__":
-    asyncio.run(set_unrated_cigars())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    args = parser.parse_args()
+    asyncio.run(set_unrated_cigars(args.batch_size, args.dry_run, args.resume))
@@ -0,0 +1,87 @@
+"""
+Incremental JSON encoding for endpoints that return a user's full history.
+
+Documents are pulled from a Motor cursor in bounded batches and written to the
+response as they arrive, so memory per request does not grow with the size of
+the result set.
+"""
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from encoding import dumps
+
+logger = logging.getLogger(__name__)
+
+# Documents fetched from MongoDB per getMore while streaming
+STREAM_BATCH_SIZE = 200
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def encode_item(item) -> bytes:
+    """Encode a single document as compact JSON"""
+    return dumps(item)
+
+
+async def batched(cursor, size: int = STREAM_BATCH_SIZE) -> AsyncIterator[List[dict]]:
+    """Group documents from a Motor cursor into lists of at most `size`"""
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def stream_rows(
+    cursor,
+    transform: Callable[[List[dict]], Awaitable[Iterable[dict]]],
+    size: int = STREAM_BATCH_SIZE
+) -> AsyncIterator[dict]:
+    """Yield rows produced by `transform` for each batch read from `cursor`"""
+    async for batch in batched(cursor, size):
+        for row in await transform(batch):
+            yield row
+
+
+async def _json_array_chunks(rows: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    yield b"["
+    first = True
+    try:
+        async for row in rows:
+            yield encode_item(row) if first else b"," + encode_item(row)
+            first = False
+    except Exception as e:
+        # Headers are already sent; re-raising aborts the response so the client
+        # sees a truncated body instead of a valid but incomplete array
+        logger.error(f"Error while streaming response: {str(e)}")
+        raise
+    yield b"]"
+
+
+async def _ndjson_chunks(rows: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    try:
+        async for row in rows:
+            yield encode_item(row) + b"\n"
+    except Exception as e:
+        logger.error(f"Error while streaming response: {str(e)}")
+        raise
+
+
+def wants_ndjson(request: Request) -> bool:
+    """Whether the client asked for newline-delimited JSON instead of an array"""
+    if request.query_params.get("format") == "ndjson":
+        return True
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def stream_response(request: Request, rows: AsyncIterator[dict]) -> StreamingResponse:
+    """Stream rows as NDJSON or as a chunked JSON array depending on the request"""
+    if wants_ndjson(request):
+        return StreamingResponse(_ndjson_chunks(rows), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(_json_array_chunks(rows), media_type="application/json")
@@ -0,0 +1,415 @@
+"""
+Deterministic synthetic dataset for load testing.
+
+Builds N cigars (from generate_cigars), M users, and ratings, favorites,
+tasting notes and comments whose cigar popularity and user activity follow
+Zipf distributions: a few cigars and a few users account for most of the
+activity, as in production. Everything derives from --seed, including the
+cigar and user ids, so the same arguments always produce the same data
+(timestamps are spread back from the time of generation) and replay.py can
+rebuild the id lists from the manifest stored in `synthetic_meta`.
+
+Documents stream into Mongo through unordered insert_many batches with
+several batches in flight; memory grows with the number of cigars and users,
+not with the number of ratings. Cigar aggregates (average_rating,
+rating_count, favorite_count, comment_version) are accumulated while the
+activity is generated and written with the cigars. Every synthetic user
+has the password LOADTEST_PASSWORD.
+
+Afterwards the catalog version moves past every earlier one and all cache
+topics are published, so running API workers drop what they cached from
+the previous data and sync clients are sent back to a full sync.
+
+Usage:
+    python synthetic.py --cigars 20000 --users 10000 --ratings 1000000 --seed 7 --drop
+    python synthetic.py --cigars 1000 --users 200 --ratings 5000 --comments 1000
+"""
+import argparse
+import asyncio
+import bisect
+import os
+import random
+import struct
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from itertools import accumulate
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+from auth import hash_password  # noqa: E402
+from catalog import CATALOG_COUNTER_ID, catalog_key, versioned  # noqa: E402
+from generate_cigars import BRANDS, FLAVOR_GROUPS, SERIES, iter_cigars  # noqa: E402
+from indexes import ensure_indexes  # noqa: E402
+from invalidation import publish  # noqa: E402
+
+LOADTEST_PASSWORD = "loadtest-password"
+
+# Zipf exponents: cigar popularity is steeper than user activity
+CIGAR_ZIPF_S = 1.1
+USER_ZIPF_S = 0.9
+
+# Share of comments that reply to the latest comment on the same cigar
+REPLY_RATE = 0.25
+
+# Activity timestamps are spread over this many days before generation
+HISTORY_DAYS = 365
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_CONCURRENCY = 4
+
+# Collections written by the generator, in dependency order
+COLLECTIONS = ("users", "ratings", "favorites", "user_notes", "comments", "cigars")
+
+# Fixed ObjectId timestamp for synthetic ids (2024-01-01)
+ID_EPOCH = 1704067200
+ID_KINDS = {"cigar": 1, "user": 2, "comment": 3}
+
+COMMENT_TEMPLATES = [
+    "Great {flavor} notes on this one.",
+    "Smoked this after dinner, lots of {flavor}.",
+    "Burn was even, {flavor} and {flavor2} throughout.",
+    "Not my favorite, a bit too much {flavor}.",
+    "The second third opens up into {flavor}.",
+    "Paired it with coffee, the {flavor} really came through.",
+]
+
+NOTE_TEMPLATES = [
+    "{flavor} up front, {flavor2} on the finish.",
+    "Would buy again. {flavor}.",
+    "Let it rest a month; {flavor} got stronger.",
+    "Draw a little tight. Notes of {flavor} and {flavor2}.",
+]
+
+
+@dataclass
+class DatasetSpec:
+    cigars: int
+    users: int
+    ratings: int
+    favorites: int
+    notes: int
+    comments: int
+    seed: int
+
+
+def synthetic_id(kind: str, index: int, seed: int) -> ObjectId:
+    """Deterministic ObjectId: fixed timestamp, seed, kind and a 3-byte index"""
+    return ObjectId(struct.pack(">IIB", ID_EPOCH, seed & 0xFFFFFFFF, ID_KINDS[kind]) + index.to_bytes(3, "big"))
+
+
+def popularity_order(count: int, seed: int, kind: str) -> List[int]:
+    """Item index for each popularity rank, so popular items are spread across the id range"""
+    order = list(range(count))
+    random.Random(f"{seed}:{kind}-popularity").shuffle(order)
+    return order
+
+
+class Zipf:
+    """Samples ranks 0..n-1 with P(rank) proportional to 1 / (rank + 1) ** s"""
+
+    def __init__(self, n: int, s: float, rng: random.Random):
+        self.cumulative = list(accumulate(1 / (k ** s) for k in range(1, n + 1)))
+        self.rng = rng
+
+    def sample(self, rng: Optional[random.Random] = None) -> int:
+        point = (rng or self.rng).random() * self.cumulative[-1]
+        return min(bisect.bisect_right(self.cumulative, point), len(self.cumulative) - 1)
+
+    def distinct(self, k: int) -> List[int]:
+        """Up to `k` different ranks; gives up after 20*k draws on very skewed tails"""
+        seen = {}
+        for _ in range(20 * k):
+            if len(seen) >= k:
+                break
+            seen.setdefault(self.sample(), None)
+        return list(seen)
+
+
+def allocate(total: int, n: int, s: float, cap: int, rng: random.Random) -> List[int]:
+    """Split `total` events over `n` actors with Zipf weights, at most `cap` each"""
+    total = min(total, n * cap)
+    weights = [1 / (k ** s) for k in range(1, n + 1)]
+    scale = total / sum(weights)
+    counts = [min(cap, int(w * scale)) for w in weights]
+    # Hand out what rounding and the cap left over, most active first
+    deficit = total - sum(counts)
+    while deficit > 0:
+        for i in range(n):
+            if deficit == 0:
+                break
+            if counts[i] < cap:
+                counts[i] += 1
+                deficit -= 1
+    rng.shuffle(counts)
+    return counts
+
+
+class BulkInserter:
+    """Buffers documents per collection and keeps up to `concurrency` insert_many calls in flight"""
+
+    def __init__(self, db, batch_size: int, concurrency: int, progress: Optional[Callable[[Dict[str, int]], None]] = None):
+        self.db = db
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.progress = progress
+        self.buffers: Dict[str, list] = {}
+        self.inserted: Dict[str, int] = {}
+        self.in_flight = set()
+
+    async def add(self, collection: str, doc: dict):
+        buffer = self.buffers.setdefault(collection, [])
+        buffer.append(doc)
+        if len(buffer) >= self.batch_size:
+            self.buffers[collection] = []
+            await self._submit(collection, buffer)
+
+    async def _submit(self, collection: str, docs: list):
+        if len(self.in_flight) >= self.concurrency:
+            done, self.in_flight = await asyncio.wait(self.in_flight, return_when=asyncio.FIRST_COMPLETED)
+            self._finished(done)
+        self.in_flight.add(asyncio.create_task(self._insert(collection, docs)))
+
+    async def _insert(self, collection: str, docs: list):
+        await self.db[collection].insert_many(docs, ordered=False)
+        self.inserted[collection] = self.inserted.get(collection, 0) + len(docs)
+
+    def _finished(self, done):
+        for task in done:
+            task.result()
+        if self.progress:
+            self.progress(self.inserted)
+
+    async def flush(self):
+        for collection, buffer in self.buffers.items():
+            if buffer:
+                await self._submit(collection, buffer)
+        self.buffers = {}
+        if self.in_flight:
+            done, self.in_flight = await asyncio.wait(self.in_flight)
+            self._finished(done)
+
+
+def sample_text(rng: random.Random, templates: List[str]) -> str:
+    flavors = rng.choice(FLAVOR_GROUPS)
+    return rng.choice(templates).format(flavor=flavors[0].lower(), flavor2=flavors[1].lower())
+
+
+def _timestamp(rng: random.Random, now: datetime) -> datetime:
+    return now - timedelta(seconds=int(rng.random() * HISTORY_DAYS * 86400))
+
+
+async def generate_dataset(
+    db,
+    spec: DatasetSpec,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    progress: Optional[Callable[[Dict[str, int]], None]] = None
+) -> Dict[str, int]:
+    """Stream the dataset described by `spec` into `db`; returns documents inserted per collection"""
+    now = datetime.utcnow()
+    seed = spec.seed
+    writer = BulkInserter(db, batch_size, concurrency, progress)
+
+    cigar_ids = [synthetic_id("cigar", i, seed) for i in range(spec.cigars)]
+    user_ids = [str(synthetic_id("user", i, seed)) for i in range(spec.users)]
+    cigar_order = popularity_order(spec.cigars, seed, "cigar")
+    user_order = popularity_order(spec.users, seed, "user")
+
+    # Underlying quality each cigar's ratings scatter around
+    quality_rng = random.Random(f"{seed}:quality")
+    quality = [quality_rng.uniform(5.5, 9.5) for _ in range(spec.cigars)]
+    rating_sums = [0.0] * spec.cigars
+    rating_counts = [0] * spec.cigars
+    favorite_counts = [0] * spec.cigars
+    comment_counts = [0] * spec.cigars
+
+    # Nobody rates, favorites or annotates more than a quarter of the catalog
+    per_user_cap = max(1, spec.cigars // 4)
+
+    # Users
+    password_hash = hash_password(LOADTEST_PASSWORD)
+    rng = random.Random(f"{seed}:users")
+    for i, user_id in enumerate(user_ids):
+        username = f"loadtest{i:07d}"
+        email = f"{username}@example.com"
+        await writer.add("users", {
+            "_id": ObjectId(user_id),
+            "username": username,
+            "username_normalized": username,
+            "email": email,
+            "email_normalized": email,
+            "password_hash": password_hash,
+            "profile_pic": None,
+            "preferences": {},
+            "created_at": _timestamp(rng, now),
+        })
+
+    # Ratings, favorites and notes: Zipf activity per user over Zipf-popular cigars
+    for kind, total in (("ratings", spec.ratings), ("favorites", spec.favorites), ("user_notes", spec.notes)):
+        rng = random.Random(f"{seed}:{kind}")
+        cigars = Zipf(spec.cigars, CIGAR_ZIPF_S, rng)
+        for user_index, count in enumerate(allocate(total, spec.users, USER_ZIPF_S, per_user_cap, rng)):
+            for rank in cigars.distinct(count):
+                c = cigar_order[rank]
+                at = _timestamp(rng, now)
+                doc = {"user_id": user_ids[user_index], "cigar_id": cigar_ids[c]}
+                if kind == "ratings":
+                    rating = min(10.0, max(1.0, round(rng.gauss(quality[c], 1.2), 1)))
+                    rating_sums[c] += rating
+                    rating_counts[c] += 1
+                    doc.update(rating=rating, created_at=at)
+                elif kind == "favorites":
+                    favorite_counts[c] += 1
+                    doc["added_at"] = at
+                else:
+                    doc.update(note_text=sample_text(rng, NOTE_TEMPLATES), created_at=at, updated_at=at)
+                await writer.add(kind, doc)
+
+    # Comments, some of them replies to the latest comment on the same cigar
+    rng = random.Random(f"{seed}:comments")
+    cigars = Zipf(spec.cigars, CIGAR_ZIPF_S, rng)
+    authors = Zipf(spec.users, USER_ZIPF_S, rng)
+    latest_comment: Dict[int, str] = {}
+    for i in range(spec.comments):
+        c = cigar_order[cigars.sample()]
+        comment_id = synthetic_id("comment", i, seed)
+        parent_id = latest_comment.get(c) if rng.random() < REPLY_RATE else None
+        latest_comment[c] = str(comment_id)
+        comment_counts[c] += 1
+        await writer.add("comments", {
+            "_id": comment_id,
+            "cigar_id": cigar_ids[c],
+            "user_id": user_ids[user_order[authors.sample()]],
+            "text": sample_text(rng, COMMENT_TEMPLATES),
+            "parent_id": parent_id,
+            "images": [],
+            "created_at": _timestamp(rng, now),
+        })
+
+    # Cigars last, carrying the aggregates of everything above
+    rng = random.Random(f"{seed}:catalog")
+    keys = set()
+    for i, cigar in enumerate(iter_cigars(spec.cigars, random.Random(f"{seed}:cigars"))):
+        # catalog_key is unique, and generated names repeat in large catalogs
+        if catalog_key(cigar["brand"], cigar["name"]) in keys:
+            cigar["name"] = f"{cigar['name']} {i}"
+        keys.add(catalog_key(cigar["brand"], cigar["name"]))
+        cigar["_id"] = cigar_ids[i]
+        cigar["created_at"] = _timestamp(rng, now)
+        cigar["average_rating"] = round(rating_sums[i] / rating_counts[i], 1) if rating_counts[i] else 0.0
+        cigar["rating_count"] = rating_counts[i]
+        cigar["favorite_count"] = favorite_counts[i]
+        cigar["comment_version"] = comment_counts[i]
+        await writer.add("cigars", versioned(cigar))
+
+    await writer.flush()
+    await db.synthetic_meta.replace_one(
+        {"_id": "dataset"},
+        {**asdict(spec), "generated_at": now},
+        upsert=True
+    )
+    return writer.inserted
+
+
+async def load_manifest(db) -> Optional[DatasetSpec]:
+    """The spec of the synthetic dataset stored in `db`, if there is one"""
+    meta = await db.synthetic_meta.find_one({"_id": "dataset"})
+    if not meta:
+        return None
+    return DatasetSpec(**{name: meta[name] for name in DatasetSpec.__dataclass_fields__})
+
+
+def search_terms(seed: int) -> List[str]:
+    """Query strings in Zipf popularity order: brands, brand + series, and series alone"""
+    rng = random.Random(f"{seed}:search")
+    terms = BRANDS + [f"{rng.choice(BRANDS)} {series}" for series in SERIES] + SERIES
+    rng.shuffle(terms)
+    return terms
+
+
+def print_progress(started: float):
+    def report(inserted: Dict[str, int]):
+        total = sum(inserted.values())
+        counts = "  ".join(f"{name} {count}" for name, count in inserted.items())
+        print(f"  {counts}  ({total / (time.perf_counter() - started):.0f} docs/s)", end="\r", flush=True)
+    return report
+
+
+async def announce_dataset(db):
+    """Invalidate everything API workers and clients hold from the data this dataset replaced"""
+    # Kept across --drop so versions never repeat; with the change log empty,
+    # any older sync token gets a 410 and starts over
+    await db.counters.update_one(
+        {"_id": CATALOG_COUNTER_ID},
+        {"$inc": {"seq": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    for topic in ("catalog", "ratings", "users"):
+        await publish(db, topic, None)
+
+
+async def main(spec: DatasetSpec, batch_size: int, concurrency: int, drop: bool):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+
+    if drop:
+        for collection in (*COLLECTIONS, "cigar_changes", "synthetic_meta"):
+            await db[collection].drop()
+        print(f"🗑️  Dropped existing data in {os.environ['DB_NAME']}")
+    elif await db.cigars.find_one({}, {"_id": 1}) or await db.users.find_one({}, {"_id": 1}):
+        print(f"❌ {os.environ['DB_NAME']} already holds data; pass --drop to replace it")
+        client.close()
+        return
+
+    print(f"🎲 Generating {spec}")
+    started = time.perf_counter()
+    inserted = await generate_dataset(db, spec, batch_size, concurrency, print_progress(started))
+    elapsed = time.perf_counter() - started
+    print()
+
+    print("🔧 Building indexes...")
+    await ensure_indexes(db)
+    await announce_dataset(db)
+
+    print("=" * 60)
+    for collection, count in inserted.items():
+        print(f"✅ {collection:12s} {count:>10}")
+    total = sum(inserted.values())
+    print(f"⏱️  {total} documents in {elapsed:.1f}s ({total / elapsed:.0f} docs/s)")
+    print(f"🔑 All users log in with password {LOADTEST_PASSWORD!r}")
+    print("=" * 60)
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cigars", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--ratings", type=int, default=100000)
+    parser.add_argument("--favorites", type=int, default=None, help="Defaults to a fifth of --ratings")
+    parser.add_argument("--notes", type=int, default=None, help="Defaults to a twentieth of --ratings")
+    parser.add_argument("--comments", type=int, default=None, help="Defaults to a tenth of --ratings")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Batches written in parallel")
+    parser.add_argument("--drop", action="store_true", help="Drop existing users, cigars and activity first")
+    args = parser.parse_args()
+
+    spec = DatasetSpec(
+        cigars=args.cigars,
+        users=args.users,
+        ratings=args.ratings,
+        favorites=args.favorites if args.favorites is not None else args.ratings // 5,
+        notes=args.notes if args.notes is not None else args.ratings // 20,
+        comments=args.comments if args.comments is not None else args.ratings // 10,
+        seed=args.seed,
+    )
+    asyncio.run(main(spec, args.batch_size, args.concurrency, args.drop))
@@ -0,0 +1,60 @@
+"""
+Helpers for searching a user's own tasting notes and comments.
+
+Matching and ranking are done by MongoDB text indexes prefixed with user_id
+(see indexes.py), which are maintained on every write. This module only
+builds the highlighted snippets shown with each result.
+"""
+import re
+from typing import List
+
+SNIPPET_WIDTH = 160
+HIGHLIGHT_OPEN = "<mark>"
+HIGHLIGHT_CLOSE = "</mark>"
+
+# Common English suffixes; stripped so "cherries" highlights for "cherry"
+_SUFFIXES = ("ing", "ies", "es", "ed", "s", "y")
+
+
+def query_terms(query: str) -> List[str]:
+    """Split a search query into terms, dropping negations and phrase quotes"""
+    terms = []
+    for term in re.findall(r"-?\w+", query.lower()):
+        if not term.startswith("-"):
+            terms.append(term)
+    return terms
+
+
+def _stem(term: str) -> str:
+    for suffix in _SUFFIXES:
+        if term.endswith(suffix) and len(term) - len(suffix) >= 3:
+            return term[:-len(suffix)]
+    return term
+
+
+def term_pattern(query: str):
+    """Regex matching any word that starts with the stem of a query term"""
+    stems = sorted({_stem(t) for t in query_terms(query)}, key=len, reverse=True)
+    if not stems:
+        return None
+    return re.compile(r"\b(" + "|".join(re.escape(s) for s in stems) + r")\w*", re.IGNORECASE)
+
+
+def highlight_snippet(text: str, query: str, width: int = SNIPPET_WIDTH) -> str:
+    """Cut a window of `text` around the first match and wrap matches in <mark>"""
+    pattern = term_pattern(query)
+    if not text or pattern is None:
+        return text[:width] if text else ""
+
+    first = pattern.search(text)
+    start = 0
+    if first and len(text) > width:
+        start = max(0, min(first.start() - width // 3, len(text) - width))
+    window = text[start:start + width]
+
+    snippet = pattern.sub(lambda m: f"{HIGHLIGHT_OPEN}{m.group(0)}{HIGHLIGHT_CLOSE}", window)
+    if start > 0:
+        snippet = "…" + snippet
+    if start + width < len(text):
+        snippet = snippet + "…"
+    return snippet
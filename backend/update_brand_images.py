@@ -1,16 +1,19 @@
 """
 Update cigar images - one unique image per brand
 36 brands = 36 unique images
+
+Usage:
+    python update_brand_images.py [--batch-size 1000] [--dry-run] [--resume]
 """
-import requests
-import base64
-from io import BytesIO
-from PIL import Image
+import argparse
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
 
+from image_pipeline import fetch_to_store
+from maintenance import add_arguments, print_progress, print_report, run_maintenance
+
 load_dotenv()
 
 # 36 unique professional cigar images from Unsplash/Pexels
@@ -53,52 +56,33 @@ BRAND_IMAGES = [
     "https://images.unsplash.com/photo-1612037100444-d9756f36ef7c",
 ]
 
-def download_and_convert(url, size=(400, 400)):
-    """Download image and convert to base64"""
-    try:
-        print(f"⬇️  Downloading: {url[:50]}...")
-        response = requests.get(url, timeout=15)
-        if response.status_code == 200:
-            img = Image.open(BytesIO(response.content))
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            img.thumbnail(size, Image.Resampling.LANCZOS)
-            buffered = BytesIO()
-            img.save(buffered, format="JPEG", quality=85)
-            img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-            print(f"✅ Converted successfully")
-            return img_base64
-        else:
-            print(f"❌ HTTP {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"❌ Error: {e}")
-        return None
-
-async def update_brand_images():
+async def update_brand_images(batch_size: int, dry_run: bool, resume: bool):
     """Update all cigars with brand-specific images"""
     print("=" * 60)
     print("DOWNLOADING BRAND-SPECIFIC CIGAR IMAGES")
     print("=" * 60)
     
-    # Download all images
-    images = []
-    for url in BRAND_IMAGES:
-        img = download_and_convert(url)
-        if img:
-            images.append(img)
-    
-    print(f"\n✅ Downloaded {len(images)} images")
-    
-    if len(images) < 36:
-        print(f"⚠️  Only got {len(images)} images, expected 36")
-    
     # Connect to MongoDB
     mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
     db_name = os.getenv("DB_NAME", "test_database")
     client = AsyncIOMotorClient(mongo_url)
     db = client[db_name]
     
+    # Download all images into the image store
+    result = await fetch_to_store(db, BRAND_IMAGES)
+    for error in result.stats.errors:
+        print(f"❌ {error}")
+    images = result.image_ids()
+    
+    print(f"\n✅ {result.stats.summary()}")
+    
+    if not images:
+        print("❌ No images downloaded!")
+        client.close()
+        return
+    if len(images) < 36:
+        print(f"⚠️  Only got {len(images)} images, expected 36")
+    
     # Get all unique brands
     brands = await db.cigars.distinct("brand")
     brands = sorted(brands)
@@ -118,18 +102,23 @@ async def update_brand_images():
     
     # Update all cigars by brand
     print(f"\n🔄 Updating cigars...")
-    total_updated = 0
     
-    for brand, image in brand_image_map.items():
-        result = await db.cigars.update_many(
-            {"brand": brand},
-            {"$set": {"image": image}}
-        )
-        total_updated += result.modified_count
-        print(f"   ✅ {brand}: Updated {result.modified_count} cigars")
+    def brand_image(cigar):
+        image_id = brand_image_map.get(cigar.get("brand"))
+        return {"image": "", "image_id": image_id} if image_id else None
+    
+    stats = await run_maintenance(
+        db, "update_brand_images", brand_image,
+        projection={"brand": 1, "name": 1, "image": 1, "image_id": 1},
+        batch_size=batch_size, dry_run=dry_run, resume=resume, progress=print_progress
+    )
+    print_report(stats, dry_run)
     
-    print(f"\n🎉 Successfully updated {total_updated} cigars across {len(brands)} brands!")
+    print(f"\n🎉 Successfully updated {stats.changed} cigars across {len(brands)} brands!")
     client.close()
 
 if __name__ == "__main__":
-    asyncio.run(update_brand_images())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    args = parser.parse_args()
+    asyncio.run(update_brand_images(args.batch_size, args.dry_run, args.resume))
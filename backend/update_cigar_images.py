@@ -2,11 +2,20 @@
 Script to update cigar images with proper placeholder images
 Since we can't use trademarked brand logos without permission,
 we'll use generic cigar images from the vision agent results
+
+Images are fetched through the cached image pipeline and written to the image
+store; apply_cigar_images.py assigns them to cigars.
 """
-import requests
-import base64
-from io import BytesIO
-from PIL import Image
+import asyncio
+import os
+from typing import List
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from image_pipeline import fetch_to_store
+
+load_dotenv()
 
 # Generic cigar images from Pexels/Unsplash (royalty-free)
 CIGAR_IMAGES = [
@@ -20,51 +29,23 @@ CIGAR_IMAGES = [
     "https://images.pexels.com/photos/18705412/pexels-photo-18705412.jpeg",
 ]
 
-def download_and_convert_to_base64(url, size=(400, 400)):
-    """Download image and convert to base64"""
-    try:
-        print(f"Downloading: {url}")
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            # Open image
-            img = Image.open(BytesIO(response.content))
-            
-            # Convert to RGB if necessary
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Resize while maintaining aspect ratio
-            img.thumbnail(size, Image.Resampling.LANCZOS)
-            
-            # Convert to base64
-            buffered = BytesIO()
-            img.save(buffered, format="JPEG", quality=85)
-            img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-            
-            print(f"✅ Converted successfully")
-            return img_base64
-        else:
-            print(f"❌ Failed to download: HTTP {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"❌ Error: {e}")
-        return None
+async def store_cigar_images(db) -> List[str]:
+    """Fetch all cigar images into the image store and return their ids"""
+    result = await fetch_to_store(db, CIGAR_IMAGES)
+    print(f"✅ {result.stats.summary()}")
+    for error in result.stats.errors:
+        print(f"❌ {error}")
+    return result.image_ids()
 
-def get_cigar_images():
-    """Download and convert all cigar images to base64"""
-    base64_images = []
-    
-    for url in CIGAR_IMAGES:
-        b64 = download_and_convert_to_base64(url)
-        if b64:
-            base64_images.append(b64)
-    
-    return base64_images
+async def main():
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[os.getenv("DB_NAME", "cigar_db")]
+    image_ids = await store_cigar_images(db)
+    print(f"\n✅ {len(image_ids)} images ready in the image store")
+    client.close()
 
 if __name__ == "__main__":
     print("=" * 50)
     print("DOWNLOADING CIGAR IMAGES")
     print("=" * 50)
-    images = get_cigar_images()
-    print(f"\n✅ Successfully downloaded {len(images)} images")
-    print(f"Saved as base64 strings")
+    asyncio.run(main())
@@ -1,12 +1,18 @@
 """
 Update cigars with realistic price ranges based on 2025 market research
+
+Usage:
+    python update_realistic_prices.py [--batch-size 1000] [--dry-run] [--resume]
 """
+import argparse
 import asyncio
 import os
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 from pathlib import Path
 
+from maintenance import add_arguments, print_progress, print_report, run_maintenance
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -169,7 +175,11 @@ def get_price_for_cigar(brand, name):
     return "8-13"
 
 
-async def update_prices():
+def price_update(cigar):
+    return {"price_range": get_price_for_cigar(cigar.get("brand", ""), cigar.get("name", ""))}
+
+
+async def update_prices(batch_size: int, dry_run: bool, resume: bool):
     """Update all cigars with realistic price ranges"""
     mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
     db_name = os.getenv("DB_NAME", "test_database")
@@ -180,50 +190,26 @@ async def update_prices():
     print("UPDATING CIGAR PRICES WITH REALISTIC 2025 MARKET RANGES")
     print("=" * 60)
     
-    # Get all cigars
-    cigars = await db.cigars.find({}).to_list(10000)
-    
-    updated_count = 0
-    
-    for cigar in cigars:
-        brand = cigar.get("brand", "")
-        name = cigar.get("name", "")
-        current_price = cigar.get("price_range", "")
-        
-        # Get realistic price
-        new_price = get_price_for_cigar(brand, name)
-        
-        # Only update if different
-        if current_price != new_price:
-            await db.cigars.update_one(
-                {"_id": cigar["_id"]},
-                {"$set": {"price_range": new_price}}
-            )
-            updated_count += 1
-            if updated_count <= 20:  # Show first 20 updates
-                print(f"✅ {brand} {name[:40]:40s} | ${current_price:8s} → ${new_price}")
-    
-    if updated_count > 20:
-        print(f"   ... and {updated_count - 20} more")
-    
-    print(f"\n{'=' * 60}")
-    print(f"✅ Updated {updated_count} cigars with realistic prices")
-    print(f"{'=' * 60}")
+    stats = await run_maintenance(
+        db, "update_realistic_prices", price_update,
+        projection={"brand": 1, "name": 1, "price_range": 1},
+        batch_size=batch_size, dry_run=dry_run, resume=resume, progress=print_progress
+    )
+    print_report(stats, dry_run)
     
     # Show price distribution
-    all_cigars = await db.cigars.find({}, {"price_range": 1, "brand": 1}).to_list(10000)
-    
     print("\nPrice distribution by range:")
-    price_counts = {}
-    for c in all_cigars:
-        price = c.get("price_range", "unknown")
-        price_counts[price] = price_counts.get(price, 0) + 1
+    pipeline = [{"$group": {"_id": {"$ifNull": ["$price_range", "unknown"]}, "count": {"$sum": 1}}}]
+    price_counts = {group["_id"]: group["count"] async for group in db.cigars.aggregate(pipeline)}
     
-    for price_range in sorted(price_counts.keys()):
-        print(f"  ${price_range:12s}: {price_counts[price_range]:4d} cigars")
+    for price_range in sorted(price_counts.keys(), key=str):
+        print(f"  ${str(price_range):12s}: {price_counts[price_range]:4d} cigars")
     
     client.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(update_prices())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    args = parser.parse_args()
+    asyncio.run(update_prices(args.batch_size, args.dry_run, args.resume))
@@ -13,12 +13,14 @@ import { useRouter } from 'expo-router';
 import { Ionicons } from '@expo/vector-icons';
 import { useAuth } from '../../contexts/AuthContext';
 import api from '../../utils/api';
+import { cigarImageUri } from '../../utils/images';
 
 interface Cigar {
   id: string;
   name: string;
   brand: string;
   image: string;
+  image_url?: string | null;
   strength: string;
   origin: string;
   average_rating: number;
@@ -109,7 +111,7 @@ export default function FavoritesScreen() {
           >
             <View style={styles.cigarImageContainer}>
               <Image
-                source={{ uri: `data:image/png;base64,${cigar.image}` }}
+                source={{ uri: cigarImageUri(cigar.image, cigar.image_url) }}
                 style={styles.cigarImage}
               />
             </View>
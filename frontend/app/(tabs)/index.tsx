@@ -17,12 +17,14 @@ import { Ionicons } from '@expo/vector-icons';
 import { useSafeAreaInsets } from 'react-native-safe-area-context';
 import { useAuth } from '../../contexts/AuthContext';
 import api from '../../utils/api';
+import { cigarImageUri } from '../../utils/images';
 
 interface Cigar {
   id: string;
   name: string;
   brand: string;
   image: string;
+  image_url?: string | null;
   strength: string;
   origin: string;
   average_rating: number;
@@ -210,9 +212,9 @@ export default function HomeScreen() {
       onPress={() => handleCigarPress(cigar.id)}
     >
       <View style={styles.cigarImageContainer}>
-        {cigar.image ? (
+        {cigarImageUri(cigar.image, cigar.image_url) ? (
           <Image
-            source={{ uri: `data:image/jpeg;base64,${cigar.image}` }}
+            source={{ uri: cigarImageUri(cigar.image, cigar.image_url) }}
             style={styles.cigarImage}
             resizeMode="contain"
           />
@@ -21,13 +21,15 @@ import { useSafeAreaInsets } from 'react-native-safe-area-context';
 import * as ImagePicker from 'expo-image-picker';
 import { useAuth } from '../../contexts/AuthContext';
 import api from '../../utils/api';
+import { cigarImageUri } from '../../utils/images';
 
 interface Cigar {
   id: string;
   name: string;
   brand: string;
-  image: string;
-  images: string[];
+  image?: string;
+  image_url?: string | null;
+  images?: string[];
   strength: string;
   flavor_notes: string[];
   origin: string;
@@ -394,9 +396,9 @@ export default function CigarDetailsScreen() {
 
       <ScrollView style={styles.content}>
         <View style={styles.imageContainer}>
-          {cigar.image ? (
+          {cigarImageUri(cigar.image, cigar.image_url) ? (
             <Image
-              source={{ uri: `data:image/jpeg;base64,${cigar.image}` }}
+              source={{ uri: cigarImageUri(cigar.image, cigar.image_url) }}
               style={styles.image}
               resizeMode="contain"
             />
@@ -419,7 +421,7 @@ export default function CigarDetailsScreen() {
               <>
                 <Ionicons name="camera" size={20} color="#fff" />
                 <Text style={styles.uploadButtonText}>
-                  {cigar.image ? 'Change Photo' : 'Upload Photo'}
+                  {cigarImageUri(cigar.image, cigar.image_url) ? 'Change Photo' : 'Upload Photo'}
                 </Text>
               </>
             )}
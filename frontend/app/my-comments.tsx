@@ -14,6 +14,7 @@ import { Ionicons } from '@expo/vector-icons';
 import { useSafeAreaInsets } from 'react-native-safe-area-context';
 import { useAuth } from '../contexts/AuthContext';
 import api from '../utils/api';
+import { cigarImageUri } from '../utils/images';
 
 interface UserComment {
   id: string;
@@ -23,6 +24,7 @@ interface UserComment {
   cigar_name: string;
   cigar_brand: string;
   cigar_image: string;
+  cigar_image_url?: string | null;
 }
 
 export default function MyCommentsScreen() {
@@ -108,9 +110,9 @@ export default function MyCommentsScreen() {
             >
               <View style={styles.cigarInfo}>
                 <View style={styles.cigarImageContainer}>
-                  {comment.cigar_image ? (
+                  {cigarImageUri(comment.cigar_image, comment.cigar_image_url) ? (
                     <Image
-                      source={{ uri: `data:image/jpeg;base64,${comment.cigar_image}` }}
+                      source={{ uri: cigarImageUri(comment.cigar_image, comment.cigar_image_url) }}
                       style={styles.cigarImage}
                     />
                   ) : (
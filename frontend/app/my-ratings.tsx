@@ -13,6 +13,7 @@ import { Ionicons } from '@expo/vector-icons';
 import { useSafeAreaInsets } from 'react-native-safe-area-context';
 import { useAuth } from '../contexts/AuthContext';
 import api from '../utils/api';
+import { cigarImageUri } from '../utils/images';
 
 interface UserRating {
   id: string;
@@ -22,6 +23,7 @@ interface UserRating {
   cigar_name: string;
   cigar_brand: string;
   cigar_image: string;
+  cigar_image_url?: string | null;
   cigar_strength: string;
   cigar_origin: string;
   average_rating: number;
@@ -70,7 +72,7 @@ export default function MyRatingsScreen() {
     >
       <View style={styles.cigarImageContainer}>
         <Image
-          source={{ uri: `data:image/jpeg;base64,${rating.cigar_image}` }}
+          source={{ uri: cigarImageUri(rating.cigar_image, rating.cigar_image_url) }}
           style={styles.cigarImage}
           resizeMode="contain"
         />
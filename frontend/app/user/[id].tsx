@@ -13,12 +13,14 @@ import { useRouter, useLocalSearchParams } from 'expo-router';
 import { Ionicons } from '@expo/vector-icons';
 import { useSafeAreaInsets } from 'react-native-safe-area-context';
 import api from '../../utils/api';
+import { cigarImageUri } from '../../utils/images';
 
 interface Cigar {
   id: string;
   brand: string;
   name: string;
   image?: string;
+  image_url?: string | null;
   average_rating: number;
   rating_count: number;
   user_rating?: number;
@@ -29,7 +31,7 @@ interface UserProfile {
   username: string;
   email?: string;
   profile_pic?: string;
-  favorites?: string[];
+  favorites_count?: number;
   created_at: string;
   added_cigars: Cigar[];
   rated_cigars: Cigar[];
@@ -116,7 +118,7 @@ export default function UserProfileScreen() {
           <View style={styles.statItem}>
             <Ionicons name="star" size={32} color="#8B4513" />
             <Text style={styles.statLabel}>Favorites</Text>
-            <Text style={styles.statValue}>{profile.favorites?.length || 0}</Text>
+            <Text style={styles.statValue}>{profile.favorites_count || 0}</Text>
           </View>
           <View style={styles.statItem}>
             <Ionicons name="add-circle" size={32} color="#4CAF50" />
@@ -140,9 +142,9 @@ export default function UserProfileScreen() {
                 onPress={() => router.push(`/cigar/${cigar.id}`)}
               >
                 <View style={styles.cigarImageContainer}>
-                  {cigar.image ? (
+                  {cigarImageUri(cigar.image, cigar.image_url) ? (
                     <Image
-                      source={{ uri: `data:image/jpeg;base64,${cigar.image}` }}
+                      source={{ uri: cigarImageUri(cigar.image, cigar.image_url) }}
                       style={styles.cigarImage}
                     />
                   ) : (
@@ -174,9 +176,9 @@ export default function UserProfileScreen() {
                 onPress={() => router.push(`/cigar/${cigar.id}`)}
               >
                 <View style={styles.cigarImageContainer}>
-                  {cigar.image ? (
+                  {cigarImageUri(cigar.image, cigar.image_url) ? (
                     <Image
-                      source={{ uri: `data:image/jpeg;base64,${cigar.image}` }}
+                      source={{ uri: cigarImageUri(cigar.image, cigar.image_url) }}
                       style={styles.cigarImage}
                     />
                   ) : (
@@ -0,0 +1,12 @@
+const API_URL = process.env.EXPO_PUBLIC_BACKEND_URL;
+
+// Inline base64 images (user uploads) win; catalog images from the image store are served by URL
+export function cigarImageUri(image?: string | null, imageUrl?: string | null): string | undefined {
+  if (image) {
+    return `data:image/jpeg;base64,${image}`;
+  }
+  if (imageUrl) {
+    return `${API_URL}${imageUrl}`;
+  }
+  return undefined;
+}
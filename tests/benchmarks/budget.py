@@ -0,0 +1,114 @@
+"""
+Latency budgets, the committed regression baseline and the benchmark history.
+
+A result fails when it breaks the absolute budget in budgets.json, or when
+its p95 is more than `tolerance` and `regression_floor_ms` above the p95 in
+baseline.json for the same backend. Only p95 is gated, and only for results
+with at least `min_samples` samples; medians of short runs and throughput
+swing too much between runs, and so do microsecond timings in relative terms.
+
+Passing runs are appended to the history file (.benchmarks/ is not
+committed; CI keeps it in its cache). baseline.json is committed and is
+rebuilt from the median p95 of the last `baseline_runs` recorded runs with
+BENCH_UPDATE_BASELINE=1, on the machine the gate runs on.
+"""
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from statistics import median
+from typing import List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent.parent
+
+BUDGETS_PATH = BENCH_DIR / "budgets.json"
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+HISTORY_PATH = Path(os.getenv("BENCH_HISTORY", REPO_ROOT / ".benchmarks" / "history.json"))
+
+# The only metric compared with the baseline, lower is better
+REGRESSION_METRIC = "p95_ms"
+
+
+def load_budgets() -> dict:
+    return json.loads(BUDGETS_PATH.read_text())
+
+
+def load_history() -> List[dict]:
+    if not HISTORY_PATH.exists():
+        return []
+    return json.loads(HISTORY_PATH.read_text())
+
+
+def load_baseline() -> dict:
+    """backend -> benchmark name -> baseline p95"""
+    if not BASELINE_PATH.exists():
+        return {}
+    return json.loads(BASELINE_PATH.read_text())
+
+
+def append_history(backend: str, results: dict):
+    history = load_history()
+    history.append({
+        "at": datetime.utcnow().isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "backend": backend,
+        "results": results,
+    })
+    HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    HISTORY_PATH.write_text(json.dumps(history, indent=2))
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def update_baseline(history: List[dict], runs: int) -> dict:
+    """Rewrite baseline.json with the median p95 of the last `runs` recorded runs per backend and benchmark"""
+    values = {}
+    for entry in history:
+        for name, result in entry["results"].items():
+            if isinstance(result.get(REGRESSION_METRIC), (int, float)):
+                values.setdefault(entry["backend"], {}).setdefault(name, []).append(result[REGRESSION_METRIC])
+    base = {
+        backend: {name: {REGRESSION_METRIC: round(median(p95s[-runs:]), 4)} for name, p95s in sorted(names.items())}
+        for backend, names in sorted(values.items())
+    }
+    BASELINE_PATH.write_text(json.dumps(base, indent=2) + "\n")
+    return base
+
+
+def samples(result: dict) -> int:
+    """Timings behind a result: requests for macro benchmarks, rounds for micro ones"""
+    return result.get("count", result.get("rounds", 0))
+
+
+def check(name: str, result: dict, budget: dict, base: dict, settings: dict) -> List[str]:
+    """Human-readable budget and regression failures for one result; `settings` is budgets.json"""
+    failures = []
+    for metric, limit in budget.items():
+        if metric.startswith("min_"):
+            value = result.get(metric[len("min_"):])
+            if value is not None and value < limit:
+                failures.append(f"{name}: {metric[len('min_'):]} {value} below budget {limit}")
+        elif result.get(metric) is not None and result[metric] > limit:
+            failures.append(f"{name}: {metric} {result[metric]} over budget {limit}")
+
+    value, previous = result.get(REGRESSION_METRIC), base.get(REGRESSION_METRIC)
+    if value is None or not previous or samples(result) < settings["min_samples"]:
+        return failures
+    tolerance = settings["tolerance"]
+    if value > previous * (1 + tolerance) and value - previous > settings["regression_floor_ms"]:
+        failures.append(
+            f"{name}: {REGRESSION_METRIC} {value} regressed more than {tolerance:.0%} from baseline {previous}"
+        )
+    return failures
@@ -0,0 +1,131 @@
+"""
+Fixtures for the benchmark suite.
+
+Benchmarks are slow and machine-dependent, so they only run with
+RUN_BENCHMARKS=1:
+
+    RUN_BENCHMARKS=1 python -m pytest tests/benchmarks -q
+
+The API runs in-process behind httpx's ASGI transport. It talks to the
+MongoDB at BENCH_MONGO_URL (database BENCH_DB_NAME, dropped and regenerated
+from synthetic.py) when one answers, and to mongomock-motor otherwise.
+
+The full suite needs a real mongod: mongomock cannot evaluate the get_cigar,
+my_ratings and mixed pipelines, so those scenarios fail on mongomock unless
+BENCH_ALLOW_PARTIAL=1 explicitly accepts skipping them.
+Passing results of the whole session are appended to the history file at
+the end; BENCH_UPDATE_BASELINE=1 then rebuilds the committed baseline.json
+from that history (see budget.py).
+"""
+import asyncio
+import os
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "cigar_ranker_test")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+# The dataset comes from synthetic.py, never the seed catalog
+os.environ.setdefault("SEED_ON_STARTUP", "false")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / "backend"))
+
+from .budget import BENCH_DIR, append_history, load_baseline, load_budgets, load_history, update_baseline  # noqa: E402
+
+RUN_BENCHMARKS = os.getenv("RUN_BENCHMARKS") == "1"
+
+BENCH_MONGO_URL = os.getenv("BENCH_MONGO_URL", os.environ["MONGO_URL"])
+BENCH_DB_NAME = os.getenv("BENCH_DB_NAME", "cigar_ranker_bench")
+
+# Dataset sizes per backend; mongomock scans collections in Python
+DATASETS = {
+    "mongod": dict(cigars=5000, users=1000, ratings=100000, favorites=20000, notes=5000, comments=10000),
+    "mongomock": dict(cigars=500, users=100, ratings=3000, favorites=600, notes=150, comments=500),
+}
+
+
+def pytest_collection_modifyitems(config, items):
+    if RUN_BENCHMARKS:
+        return
+    skip = pytest.mark.skip(reason="benchmarks only run with RUN_BENCHMARKS=1")
+    for item in items:
+        if BENCH_DIR in Path(str(item.fspath)).resolve().parents:
+            item.add_marker(skip)
+
+
+@dataclass
+class BenchApp:
+    backend: str
+    db: object
+    spec: object
+    loop: asyncio.AbstractEventLoop
+
+
+async def _connect():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo.errors import PyMongoError
+
+    client = AsyncIOMotorClient(BENCH_MONGO_URL, serverSelectionTimeoutMS=1500)
+    try:
+        await client.admin.command("ping")
+        return "mongod", client[BENCH_DB_NAME]
+    except PyMongoError:
+        client.close()
+    mongomock_motor = pytest.importorskip("mongomock_motor", reason="needs a MongoDB or mongomock-motor")
+    return "mongomock", mongomock_motor.AsyncMongoMockClient()[BENCH_DB_NAME]
+
+
+@pytest.fixture(scope="session")
+def bench_app():
+    """The API wired to a freshly generated synthetic dataset"""
+    pytest.importorskip("httpx")
+    server = pytest.importorskip("server")
+    import synthetic
+    from indexes import ensure_indexes
+
+    loop = asyncio.new_event_loop()
+    backend, db = loop.run_until_complete(_connect())
+    spec = synthetic.DatasetSpec(seed=int(os.getenv("BENCH_SEED", "1")), **DATASETS[backend])
+
+    async def prepare():
+        for collection in (*synthetic.COLLECTIONS, "cigar_changes", "counters", "synthetic_meta"):
+            await db[collection].drop()
+        await synthetic.generate_dataset(db, spec)
+        if backend == "mongod":
+            await ensure_indexes(db)
+
+    loop.run_until_complete(prepare())
+    if backend == "mongomock":
+        # mongomock has neither sessions nor read preferences
+        import mongo_client
+        mongo_client.MONGO_SECONDARY_READS = False
+    server.db = db
+    yield BenchApp(backend, db, spec, loop)
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def budgets():
+    return load_budgets()
+
+
+@pytest.fixture(scope="session")
+def baseline():
+    """Committed p95 per backend and benchmark that results are compared with"""
+    return load_baseline()
+
+
+@pytest.fixture(scope="session")
+def bench_results(budgets):
+    """Passing summaries per backend ("local" for micro benchmarks); written to the history file when the session ends"""
+    results = defaultdict(dict)
+    yield results
+    if os.getenv("BENCH_RECORD", "1") == "1":
+        for backend, entries in results.items():
+            if entries:
+                append_history(backend, entries)
+    if os.getenv("BENCH_UPDATE_BASELINE") == "1":
+        update_baseline(load_history(), budgets["baseline_runs"])
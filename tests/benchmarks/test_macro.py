@@ -0,0 +1,64 @@
+"""
+End-to-end latency of the main endpoints, driven in-process with replay.py.
+
+Each scenario sends BENCH_REQUESTS requests from BENCH_CONCURRENCY virtual
+users BENCH_REPEATS times, and keeps the run with the median p95 to damp
+one-off stalls. It records p50/p95/p99 and throughput.
+"""
+import os
+
+import pytest
+
+from .budget import REGRESSION_METRIC, check
+
+BENCH_REQUESTS = int(os.getenv("BENCH_REQUESTS", "200"))
+BENCH_CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "8"))
+BENCH_REPEATS = int(os.getenv("BENCH_REPEATS", "3"))
+WARMUP_REQUESTS = 20
+
+SCENARIOS = {
+    "search": {"search": 1},
+    "get_cigar": {"get_cigar": 1},
+    "create_rating": {"create_rating": 1},
+    "get_comments": {"get_comments": 1},
+    "my_ratings": {"my_ratings": 1},
+    "upload_image": {"upload_image": 1},
+    "mixed": None,
+}
+
+# Pipelines mongomock cannot evaluate ($or in projections, $convert in $lookup)
+MONGOMOCK_UNSUPPORTED = {"get_cigar", "my_ratings", "mixed"}
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_endpoint_latency(scenario, bench_app, bench_results, budgets, baseline):
+    import httpx
+    import server
+    from replay import ENDPOINT_MIX, run_traffic
+
+    if bench_app.backend == "mongomock" and scenario in MONGOMOCK_UNSUPPORTED:
+        if os.getenv("BENCH_ALLOW_PARTIAL") == "1":
+            pytest.skip(f"{scenario} needs a real MongoDB")
+        pytest.fail(f"{scenario} needs a real MongoDB at BENCH_MONGO_URL; set BENCH_ALLOW_PARTIAL=1 to skip it")
+    mix = SCENARIOS[scenario] or ENDPOINT_MIX
+    requests = BENCH_REQUESTS // 4 if scenario == "upload_image" else BENCH_REQUESTS
+
+    async def measure():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await run_traffic(client, bench_app.spec, mix, BENCH_CONCURRENCY, requests=WARMUP_REQUESTS, seed=-1)
+            return [
+                (await run_traffic(client, bench_app.spec, mix, BENCH_CONCURRENCY, requests=requests, seed=i)).summary()
+                for i in range(BENCH_REPEATS)
+            ]
+
+    summaries = bench_app.loop.run_until_complete(measure())
+    for summary in summaries:
+        assert summary["total"]["errors"] == 0, summary["operations"]
+    result = sorted((s["total"] for s in summaries), key=lambda total: total[REGRESSION_METRIC])[len(summaries) // 2]
+
+    budget = budgets["macro"][bench_app.backend].get(scenario, {})
+    base = baseline.get(bench_app.backend, {}).get(scenario, {})
+    failures = check(scenario, result, budget, base, budgets)
+    assert not failures, "\n".join(failures)
+    bench_results[bench_app.backend][scenario] = result
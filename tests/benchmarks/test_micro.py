@@ -0,0 +1,65 @@
+"""
+Hot pure-Python paths of a request, timed with pytest-benchmark.
+"""
+import pytest
+
+from .budget import check
+
+pytest.importorskip("pytest_benchmark")
+
+MICRO_BACKEND = "local"
+
+
+def _photo() -> bytes:
+    from replay import upload_photo
+    return upload_photo()
+
+
+def _search_page():
+    from bench_encoding import make_search_page
+    return make_search_page(image_kb=40)
+
+
+def _cases():
+    """name -> (setup, function); setup runs once and returns the function's arguments"""
+    from auth import create_access_token, decode_access_token
+    from bench_encoding import fetch, route_client
+    from http_cache import make_etag
+    from image_pipeline import render_image
+    from projections import cigar_projection
+    from server import serialize_doc
+
+    return {
+        "encode_search_page": (lambda: (route_client(_search_page()), "cards"), fetch),
+        "serialize_doc": (lambda: (_search_page()[0],), serialize_doc),
+        "cigar_projection": (lambda: ("name,brand,strength,origin,average_rating",), cigar_projection),
+        "make_etag": (lambda: (42, "2026-01-01T00:00:00", "search"), make_etag),
+        "decode_access_token": (lambda: (create_access_token("0" * 24, "bench"),), decode_access_token),
+        "resize_upload": (lambda: (_photo(), (800, 800), 85), render_image),
+    }
+
+
+CASES = ["encode_search_page", "serialize_doc", "cigar_projection", "make_etag", "decode_access_token", "resize_upload"]
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_micro(name, benchmark, bench_results, budgets, baseline):
+    pytest.importorskip("server")
+    from replay import percentile
+
+    setup, function = _cases()[name]
+    args = setup()
+    benchmark(function, *args)
+
+    stats = benchmark.stats.stats
+    result = {
+        "median_ms": round(stats.median * 1000, 4),
+        "p95_ms": round(percentile(stats.sorted_data, 0.95) * 1000, 4),
+        "rounds": stats.rounds,
+    }
+
+    budget = budgets["micro"].get(name, {})
+    base = baseline.get(MICRO_BACKEND, {}).get(name, {})
+    failures = check(name, result, budget, base, budgets)
+    assert not failures, "\n".join(failures)
+    bench_results[MICRO_BACKEND][name] = result
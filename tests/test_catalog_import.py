@@ -0,0 +1,75 @@
+"""
+Catalog imports against cigars stored before imports were keyed, on mongomock.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("JWT_SECRET", "test-secret")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+from catalog_import import backfill_catalog_keys, import_cigars  # noqa: E402
+
+PADRON = {"brand": "Padron", "name": "1964 Anniversary Maduro", "strength": "Full", "origin": "Nicaragua"}
+
+
+def _db():
+    return mongomock_motor.AsyncMongoMockClient()["catalog_import_test"]
+
+
+def test_reimport_matches_legacy_cigar():
+    async def run():
+        db = _db()
+        # Stored by an old add_* script: no catalog_key
+        await db.cigars.insert_one({**PADRON, "average_rating": 4.5, "rating_count": 12})
+        stats = await import_cigars(db, [PADRON])
+        return stats, await db.cigars.count_documents({"name": PADRON["name"]})
+
+    stats, count = asyncio.run(run())
+    assert (stats.keyed, stats.inserted, stats.unchanged) == (1, 0, 1)
+    assert count == 1
+
+
+def test_defaults_fill_missing_fields_on_insert_only():
+    defaults = {"price_range": "15-20", "binder": "Mixed", "flavor_notes": ["Leather", "Wood", "Spice"]}
+
+    async def run():
+        db = _db()
+        await import_cigars(db, [PADRON, {**PADRON, "name": "Family Reserve", "flavor_notes": ["Cocoa"]}],
+                            defaults=defaults)
+        await db.cigars.update_one({"name": PADRON["name"]}, {"$set": {"price_range": "22-25"}})
+        await import_cigars(db, [PADRON], defaults=defaults)
+        return {doc["name"]: doc async for doc in db.cigars.find()}
+
+    cigars = asyncio.run(run())
+    anniversary, reserve = cigars[PADRON["name"]], cigars["Family Reserve"]
+    assert anniversary["binder"] == "Mixed"
+    assert anniversary["flavor_notes"] == ["Leather", "Wood", "Spice"]
+    assert anniversary["price_range"] == "22-25"
+    assert reserve["flavor_notes"] == ["Cocoa"]
+
+
+def test_backfill_keys_one_copy_of_a_duplicate():
+    async def run():
+        db = _db()
+        await db.cigars.insert_many([dict(PADRON), dict(PADRON)])
+        await backfill_catalog_keys(db)
+        return await db.cigars.count_documents({"catalog_key": {"$type": "string"}})
+
+    assert asyncio.run(run()) == 1
+
+
+def test_dry_run_writes_nothing():
+    async def run():
+        db = _db()
+        await db.cigars.insert_many([dict(PADRON), dict(PADRON)])
+        stats = await import_cigars(db, [PADRON, {**PADRON, "name": "Family Reserve"}], dry_run=True)
+        return stats, await db.cigars.count_documents({}), await db.cigars.count_documents({"catalog_key": {"$exists": True}})
+
+    stats, total, keyed = asyncio.run(run())
+    assert (stats.keyed, stats.unkeyed, stats.inserted) == (0, 2, 2)
+    assert (total, keyed) == (2, 0)
@@ -0,0 +1,40 @@
+"""
+Legacy users.favorites arrays moved into the favorites collection, on mongomock.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("JWT_SECRET", "test-secret")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+from migrate_favorites import copy_favorites, recount_favorites  # noqa: E402
+
+
+def test_arrays_become_rows_and_counts_are_versioned():
+    async def run():
+        db = mongomock_motor.AsyncMongoMockClient()["favorites_migration_test"]
+        cigars = (await db.cigars.insert_many([
+            {"name": "A", "favorite_count": 0, "version": 1},
+            {"name": "B", "favorite_count": 1, "version": 1},
+            {"name": "C", "favorite_count": 3, "version": 1},
+        ])).inserted_ids
+        user = await db.users.insert_one({"username": "ana", "favorites": [str(cigars[1]), str(cigars[0])]})
+        copied, seen = await copy_favorites(db, 500)
+        updated = await recount_favorites(db, seen, 500)
+        rows = await db.favorites.find({"user_id": str(user.inserted_id)}).sort("added_at", -1).to_list(10)
+        stored = {c["name"]: c async for c in db.cigars.find()}
+        return cigars, copied, updated, rows, stored, await db.cigar_changes.count_documents({})
+
+    cigars, copied, updated, rows, stored, changes = asyncio.run(run())
+    # Later array entries are newer
+    assert [row["cigar_id"] for row in rows] == [cigars[0], cigars[1]]
+    assert (copied, updated, changes) == (2, 1, 1)
+    assert (stored["A"]["favorite_count"], stored["A"]["version"]) == (1, 2)
+    # Already right, and not in any array: left alone
+    assert stored["B"]["version"] == 1
+    assert stored["C"]["favorite_count"] == 3
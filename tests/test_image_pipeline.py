@@ -0,0 +1,75 @@
+"""
+Image pipeline against a local file server standing in for the image CDNs.
+
+http.server answers If-Modified-Since with 304, which is enough to check that
+re-runs revalidate instead of downloading and skip re-rendering.
+"""
+import asyncio
+import functools
+import os
+import sys
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+pytest.importorskip("aiohttp")
+Image = pytest.importorskip("PIL.Image")
+from image_pipeline import fetch_images  # noqa: E402
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def write_image(path: Path, color, size=(900, 600)):
+    buffered = BytesIO()
+    Image.new("RGB", size, color).save(buffered, format="PNG")
+    path.write_bytes(buffered.getvalue())
+
+
+@pytest.fixture
+def image_server(tmp_path):
+    root = tmp_path / "cdn"
+    root.mkdir()
+    write_image(root / "a.png", "brown")
+    write_image(root / "b.png", "black")
+    handler = functools.partial(QuietHandler, directory=str(root))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield root, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def run(urls, cache_dir):
+    return asyncio.run(fetch_images(urls, size=(200, 200), concurrency=2, cache_dir=cache_dir, processes=1))
+
+
+def test_fetch_renders_and_rerun_skips_unchanged(image_server, tmp_path):
+    root, base = image_server
+    urls = [f"{base}/a.png", f"{base}/b.png", f"{base}/missing.png"]
+    cache_dir = tmp_path / "cache"
+
+    first = run(urls, cache_dir)
+    assert (first.stats.downloaded, first.stats.rendered, first.stats.failed) == (2, 2, 1)
+    assert first.images[f"{base}/missing.png"] is None
+    rendered = Image.open(BytesIO(first.images[f"{base}/a.png"]))
+    assert rendered.format == "JPEG" and max(rendered.size) == 200
+
+    second = run(urls, cache_dir)
+    assert (second.stats.downloaded, second.stats.not_modified, second.stats.rendered) == (0, 2, 0)
+    assert second.image_ids() == first.image_ids()
+
+    # A changed upstream image is downloaded and rendered again
+    write_image(root / "b.png", "white")
+    os.utime(root / "b.png", (os.path.getmtime(root / "b.png") + 5,) * 2)
+    third = run(urls, cache_dir)
+    assert (third.stats.downloaded, third.stats.not_modified, third.stats.rendered) == (1, 1, 1)
+    assert third.image_ids()[0] == first.image_ids()[0]
+    assert third.image_ids()[1] != first.image_ids()[1]
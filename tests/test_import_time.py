@@ -0,0 +1,57 @@
+"""
+Cold-import budget for the API module, measured with `python -X importtime`.
+
+Worker startup and respawn pay this cost, so seed data and optional SDKs must
+stay out of the import graph. The budget can be raised on slow machines with
+IMPORT_TIME_BUDGET_MS.
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+
+# Only needed for first-run seeding or on first use of an endpoint
+LAZY_MODULES = {"cigar_images_data", "cigar_seed_data", "generate_cigars", "seed", "emergentintegrations", "openai", "price_scraper"}
+
+
+def _import_server():
+    env = {
+        **os.environ,
+        "MONGO_URL": os.getenv("MONGO_URL", "mongodb://localhost:27017"),
+        "DB_NAME": os.getenv("DB_NAME", "cigar_ranker_test"),
+        "JWT_SECRET": os.getenv("JWT_SECRET", "test-secret"),
+    }
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    if result.returncode != 0:
+        if "ModuleNotFoundError" in result.stderr:
+            pytest.skip(f"server dependencies are not installed: {result.stderr.strip().splitlines()[-1]}")
+        pytest.fail(result.stderr)
+
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports[name.strip()] = int(cumulative)
+    return imports
+
+
+def test_server_import_stays_within_budget():
+    imports = _import_server()
+    total_ms = imports["server"] / 1000
+    assert total_ms <= IMPORT_TIME_BUDGET_MS, f"import server took {total_ms:.0f}ms (budget {IMPORT_TIME_BUDGET_MS:.0f}ms)"
+
+
+def test_server_import_skips_seed_data_and_sdks():
+    imported = {name.split(".")[0] for name in _import_server()}
+    assert not imported & LAZY_MODULES
@@ -0,0 +1,60 @@
+"""
+WorkerCache behaviour under bus messages, without a database.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("JWT_SECRET", "test-secret")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+pytest.importorskip("cachetools")
+import invalidation  # noqa: E402
+from invalidation import bus, worker_cache  # noqa: E402
+
+
+@pytest.fixture
+def live_bus(monkeypatch):
+    monkeypatch.setattr(bus, "live", True)
+    monkeypatch.setattr(invalidation, "WORKER_CACHE_ENABLED", True)
+
+
+def test_messages_drop_tagged_entries(live_bus):
+    cache = worker_cache("test_tags", 10, catalog=True, users=True)
+    generation = cache.generation
+    cache.set("a", 1, generation, ["cigar-1", "user-1"])
+    cache.set("b", 2, generation, ["cigar-2"])
+
+    bus.dispatch("catalog", ["cigar-2"])
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+
+    bus.dispatch("users", ["user-1"])
+    assert cache.get("a") is None
+
+
+def test_untagged_topic_clears_everything(live_bus):
+    cache = worker_cache("test_clear", 10, catalog=False)
+    cache.set("a", 1, cache.generation)
+    bus.dispatch("catalog", ["anything"])
+    assert cache.get("a") is None
+
+
+def test_result_read_before_a_message_is_not_stored(live_bus):
+    cache = worker_cache("test_generation", 10, ratings=True)
+    generation = cache.generation
+    bus.dispatch("ratings", ["cigar-1"])
+    cache.set("a", "stale", generation, ["cigar-1"])
+    assert cache.get("a") is None
+
+
+def test_bypassed_while_bus_is_down(live_bus):
+    cache = worker_cache("test_down", 10, catalog=True)
+    cache.set("a", 1, cache.generation)
+    bus.live = False
+    assert cache.get("a") is None
+    cache.set("b", 2, cache.generation)
+    bus.live = True
+    assert cache.get("b") is None
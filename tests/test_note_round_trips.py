@@ -0,0 +1,94 @@
+"""
+Round trips per tasting-note save, measured with a pymongo CommandListener.
+
+Needs a reachable MongoDB (MONGO_URL, default mongodb://localhost:27017); the
+test is skipped when none is available.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "cigar_ranker_test")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+pytest.importorskip("httpx")
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+from pymongo import monitoring  # noqa: E402
+
+server = pytest.importorskip("server")
+from auth import create_access_token  # noqa: E402
+
+# Dropped at the end of the test, so never taken from DB_NAME
+TEST_DB_NAME = "cigar_ranker_note_round_trips_test"
+
+# Commands that are bookkeeping rather than work done for the request
+IGNORED_COMMANDS = {"hello", "isMaster", "ismaster", "ping", "endSessions", "saslStart", "saslContinue"}
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.command_name not in IGNORED_COMMANDS:
+            self.commands.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def _save_note_commands():
+    import httpx
+
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(
+        os.environ["MONGO_URL"], event_listeners=[counter], serverSelectionTimeoutMS=2000
+    )
+    try:
+        await client.admin.command("ping")
+    except Exception:
+        client.close()
+        pytest.skip("MongoDB is not reachable")
+
+    db = client[TEST_DB_NAME]
+    server.db = db
+    try:
+        await server.create_indexes()
+        cigar = await db.cigars.insert_one({"brand": "Test", "name": "Round Trip"})
+        user_id = "000000000000000000000001"
+        headers = {"Authorization": f"Bearer {create_access_token(user_id)}"}
+
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            per_save = []
+            for text in ("first note", "second note"):
+                counter.commands.clear()
+                response = await http.post(
+                    f"/api/cigars/{cigar.inserted_id}/my-note",
+                    json={"note_text": text},
+                    headers=headers
+                )
+                assert response.status_code == 200
+                assert response.json()["note_text"] == text
+                per_save.append(list(counter.commands))
+
+        assert await db.user_notes.count_documents({"user_id": user_id}) == 1
+        return per_save
+    finally:
+        await client.drop_database(TEST_DB_NAME)
+        client.close()
+
+
+def test_note_save_is_two_round_trips():
+    per_save = asyncio.run(_save_note_commands())
+    # Cigar existence check plus one findAndModify upsert, for insert and update alike
+    for commands in per_save:
+        assert commands == ["find", "findAndModify"]
@@ -0,0 +1,36 @@
+"""
+Connection pool wait accounting, driven with synthetic pool events.
+"""
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+pytest.importorskip("pymongo")
+from metrics import MONGO_POOL_CHECKOUT_FAILURES, RequestStats, current_request, pool_listener, render  # noqa: E402
+
+ADDRESS = ("db.internal", 27017)
+
+
+def test_checkout_wait_is_attributed_to_the_request():
+    stats = RequestStats(method="GET", path="/api/cigars/search")
+    token = current_request.set(stats)
+    try:
+        pool_listener.connection_check_out_started(SimpleNamespace(address=ADDRESS))
+        time.sleep(0.01)
+        pool_listener.connection_checked_out(SimpleNamespace(address=ADDRESS, connection_id=1))
+    finally:
+        current_request.reset(token)
+
+    assert stats.pool_wait_seconds >= 0.01
+    assert 'mongo_pool_wait_seconds_count{address="db.internal:27017"}' in render()
+
+
+def test_failed_checkout_is_counted():
+    pool_listener.connection_check_out_started(SimpleNamespace(address=ADDRESS))
+    pool_listener.connection_check_out_failed(SimpleNamespace(address=ADDRESS, reason="timeout"))
+    assert any('reason="timeout"' in line for line in MONGO_POOL_CHECKOUT_FAILURES.samples())
@@ -0,0 +1,18 @@
+"""
+Parsing of cigar references read back from stored documents.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+pytest.importorskip("bson")
+from bson import ObjectId  # noqa: E402
+from refs import stored_object_ids  # noqa: E402
+
+
+def test_unparseable_references_are_skipped():
+    oid = ObjectId()
+    assert stored_object_ids([oid, str(oid), "not-an-id", None, 42]) == [oid]
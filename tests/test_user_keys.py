@@ -0,0 +1,50 @@
+"""
+Normalized user keys backfilled by ensure_indexes, on mongomock.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("JWT_SECRET", "test-secret")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+from normalize_user_keys import backfill  # noqa: E402
+
+
+def _db():
+    return mongomock_motor.AsyncMongoMockClient()["user_keys_test"]
+
+
+def test_legacy_users_are_normalized():
+    async def run():
+        db = _db()
+        await db.users.insert_one({"email": "Ana@Example.com ", "username": "Ana"})
+        await backfill(db, 500, report=lambda message: None)
+        return await db.users.find_one({})
+
+    user = asyncio.run(run())
+    assert user["email_normalized"] == "ana@example.com"
+    assert user["username_normalized"] == "ana"
+
+
+def test_colliding_user_keeps_the_free_field():
+    async def run():
+        db = _db()
+        await db.users.create_index("email_normalized", unique=True, sparse=True)
+        await db.users.create_index("username_normalized", unique=True, sparse=True)
+        await db.users.insert_one({
+            "email": "ana@example.com", "username": "ana",
+            "email_normalized": "ana@example.com", "username_normalized": "ana"
+        })
+        await db.users.insert_one({"email": "ANA@example.com", "username": "Ana2"})
+        _, conflicts = await backfill(db, 500, report=lambda message: None)
+        return conflicts, await db.users.find_one({"username": "Ana2"})
+
+    conflicts, legacy = asyncio.run(run())
+    assert [user["username"] for user in conflicts] == ["Ana2"]
+    assert "email_normalized" not in legacy
+    assert legacy["username_normalized"] == "ana2"